@@ -0,0 +1,120 @@
+"""
+Measure re-exporting a synthetic timeline with a `TrackCache` against a
+fresh export.
+
+Usage: python benchmarks/bench_cache.py [options]
+       python benchmarks/bench_cache.py --help
+
+Reports the time of a fresh `write_to_string`, of exporting again with a
+warm cache and nothing changed, and of exporting again after trimming a
+single clip. Each export with the cache starts from a cache holding the
+previous export, like an editor re-exporting after every edit would.
+Exits with an error when the single trim export isn't faster than the fresh
+one.
+Pass --json to get the numbers in a form that is easy to compare between
+revisions.
+"""
+
+import argparse
+import json
+import time
+
+import opentimelineio as otio
+
+from otio_mlt_adapter.adapters.mlt_xml import TrackCache, write_to_string
+
+from synthetic import synthetic_timeline
+
+
+def fastest(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def trim(timeline, frames):
+    # Shorten the first clip of the middle track by a number of frames
+    track = timeline.tracks[len(timeline.tracks) // 2]
+    clip = next(
+        item for item in track if isinstance(item, otio.schema.Clip)
+    )
+    source_range = clip.source_range
+    clip.source_range = otio.opentime.TimeRange(
+        source_range.start_time,
+        otio.opentime.RationalTime(
+            source_range.duration.value - frames,
+            source_range.duration.rate
+        )
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--tracks', type=int, default=40)
+    parser.add_argument('--clips', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='number of runs, the fastest is reported'
+    )
+    parser.add_argument('--json', action='store_true')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    timeline = synthetic_timeline(
+        tracks=args.tracks,
+        clips=args.clips,
+        seed=args.seed
+    )
+
+    cache = TrackCache()
+    expected = write_to_string(timeline, cache=cache)
+
+    def unchanged():
+        assert write_to_string(timeline, cache=cache) == expected
+
+    # Alternate between two lengths so every run re-exports a changed track
+    frames = [1]
+
+    def trimmed():
+        trim(timeline, frames[0])
+        frames[0] = -frames[0]
+        write_to_string(timeline, cache=cache)
+
+    report = {
+        'tracks': args.tracks,
+        'clips': args.clips,
+        'fresh': fastest(lambda: write_to_string(timeline), args.repeat),
+        'unchanged': fastest(unchanged, args.repeat),
+        'trimmed': fastest(trimmed, args.repeat)
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+
+    else:
+        print(
+            '{tracks} x {clips}: fresh {fresh:.3f}s, cached unchanged '
+            '{unchanged:.3f}s, cached after one trim {trimmed:.3f}s'.format(
+                **report
+            )
+        )
+
+    if report['trimmed'] >= report['fresh']:
+        raise SystemExit(
+            'Re-exporting a single trim took {:.3f}s, no faster than a fresh '
+            'export in {:.3f}s'.format(report['trimmed'], report['fresh'])
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Measure what importing the adapter adds to the start up of OTIO tools.
+
+Usage: python benchmarks/bench_import.py [options]
+       python benchmarks/bench_import.py --help
+
+OTIO imports every adapter when it discovers plugins, so tools like
+otioconvert pay for the adapter's imports even when it isn't used. Each run
+starts a new interpreter with `-X importtime` that imports opentimelineio
+and then the adapter, and reports the time spent on the adapter and the
+modules it loads beyond those OTIO already did. Byte code is compiled by an
+import before measuring, unless writing byte code is disabled in which case
+compiling dominates the numbers.
+Exits with an error when the fastest run takes longer than --max-ms.
+Pass --json to get the numbers in a form that is easy to compare between
+revisions.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+IMPORT = 'import opentimelineio; import otio_mlt_adapter.adapters.mlt_xml'
+
+
+def measure():
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', IMPORT],
+        stderr=subprocess.STDOUT
+    ).decode('utf-8')
+
+    # Lines are "import time: self | cumulative | name" with nested imports
+    # indented, in the order imports finish
+    modules = []
+    adapter = 0
+    after_otio = False
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        _, cumulative, name = line[len('import time:'):].split('|')
+        top_level = not name.startswith('  ')
+        name = name.strip()
+
+        if after_otio:
+            modules.append(name)
+            if top_level:
+                adapter += int(cumulative)
+
+        elif top_level and name == 'opentimelineio':
+            after_otio = True
+
+    return adapter / 1000., modules
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=10,
+        help='number of runs, the fastest is reported'
+    )
+    parser.add_argument(
+        '--max-ms',
+        type=float,
+        default=10.,
+        help='fail when importing the adapter takes longer'
+    )
+    parser.add_argument('--json', action='store_true')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # Compile byte code outside of the measurement
+    subprocess.check_call([sys.executable, '-c', IMPORT])
+
+    runs = [measure() for _ in range(args.repeat)]
+    timings = sorted(milliseconds for milliseconds, _ in runs)
+    report = {
+        'fastest': timings[0],
+        'median': timings[len(timings) // 2],
+        'modules': runs[0][1],
+        'max': args.max_ms
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+
+    else:
+        print(
+            'adapter import {fastest:.2f}ms (median {median:.2f}ms), '
+            'modules: {names}'.format(
+                names=', '.join(report['modules']),
+                **report
+            )
+        )
+
+    if report['fastest'] > args.max_ms:
+        sys.exit(
+            'Importing the adapter took {:.2f}ms, more than {}ms'.format(
+                report['fastest'],
+                args.max_ms
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Compare resolving the resource property of a producer with `find()` against
+the `ProducerInfo` side-table the adapter keeps per producer.
+
+Usage: python benchmarks/bench_producer_info.py [number of lookups]
+
+Both are looked up once per clip using the producer, so the difference adds
+up with the number of clips in a timeline.
+"""
+
+import sys
+import timeit
+from xml.etree import ElementTree as et
+
+from otio_mlt_adapter.adapters.mlt_xml import ProducerRegistry
+
+
+def producer_element():
+    producer_e = et.Element('producer', id='clip1')
+    for name in ('length', 'eof', 'resource', 'mlt_service'):
+        et.SubElement(producer_e, 'property', name=name).text = name
+
+    return producer_e
+
+
+def measure(label, func, runs):
+    elapsed = min(timeit.repeat(func, number=runs, repeat=5))
+    print('{:<20} {:>8.3f}us per lookup'.format(label, elapsed / runs * 1e6))
+
+
+def main(runs=100000):
+    registry = ProducerRegistry()
+    producer_e = producer_element()
+
+    measure(
+        'find()',
+        lambda: producer_e.find('./property/[@name="resource"]'),
+        runs
+    )
+    measure('ProducerInfo', lambda: registry.info(producer_e).resource, runs)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,67 @@
+"""
+Compare expanding transitions with `otio.algorithms` against the adapter's
+zero-copy walker on a dissolve heavy track.
+
+Usage: python benchmarks/bench_transitions.py [number of clips]
+
+Items cloned by `otio.algorithms` live on the C++ side, so compare the
+process' memory footprint with an external tool if needed.
+"""
+
+import sys
+import time
+
+import opentimelineio as otio
+
+from otio_mlt_adapter.adapters.mlt_xml import expand_transitions
+
+
+def dissolve_track(clip_count):
+    track = otio.schema.Track('dissolves')
+    for index in range(clip_count):
+        if index:
+            track.append(
+                otio.schema.Transition(
+                    name='dissolve',
+                    in_offset=otio.opentime.RationalTime(5, 25),
+                    out_offset=otio.opentime.RationalTime(5, 25)
+                )
+            )
+
+        track.append(
+            otio.schema.Clip(
+                name='clip{}'.format(index),
+                media_reference=otio.schema.ExternalReference(
+                    target_url='/media/clip{}.mov'.format(index)
+                ),
+                source_range=otio.opentime.TimeRange(
+                    otio.opentime.RationalTime(10, 25),
+                    otio.opentime.RationalTime(100, 25)
+                )
+            )
+        )
+
+    return track
+
+
+def measure(label, func, track):
+    # Consume the entries one by one like the adapter does
+    start = time.perf_counter()
+    count = sum(1 for _ in func(track))
+    elapsed = time.perf_counter() - start
+
+    print('{:<40} {:>8.3f}s  ({} entries)'.format(label, elapsed, count))
+
+
+def main(clip_count=10000):
+    track = dissolve_track(clip_count)
+    measure(
+        'track_with_expanded_transitions',
+        otio.algorithms.track_with_expanded_transitions,
+        track
+    )
+    measure('expand_transitions', expand_transitions, track)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
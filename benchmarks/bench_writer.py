@@ -0,0 +1,110 @@
+"""
+Measure `MLTAdapter.create_mlt` on synthetic timelines of configurable size.
+
+Usage: python benchmarks/bench_writer.py [options]
+       python benchmarks/bench_writer.py --help
+
+Reports wall time, peak memory and the time spent in each phase of the
+export: preparing tracks, assembling the timeline and serializing the XML,
+as recorded by the adapter's "profile" argument. Memory is measured with
+`tracemalloc` and only covers Python allocations, objects living on the OTIO
+C++ side are not included. Profiling slows the export down, so compare wall
+times between runs of this script only.
+Pass --json to get the numbers in a form that is easy to compare between
+revisions.
+"""
+
+import argparse
+import json
+import time
+
+from otio_mlt_adapter.adapters.mlt_xml import MLTAdapter
+
+from synthetic import synthetic_timeline
+
+
+def run(timeline, repeat, **profile_data):
+    results = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+
+        adapter = MLTAdapter(timeline, profile=True, **profile_data)
+        mlt_string = adapter.create_mlt()
+
+        wall = time.perf_counter() - start
+        result = adapter.stats.as_dict()
+        result.update(wall=wall, bytes=len(mlt_string))
+        results.append(result)
+
+    # The fastest run is the least disturbed by the rest of the system
+    return min(results, key=lambda result: result['wall'])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--tracks', type=int, default=10)
+    parser.add_argument('--clips', type=int, default=1000)
+    parser.add_argument('--gaps', type=float, default=0.1)
+    parser.add_argument('--transitions', type=float, default=0.2)
+    parser.add_argument('--sequences', type=float, default=0.1)
+    parser.add_argument('--timewarps', type=float, default=0.05)
+    parser.add_argument('--nested', type=float, default=0.01)
+    parser.add_argument('--media', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='number of runs, the fastest is reported'
+    )
+    parser.add_argument(
+        '--scale',
+        type=int,
+        nargs='+',
+        help='run once per number of clips per track instead of --clips'
+    )
+    parser.add_argument('--json', action='store_true')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    reports = []
+    for clips in args.scale or [args.clips]:
+        timeline = synthetic_timeline(
+            tracks=args.tracks,
+            clips=clips,
+            gaps=args.gaps,
+            transitions=args.transitions,
+            sequences=args.sequences,
+            timewarps=args.timewarps,
+            nested=args.nested,
+            media=args.media,
+            seed=args.seed
+        )
+        result = run(timeline, args.repeat, workers=args.workers)
+        result.update(tracks=args.tracks, clips=clips)
+        reports.append(result)
+
+        if not args.json:
+            print(
+                '{tracks:>4} x {clips:<7} {wall:>8.3f}s '
+                '{peak:>8.1f}MiB  {spent}  ({producers} producers)'.format(
+                    peak=result['peak_memory'] / 1024. / 1024.,
+                    spent='  '.join(
+                        '{}: {:.3f}s'.format(phase, seconds)
+                        for phase, seconds in sorted(result['phases'].items())
+                    ),
+                    **result
+                )
+            )
+
+    if args.json:
+        print(json.dumps(reports, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Synthetic timelines for benchmarking the MLT writer.
+
+Every track holds a number of items where each item is, in order of
+precedence, a nested stack, a gap or a clip according to the given ratios.
+Clips reference a limited pool of media files so producers get
+de-duplicated, and may use image sequences and time warps. Transitions are
+placed between neighbouring items according to their ratio.
+"""
+
+import random
+
+import opentimelineio as otio
+
+RATE = 25
+
+
+def _range(start, duration):
+    return otio.opentime.TimeRange(
+        otio.opentime.RationalTime(start, RATE),
+        otio.opentime.RationalTime(duration, RATE)
+    )
+
+
+def _media_reference(index, sequence):
+    if sequence and hasattr(otio.schema, 'ImageSequenceReference'):
+        return otio.schema.ImageSequenceReference(
+            target_url_base='/media/sequence{}/'.format(index),
+            name_prefix='frame.',
+            name_suffix='.exr',
+            start_frame=1001,
+            rate=RATE,
+            frame_zero_padding=4,
+            available_range=_range(1001, 1000)
+        )
+
+    return otio.schema.ExternalReference(
+        target_url='/media/clip{}.mov'.format(index),
+        available_range=_range(0, 1000)
+    )
+
+
+def _clip(rnd, name, media, sequences, timewarps):
+    index = rnd.randrange(media)
+    clip = otio.schema.Clip(
+        name=name,
+        media_reference=_media_reference(index, rnd.random() < sequences),
+        source_range=_range(rnd.randrange(0, 500), rnd.randrange(20, 200))
+    )
+
+    if rnd.random() < timewarps:
+        if rnd.random() < 0.5:
+            clip.effects.append(
+                otio.schema.LinearTimeWarp(time_scalar=rnd.choice([0.5, 2.]))
+            )
+
+        else:
+            clip.effects.append(otio.schema.FreezeFrame())
+
+    return clip
+
+
+def _nested_stack(rnd, name, media, sequences):
+    stack = otio.schema.Stack(name=name)
+    for index in range(2):
+        track = otio.schema.Track('{}_track{}'.format(name, index))
+        for clip_index in range(3):
+            track.append(
+                _clip(
+                    rnd,
+                    '{}_clip{}'.format(track.name, clip_index),
+                    media,
+                    sequences,
+                    0
+                )
+            )
+
+        stack.append(track)
+
+    return stack
+
+
+def synthetic_timeline(
+        tracks=10,
+        clips=100,
+        gaps=0.1,
+        transitions=0.2,
+        sequences=0.1,
+        timewarps=0.05,
+        nested=0.01,
+        media=50,
+        seed=0):
+    """
+    Create a synthetic timeline
+
+    :param tracks: number of video tracks
+    :param clips: number of items per track
+    :param gaps: ratio of items being gaps
+    :param transitions: ratio of neighbouring items joined by a transition
+    :param sequences: ratio of clips referencing image sequences
+    :param timewarps: ratio of clips with a time effect
+    :param nested: ratio of items being nested stacks
+    :param media: number of unique media files to pick from
+    :param seed: random seed, the same arguments give the same timeline
+    :return: timeline
+    :rtype: `otio.schema.Timeline`
+    """
+
+    rnd = random.Random(seed)
+    timeline = otio.schema.Timeline(name='synthetic')
+    timeline.global_start_time = otio.opentime.RationalTime(0, RATE)
+
+    for track_index in range(tracks):
+        track = otio.schema.Track('track{}'.format(track_index))
+
+        for item_index in range(clips):
+            name = 'track{}_item{}'.format(track_index, item_index)
+            roll = rnd.random()
+            if roll < nested:
+                item = _nested_stack(rnd, name, media, sequences)
+
+            elif roll < nested + gaps:
+                item = otio.schema.Gap(
+                    source_range=_range(0, rnd.randrange(10, 100))
+                )
+
+            else:
+                item = _clip(rnd, name, media, sequences, timewarps)
+
+            # Offsets stay below half of the shortest item
+            if item_index and rnd.random() < transitions:
+                track.append(
+                    otio.schema.Transition(
+                        name='dissolve',
+                        in_offset=otio.opentime.RationalTime(5, RATE),
+                        out_offset=otio.opentime.RationalTime(5, RATE)
+                    )
+                )
+
+            track.append(item)
+
+        timeline.tracks.append(track)
+
+    return timeline
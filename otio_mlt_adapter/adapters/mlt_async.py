@@ -0,0 +1,98 @@
+"""
+asyncio variants of the MLT writer. Requires Python 3.7 or newer.
+
+The export is driven one track at a time through `MLTAdapter.iter_write`
+and control is handed back to the event loop between tracks, so other tasks
+keep running while a large timeline is written. With `offload=True` each
+step runs in the loop's default executor instead, which keeps the event
+loop responsive even when single tracks are expensive to assemble.
+
+The XML is identical to what `write_to_file` produces.
+"""
+
+import asyncio
+import inspect
+
+from .mlt_xml import MLTAdapter
+
+
+async def write_to_stream(input_otio, stream, offload=False, **profile_data):
+    """
+    Write MLT XML to an asynchronous stream, one track at a time.
+
+    `stream` may be an `asyncio.StreamWriter` or any object with a `write`
+    method that is either a regular function or a coroutine function, like
+    the file objects of aiofiles. If it has a `drain` coroutine it is
+    awaited after each write.
+
+    :param input_otio: OTIO object to convert
+    :param stream: stream to write text to
+    :param offload: run the export steps in the loop's default executor
+    :param profile_data: same arguments as `write_to_string`
+    """
+
+    loop = asyncio.get_running_loop()
+    chunks = []
+    steps = MLTAdapter(input_otio, **profile_data).iter_write(_Chunks(chunks))
+
+    while True:
+        if offload:
+            done = await loop.run_in_executor(None, _step, steps)
+
+        else:
+            done = _step(steps)
+
+        if chunks:
+            await _write(stream, ''.join(chunks))
+            del chunks[:]
+
+        if done:
+            break
+
+        # Let other tasks run between tracks
+        await asyncio.sleep(0)
+
+
+async def write_to_string_async(input_otio, offload=False, **profile_data):
+    """
+    Collect what `write_to_stream` writes into a string. The layout is the
+    one of `write_to_file`, with producers placed in between the playlists
+    using them, rather than the one of `write_to_string`, with all
+    producers at the top.
+
+    :param input_otio: OTIO object to convert
+    :param offload: run the export steps in the loop's default executor
+    :param profile_data: same arguments as `write_to_string`
+    :return: MLT XML
+    :rtype: `str`
+    """
+
+    chunks = []
+    await write_to_stream(
+        input_otio,
+        _Chunks(chunks),
+        offload=offload,
+        **profile_data
+    )
+
+    return ''.join(chunks)
+
+
+class _Chunks(object):
+    def __init__(self, chunks):
+        self.write = chunks.append
+
+
+def _step(steps):
+    # Advance the export by one step, returns True once it is done
+    return next(steps, StopIteration) is StopIteration
+
+
+async def _write(stream, data):
+    result = stream.write(data)
+    if inspect.isawaitable(result):
+        await result
+
+    drain = getattr(stream, 'drain', None)
+    if drain is not None:
+        await drain()
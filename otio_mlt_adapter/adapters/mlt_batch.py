@@ -0,0 +1,256 @@
+"""
+Convert many timelines to .mlt files, optionally in a process pool.
+
+Timelines converted in the same process share a `ProducerCache`, so media
+used by several timelines is only resolved and rendered once. Used by the
+otio-mlt command line tool.
+"""
+
+import os
+import opentimelineio as otio
+
+from .mlt_xml import ProducerCache, _check_workers, write_to_file
+
+try:
+    from time import perf_counter as default_timer
+
+except ImportError:
+    # Python 2
+    from timeit import default_timer
+
+
+# State of a worker process, see `iter_write_many`
+_worker_state = {}
+
+
+def write_many(
+        timelines,
+        out_dir,
+        workers=1,
+        max_producers=4096,
+        **profile_data):
+    """
+    Convert many timelines to .mlt files sharing a `ProducerCache`, so media
+    used by several timelines is only resolved and rendered once.
+
+    :param timelines: timelines or paths of files OTIO can read
+    :param out_dir: directory to write .mlt files to
+    :param workers: number of processes converting timelines, each with a
+        cache of its own. More than one requires Python 3.7 or newer
+    :param max_producers: size of each producer cache
+    :param profile_data: See `write_to_string`
+    :return: paths of written files in order of `timelines`. Files are
+        named after source files or timelines
+    :rtype: `list`
+    """
+
+    workers = _check_workers(workers)
+    timelines = list(timelines)
+    filenames = _batch_filenames(timelines)
+
+    if workers <= 1 or len(timelines) <= 1:
+        producer_cache = ProducerCache(max_producers)
+        return [
+            _write_batch_file(
+                timeline,
+                out_dir,
+                filename,
+                producer_cache,
+                profile_data
+            )
+            for timeline, filename in zip(timelines, filenames)
+        ]
+
+    with _batch_executor(
+            out_dir,
+            workers,
+            max_producers,
+            profile_data) as executor:
+        futures = [
+            executor.submit(
+                _write_batch_job,
+                filename,
+                *_batch_source(timeline)
+            )
+            for timeline, filename in zip(timelines, filenames)
+        ]
+
+        return [future.result() for future in futures]
+
+
+class BatchResult(object):
+    """
+    Outcome of converting a timeline with `iter_write_many`
+    """
+
+    __slots__ = ('index', 'source', 'filepath', 'seconds', 'error')
+
+    def __init__(self, index, source, filepath, seconds, error):
+        self.index = index
+        self.source = source
+        self.filepath = filepath
+        self.seconds = seconds
+        self.error = error
+
+
+def iter_write_many(
+        timelines,
+        out_dir,
+        workers=1,
+        max_producers=4096,
+        **profile_data):
+    """
+    Same as `write_many`, but yields a `BatchResult` per timeline as soon as
+    it is converted, in order of completion. A failing conversion is
+    reported in its result instead of stopping the others.
+
+    :param timelines: timelines or paths of files OTIO can read
+    :param out_dir: directory to write .mlt files to
+    :param workers: number of processes converting timelines, each with a
+        cache of its own. More than one requires Python 3.7 or newer
+    :param max_producers: size of each producer cache
+    :param profile_data: See `write_to_string`
+    :return: generator of `BatchResult`
+    """
+
+    workers = _check_workers(workers)
+    timelines = list(timelines)
+    filenames = _batch_filenames(timelines)
+
+    if workers <= 1 or len(timelines) <= 1:
+        producer_cache = ProducerCache(max_producers)
+        for index, timeline in enumerate(timelines):
+            outcome = _timed_call(
+                _write_batch_file,
+                timeline,
+                out_dir,
+                filenames[index],
+                producer_cache,
+                profile_data
+            )
+            yield BatchResult(index, timeline, *outcome)
+
+        return
+
+    from concurrent.futures import as_completed
+
+    with _batch_executor(
+            out_dir,
+            workers,
+            max_producers,
+            profile_data) as executor:
+        futures = dict(
+            (
+                executor.submit(
+                    _timed_batch_job,
+                    filenames[index],
+                    *_batch_source(timeline)
+                ),
+                index
+            )
+            for index, timeline in enumerate(timelines)
+        )
+        for future in as_completed(futures):
+            index = futures[future]
+            yield BatchResult(index, timelines[index], *future.result())
+
+
+def _batch_executor(out_dir, workers, max_producers, profile_data):
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Workers only hold what all jobs share, timelines come with each job
+    return ProcessPoolExecutor(
+        workers,
+        initializer=_init_batch_worker,
+        initargs=(out_dir, max_producers, profile_data)
+    )
+
+
+def _batch_source(timeline):
+    # Jobs get a copy of their timeline, whatever the start method. Paths
+    # are read by the workers themselves.
+    if isinstance(timeline, otio.schema.Timeline):
+        return otio.adapters.write_to_string(timeline, 'otio_json'), True
+
+    return timeline, False
+
+
+def _timed_call(function, *args):
+    # Returns the result, seconds spent and error message of a call
+    start = default_timer()
+    try:
+        result = function(*args)
+
+    except Exception as error:
+        message = '{}: {}'.format(type(error).__name__, error)
+        return None, default_timer() - start, message
+
+    return result, default_timer() - start, None
+
+
+def _batch_filenames(timelines):
+    filenames = []
+    taken = set()
+    for index, timeline in enumerate(timelines):
+        if isinstance(timeline, otio.schema.Timeline):
+            name = timeline.name or 'timeline{}'.format(index)
+
+        else:
+            name = os.path.splitext(os.path.basename(timeline))[0]
+
+        # Keep timelines of the same name apart
+        filename = name + '.mlt'
+        suffix = index
+        while filename in taken:
+            filename = '{}_{}.mlt'.format(name, suffix)
+            suffix += 1
+
+        taken.add(filename)
+        filenames.append(filename)
+
+    return filenames
+
+
+def _write_batch_file(
+        timeline,
+        out_dir,
+        filename,
+        producer_cache,
+        profile_data):
+    if not isinstance(timeline, otio.schema.Timeline):
+        timeline = otio.adapters.read_from_file(timeline)
+
+    filepath = os.path.join(out_dir, filename)
+    write_to_file(
+        timeline,
+        filepath,
+        producer_cache=producer_cache,
+        **profile_data
+    )
+
+    return filepath
+
+
+def _init_batch_worker(out_dir, max_producers, profile_data):
+    _worker_state.update(
+        out_dir=out_dir,
+        producer_cache=ProducerCache(max_producers),
+        profile_data=profile_data
+    )
+
+
+def _write_batch_job(filename, timeline, serialized):
+    if serialized:
+        timeline = otio.adapters.read_from_string(timeline, 'otio_json')
+
+    return _write_batch_file(
+        timeline,
+        _worker_state['out_dir'],
+        filename,
+        _worker_state['producer_cache'],
+        _worker_state['profile_data']
+    )
+
+
+def _timed_batch_job(filename, timeline, serialized):
+    return _timed_call(_write_batch_job, filename, timeline, serialized)
@@ -0,0 +1,190 @@
+"""
+Probing of media files, see the "prober" and "probe_cache" arguments of
+`write_to_string` in the mlt_xml adapter.
+"""
+
+import io
+import json
+import os
+import subprocess
+from collections import OrderedDict
+from fractions import Fraction
+
+from .mlt_xml import _open_utf8
+
+
+class ProbeCache(object):
+    """
+    Producer properties of probed media. Entries are keyed on the path of
+    a file and only used while its modification time and size are
+    unchanged. Pass a `path` to keep the cache in a JSON file between
+    sessions. It is loaded when created and written by `save`. Exports save
+    it automatically once done.
+
+    :param path: path of JSON file or `None` to keep the cache in memory
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._changed = False
+
+        if path is not None and os.path.exists(path):
+            with io.open(path, encoding='utf-8') as fileobj:
+                self._entries = json.load(fileobj)
+
+    def probe(self, filepath, prober):
+        """
+        :param filepath: path of media file
+        :param prober: callable returning a mapping of producer properties
+            for `filepath` or `None` if the file can't be probed
+        :return: list of (name, value) properties or `None` if `filepath`
+            is missing or can't be probed
+        """
+
+        try:
+            stat = os.stat(filepath)
+
+        except OSError:
+            return None
+
+        stamp = [stat.st_mtime, stat.st_size]
+        entry = self._entries.get(filepath)
+        if entry is not None and entry[0] == stamp:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        properties = prober(filepath)
+        if properties is None:
+            return None
+
+        properties = [
+            [str(name), str(value)] for name, value in properties.items()
+        ]
+        self._entries[filepath] = [stamp, properties]
+        self._changed = True
+
+        return properties
+
+    def save(self):
+        """
+        Write the cache to `self.path` if anything was probed since it was
+        loaded
+        """
+
+        if self.path is None or not self._changed:
+            return
+
+        # Replace the file in one go so readers never see half of it
+        temp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        with _open_utf8(temp_path) as fileobj:
+            fileobj.write(json.dumps(self._entries, sort_keys=True))
+
+        _replace_file(temp_path, self.path)
+        self._changed = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __deepcopy__(self, memo):
+        # OTIO deep copies adapter arguments, but the cache is shared state
+        return self
+
+
+def probe_media(filepath):
+    """
+    Default prober of the "prober" adapter argument. Runs `ffprobe` and
+    returns the properties MLT's avformat producer would otherwise probe
+    for when loading the file. The length is a clock time string, which
+    MLT converts to frames of the profile's frame rate.
+
+    :param filepath: path of media file
+    :return: producer properties or `None` if `ffprobe` is missing or fails
+    :rtype: `OrderedDict`
+    """
+
+    try:
+        output = subprocess.check_output(
+            [
+                'ffprobe',
+                '-v', 'error',
+                '-show_format',
+                '-show_streams',
+                '-of', 'json',
+                filepath
+            ]
+        )
+
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    probed = json.loads(output.decode('utf-8'))
+    streams = probed.get('streams', [])
+
+    properties = OrderedDict()
+    duration = probed.get('format', {}).get('duration')
+    if duration:
+        properties['length'] = _clock(float(duration))
+
+    properties['meta.media.nb_streams'] = len(streams)
+
+    indices = {}
+    for index, stream in enumerate(streams):
+        kind = stream.get('codec_type')
+        indices.setdefault(kind, index)
+
+        prefix = 'meta.media.{}.'.format(index)
+        properties[prefix + 'stream.type'] = kind
+        if stream.get('codec_name'):
+            properties[prefix + 'codec.name'] = stream['codec_name']
+
+        if kind == 'video':
+            frame_rate = stream.get('avg_frame_rate')
+            if frame_rate and frame_rate != '0/0':
+                properties[prefix + 'stream.frame_rate'] = float(
+                    Fraction(frame_rate)
+                )
+
+            for key in ('width', 'height', 'pix_fmt'):
+                if key in stream:
+                    properties[prefix + 'codec.' + key] = stream[key]
+
+        elif kind == 'audio':
+            for key in ('sample_rate', 'channels'):
+                if key in stream:
+                    properties[prefix + 'codec.' + key] = stream[key]
+
+    properties['video_index'] = indices.get('video', -1)
+    properties['audio_index'] = indices.get('audio', -1)
+
+    return properties
+
+
+def _clock(seconds):
+    # MLT clock time "HH:MM:SS.mmm"
+    milliseconds = int(round(seconds * 1000))
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    hours, minutes = divmod(minutes, 60)
+
+    return '{:02d}:{:02d}:{:06.3f}'.format(
+        hours,
+        minutes,
+        milliseconds / 1000.
+    )
+
+
+def _replace_file(source, destination):
+    try:
+        replace = os.replace
+
+    except AttributeError:
+        # Python 2, where rename won't overwrite on Windows
+        if os.name == 'nt' and os.path.exists(destination):
+            os.remove(destination)
+
+        replace = os.rename
+
+    replace(source, destination)
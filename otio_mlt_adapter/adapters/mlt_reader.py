@@ -0,0 +1,673 @@
+"""
+Reader of MLT XML, used by `read_from_string` and `read_from_file` of the
+mlt_xml adapter.
+"""
+
+import re
+import opentimelineio as otio
+from xml.etree import ElementTree as et
+
+# Resources of image sequences like "/path/frame.%04d.exr?start_number=1"
+IMAGE_SEQUENCE_PATTERN = re.compile(
+    r'^(?P<base>(?:.*/)?)(?P<prefix>[^/]*?)%0?(?P<padding>\d*)d'
+    r'(?P<suffix>[^?]*)(?:\?(?:start_number|begin)=(?P<start>-?\d+))?$'
+)
+
+# Transition services making up a dissolve
+DISSOLVE_SERVICES = frozenset(['luma', 'mix'])
+
+
+class ParsedProducer(object):
+    """
+    What the reader keeps of a producer element once it has been parsed
+    and released.
+    """
+
+    __slots__ = ('id', 'in_', 'out_', 'properties')
+
+    def __init__(self, element):
+        self.id = element.attrib.get('id')
+        self.in_ = element.attrib.get('in')
+        self.out_ = element.attrib.get('out')
+        self.properties = dict(
+            (child.attrib.get('name'), child.text or '')
+            for child in element
+            if child.tag == 'property'
+        )
+
+    @property
+    def resource(self):
+        return self.properties.get('resource')
+
+    @property
+    def mlt_service(self):
+        return self.properties.get('mlt_service')
+
+    @property
+    def is_black(self):
+        # Shotcut's background is transparent black written as "0"
+        return (
+            self.mlt_service in ('color', 'colour') and
+            self.resource in (
+                'black',
+                '#000000',
+                '#ff000000',
+                '#00000000',
+                '0'
+            )
+        )
+
+
+class ParsedTractor(object):
+    """
+    Tracks, transitions and filters of a tractor element, referenced by
+    producer id
+    """
+
+    __slots__ = ('id', 'in_', 'out_', 'tracks', 'transitions', 'filters')
+
+    def __init__(self, element):
+        self.id = element.attrib.get('id')
+        self.in_ = element.attrib.get('in')
+        self.out_ = element.attrib.get('out')
+
+        # Tracks are either direct children or wrapped in a multitrack
+        self.tracks = [
+            track_e.attrib
+            for track_e in element.iter('track')
+        ]
+        self.transitions = [
+            dict(
+                (child.attrib.get('name'), child.text or '')
+                for child in transition_e
+                if child.tag == 'property'
+            )
+            for transition_e in element.iter('transition')
+        ]
+
+        # Only filters of the tractor itself, not of its tracks
+        self.filters = [
+            dict(
+                (child.attrib.get('name'), child.text or '')
+                for child in filter_e
+                if child.tag == 'property'
+            )
+            for filter_e in element.findall('filter')
+        ]
+
+    @property
+    def is_transition(self):
+        # Shotcut crossfades video and audio with a luma and a mix
+        # transition in the same tractor
+        return len(self.tracks) == 2 and (
+            len(self.transitions) == 1 or
+            len(self.transitions) > 1 and
+            self.services <= DISSOLVE_SERVICES
+        )
+
+    @property
+    def services(self):
+        return set(
+            transition.get('mlt_service') for transition in self.transitions
+        )
+
+    @property
+    def is_filtered_track(self):
+        # A single track with effects, see `MLTAdapter.assemble_track`
+        return (
+            len(self.tracks) == 1 and
+            not self.transitions and
+            len(self.filters) > 0
+        )
+
+
+def _parse_frames(value, rate):
+    # MLT accepts frames as well as clock and SMPTE time strings
+    if ':' not in value and ';' not in value:
+        return float(value)
+
+    parts = value.replace(';', ':').split(':')
+    if '.' in parts[-1] or len(parts) < 4:
+        seconds = 0.
+        for part in parts:
+            seconds = seconds * 60 + float(part)
+
+        return float(round(seconds * rate))
+
+    hours, minutes, seconds, frames = map(float, parts[-4:])
+    fps = round(rate)
+
+    return ((hours * 60 + minutes) * 60 + seconds) * fps + frames
+
+
+class MLTReader(object):
+    """
+    Build OTIO objects from MLT XML.
+
+    The document is streamed with `iterparse` and each top level element is
+    released once parsed, keeping only what is needed to build the timeline.
+    Playlists may reference playlists defined after them, so OTIO objects
+    are created once the whole document is read, starting from the last
+    tractor which is what melt plays.
+    """
+
+    def __init__(self):
+        self.rate = 25.
+        self.has_profile = False
+        self.producers = {}
+        self.tractors = {}
+        self.main_tractor = None
+
+        # Position in document and entries of playlists per id. The same id
+        # may be defined more than once, see `take_playlist`.
+        self.playlists = {}
+        self._taken = set()
+
+        # Guards against playlists or tractors referencing themselves
+        self._resolving = set()
+
+    def read(self, source):
+        """
+        :param source: path or binary file object of MLT XML
+        :return: timeline
+        :rtype: `otio.schema.Timeline`
+        """
+
+        path = []
+        entries = None
+        position = 0
+        for event, element in et.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                if len(path) == 1 and element.tag == 'playlist':
+                    entries = []
+                    self.playlists.setdefault(
+                        element.attrib.get('id'),
+                        []
+                    ).append((position, entries))
+                    position += 1
+
+                path.append(element)
+                continue
+
+            path.pop()
+            depth = len(path)
+            if depth == 1:
+                self.parse_element(element)
+                path[0].remove(element)
+
+            elif depth == 2 and path[1].tag == 'playlist' and \
+                    element.tag in ('entry', 'blank'):
+                # Keep huge playlists from piling up in memory
+                entries.append((element.tag, dict(element.attrib)))
+                path[1].remove(element)
+
+        return self.create_timeline()
+
+    def parse_element(self, element):
+        """
+        Parse a top level element
+
+        :param element: child of the mlt element
+        """
+
+        if element.tag == 'profile':
+            num = element.attrib.get('frame_rate_num')
+            den = element.attrib.get('frame_rate_den', '1')
+            if num:
+                self.rate = float(num) / float(den)
+                self.has_profile = True
+
+        elif element.tag in ('producer', 'chain'):
+            producer = ParsedProducer(element)
+            self.producers[producer.id] = producer
+
+        elif element.tag == 'tractor':
+            tractor = ParsedTractor(element)
+            self.tractors[tractor.id] = tractor
+            self.main_tractor = tractor
+
+    def create_timeline(self):
+        """
+        :return: timeline of the last tractor in the document
+        :rtype: `otio.schema.Timeline`
+        """
+
+        timeline = otio.schema.Timeline()
+        if self.has_profile:
+            timeline.global_start_time = otio.opentime.RationalTime(
+                0,
+                self.rate
+            )
+
+        if self.main_tractor is not None:
+            self.fill_stack(self.main_tractor, timeline.tracks)
+
+        return timeline
+
+    def time(self, value):
+        return otio.opentime.RationalTime(value, self.rate)
+
+    def time_range(self, in_, out_):
+        in_ = _parse_frames(in_, self.rate)
+        out_ = _parse_frames(out_, self.rate)
+
+        return otio.opentime.TimeRange(
+            self.time(in_),
+            self.time(out_ - in_ + 1)
+        )
+
+    def fill_stack(self, tractor, stack):
+        """
+        Append a track to `stack` per track of `tractor`
+
+        :param tractor: `ParsedTractor` to read tracks from
+        :param stack: OTIO stack
+        """
+
+        for attrib in tractor.tracks:
+            producer_id = attrib.get('producer')
+            if producer_id not in self.playlists:
+                item = self.create_item(attrib)
+                if isinstance(item, otio.schema.Track):
+                    # A track with effects
+                    track = item
+
+                else:
+                    # A single producer as track
+                    track = otio.schema.Track()
+                    track.append(item)
+
+            else:
+                definition = self.take_playlist(producer_id)
+                if self.is_background(definition[1]):
+                    # Solid black filling gaps below the other tracks
+                    continue
+
+                track = self.create_track(producer_id, definition)
+
+            if attrib.get('hide') == 'video':
+                track.kind = otio.schema.TrackKind.Audio
+
+            stack.append(track)
+
+        stack.effects.extend(self.create_effects(tractor))
+
+    def create_effects(self, tractor):
+        """
+        Create an effect per filter of a tractor, the reverse of
+        `MLTAdapter.create_filters`
+
+        :param tractor: `ParsedTractor` with filters
+        :return: effects
+        :rtype: `list`
+        """
+
+        effects = []
+        for properties in tractor.filters:
+            properties = dict(properties)
+            effects.append(
+                otio.schema.Effect(
+                    effect_name=properties.get('mlt_service', ''),
+                    metadata={'mlt': properties}
+                )
+            )
+
+        return effects
+
+    def take_playlist(self, playlist_id, after=-1):
+        """
+        Pick the definition of a referenced playlist. Ids are unique in most
+        documents, but this adapter used to reuse names of tracks as ids and
+        writes nested playlists after the playlists referencing them.
+        The first unreferenced definition following the referencing playlist
+        is preferred, then any unreferenced one and finally the last one.
+
+        :param playlist_id: id of referenced playlist
+        :param after: position of referencing playlist in document
+        :return: position and entries of playlist
+        :rtype: `tuple`
+        """
+
+        definitions = self.playlists[playlist_id]
+        free = [
+            definition
+            for definition in definitions
+            if id(definition) not in self._taken
+        ]
+        following = [
+            definition
+            for definition in free
+            if definition[0] > after
+        ]
+        if following or free:
+            definition = (following or free)[0]
+
+        else:
+            definition = definitions[-1]
+
+        self._taken.add(id(definition))
+
+        return definition
+
+    def is_background(self, entries):
+        # Playlists of black solids only, like the one the writer adds
+        solids = 0
+        for tag, attrib in entries:
+            if tag == 'blank':
+                continue
+
+            producer = self.producers.get(attrib.get('producer'))
+            if producer is None or not producer.is_black:
+                return False
+
+            solids += 1
+
+        return solids > 0
+
+    def create_track(self, playlist_id, definition):
+        """
+        :param playlist_id: id of playlist to convert
+        :param definition: position and entries of the playlist
+        :return: track
+        :rtype: `otio.schema.Track`
+        """
+
+        position, entries = definition
+        self._enter(entries, playlist_id)
+        track = otio.schema.Track(name=playlist_id)
+
+        # Offsets of a transition depend on the item following it
+        pending = None
+
+        for tag, attrib in entries:
+            if tag == 'blank':
+                length = _parse_frames(attrib['length'], self.rate)
+                item = otio.schema.Gap(
+                    source_range=otio.opentime.TimeRange(
+                        duration=self.time(length)
+                    )
+                )
+
+            else:
+                tractor = self.tractors.get(attrib.get('producer'))
+                if tractor is not None and tractor.is_transition:
+                    if pending is not None:
+                        self.resolve_transition(pending, None)
+
+                    pending = self.create_transition(tractor, attrib, track)
+                    continue
+
+                item = self.create_item(attrib, position)
+
+            if pending is not None:
+                self.resolve_transition(pending, item)
+                pending = None
+
+            track.append(item)
+
+        if pending is not None:
+            self.resolve_transition(pending, None)
+
+        self._resolving.discard(id(entries))
+
+        return track
+
+    def create_transition(self, tractor, attrib, track):
+        """
+        Append a transition for a transition tractor to `track`. The tractor
+        covers both offsets, so the neighbouring items are extended by them
+        once the item following the transition is known.
+
+        :param tractor: `ParsedTractor` mixing two tracks
+        :param attrib: attributes of entry referencing `tractor`
+        :param track: track to append transition to
+        :return: pending transition for `resolve_transition`
+        """
+
+        in_ = attrib.get('in', tractor.in_)
+        out_ = attrib.get('out', tractor.out_)
+        duration = 0.
+        if in_ is not None and out_ is not None:
+            duration = self.time_range(in_, out_).duration.value
+
+        services = tractor.services
+        transition_type = otio.schema.TransitionTypes.Custom
+        if services <= DISSOLVE_SERVICES:
+            transition_type = otio.schema.TransitionTypes.SMPTE_Dissolve
+
+        transition = otio.schema.Transition(
+            name=tractor.id,
+            transition_type=transition_type
+        )
+
+        pre = None
+        if len(track) and not isinstance(track[-1], otio.schema.Transition):
+            pre = track[-1]
+
+        track.append(transition)
+
+        # Mixing audio alone makes an audio track
+        if services == set(['mix']):
+            track.kind = otio.schema.TrackKind.Audio
+
+        return transition, pre, duration, tractor.tracks[1]
+
+    def resolve_transition(self, pending, post):
+        """
+        Set offsets of a transition and extend its neighbours by them
+
+        :param pending: result of `create_transition`
+        :param post: item following the transition or `None`
+        """
+
+        transition, pre, duration, track_b = pending
+
+        # The following clip starts out_offset frames into the mixed media.
+        # Files from this adapter and Shotcut mix media outside the clips on
+        # both sides, so only the total duration survives and all of it ends
+        # up as out_offset. Without a clip to compare with, split evenly.
+        out_offset = duration / 2.
+        producer = self.producers.get(track_b.get('producer'))
+        mixes_clip = (
+            isinstance(post, otio.schema.Clip) and
+            post.source_range is not None and
+            producer is not None and
+            not producer.is_black and
+            track_b.get('in') is not None
+        )
+        if mixes_clip:
+            out_offset = min(
+                max(
+                    post.source_range.start_time.value -
+                    _parse_frames(track_b['in'], self.rate),
+                    0.
+                ),
+                duration
+            )
+
+        in_offset = duration - out_offset
+        transition.in_offset = self.time(in_offset)
+        transition.out_offset = self.time(out_offset)
+
+        _extend_item(pre, 0, in_offset)
+        _extend_item(post, out_offset, out_offset)
+
+    def create_item(self, attrib, position=-1):
+        """
+        :param attrib: attributes of an entry or track element
+        :param position: position of playlist holding the entry
+        :return: OTIO item for the referenced producer
+        """
+
+        producer_id = attrib.get('producer')
+        in_ = attrib.get('in')
+        out_ = attrib.get('out')
+
+        if producer_id in self.playlists:
+            item = self.create_track(
+                producer_id,
+                self.take_playlist(producer_id, position)
+            )
+
+        elif producer_id in self.tractors:
+            tractor = self.tractors[producer_id]
+            self._enter(tractor, producer_id)
+            track_id = tractor.tracks[0].get('producer') \
+                if tractor.tracks else None
+            if tractor.is_filtered_track and track_id in self.playlists:
+                item = self.create_track(
+                    track_id,
+                    self.take_playlist(track_id, position)
+                )
+                item.effects.extend(self.create_effects(tractor))
+
+            else:
+                item = otio.schema.Stack(name=producer_id)
+                self.fill_stack(tractor, item)
+
+            self._resolving.discard(id(tractor))
+
+        elif producer_id in self.producers:
+            return self.create_clip(self.producers[producer_id], in_, out_)
+
+        else:
+            raise ValueError(
+                'Unknown MLT producer "{}"'.format(producer_id)
+            )
+
+        if in_ is not None and out_ is not None:
+            item.source_range = self.time_range(in_, out_)
+
+        return item
+
+    def create_clip(self, producer, in_=None, out_=None):
+        """
+        :param producer: `ParsedProducer` the clip is based on
+        :param in_: first frame used
+        :param out_: last frame used
+        :return: clip or gap for black solids
+        """
+
+        if in_ is None or out_ is None:
+            in_, out_ = producer.in_, producer.out_
+
+        source_range = None
+        if in_ is not None and out_ is not None:
+            source_range = self.time_range(in_, out_)
+
+        if producer.is_black:
+            return otio.schema.Gap(
+                source_range=otio.opentime.TimeRange(
+                    duration=source_range.duration
+                ) if source_range else None
+            )
+
+        properties = producer.properties
+        name = (
+            properties.get('shotcut:caption') or
+            properties.get('kdenlive:clipname') or
+            producer.id
+        )
+        resource = producer.resource
+        effects = []
+
+        # Time effects are stored as derived producers
+        if producer.mlt_service == 'timewarp' and resource:
+            speed, _, resource = resource.partition(':')
+            effects.append(
+                otio.schema.LinearTimeWarp(time_scalar=float(speed))
+            )
+            name = name.partition(':')[2] or name
+
+        elif producer.mlt_service == 'hold':
+            effects.append(otio.schema.FreezeFrame())
+            name = name.rsplit('_freeze', 1)[0]
+
+        clip = otio.schema.Clip(
+            name=name,
+            media_reference=self.create_media_reference(producer, resource),
+            source_range=source_range
+        )
+        clip.effects.extend(effects)
+
+        return clip
+
+    def create_media_reference(self, producer, resource):
+        """
+        :param producer: `ParsedProducer` to base reference on
+        :param resource: resource of producer without time effects
+        :return: media reference
+        """
+
+        available_range = None
+        if producer.in_ is not None and producer.out_ is not None:
+            available_range = self.time_range(producer.in_, producer.out_)
+
+        elif producer.properties.get('length'):
+            available_range = otio.opentime.TimeRange(
+                duration=self.time(
+                    _parse_frames(producer.properties['length'], self.rate)
+                )
+            )
+
+        # The writer uses the producer id as resource of clips without media
+        if not resource or resource == producer.id:
+            return otio.schema.MissingReference()
+
+        if producer.mlt_service in ('color', 'colour'):
+            return otio.schema.GeneratorReference(
+                generator_kind='SolidColor',
+                parameters={'color': resource},
+                available_range=available_range
+            )
+
+        sequence = IMAGE_SEQUENCE_PATTERN.match(resource)
+        if sequence and hasattr(otio.schema, 'ImageSequenceReference'):
+            return otio.schema.ImageSequenceReference(
+                target_url_base=sequence.group('base'),
+                name_prefix=sequence.group('prefix'),
+                name_suffix=sequence.group('suffix'),
+                start_frame=int(sequence.group('start') or 0),
+                frame_zero_padding=int(sequence.group('padding') or 0),
+                rate=self.rate,
+                available_range=available_range
+            )
+
+        return otio.schema.ExternalReference(
+            target_url=resource,
+            available_range=available_range
+        )
+
+    def _enter(self, parsed, producer_id):
+        if id(parsed) in self._resolving:
+            raise ValueError(
+                'MLT element "{}" references itself'.format(producer_id)
+            )
+
+        self._resolving.add(id(parsed))
+
+
+def _extend_item(item, head, frames):
+    # Give back frames a transition took from an item
+    if frames <= 0 or not isinstance(
+            item,
+            (otio.schema.Clip, otio.schema.Gap)):
+        return
+
+    if isinstance(item, otio.schema.Gap):
+        head = 0
+
+    source_range = item.source_range
+    if source_range is None:
+        return
+
+    item.source_range = otio.opentime.TimeRange(
+        otio.opentime.RationalTime(
+            source_range.start_time.value - head,
+            source_range.start_time.rate
+        ),
+        otio.opentime.RationalTime(
+            source_range.duration.value + frames,
+            source_range.duration.rate
+        )
+    )
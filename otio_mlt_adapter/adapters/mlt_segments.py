@@ -0,0 +1,266 @@
+"""
+Cutting timelines into segments that may be rendered in parallel and
+joined afterwards.
+"""
+
+import json
+import math
+import os
+import opentimelineio as otio
+from bisect import bisect_right
+from collections import OrderedDict
+from copy import deepcopy
+
+from .mlt_batch import write_many
+from .mlt_xml import TrackRanges, _open_utf8, _rescaled, _seconds
+
+
+def split_timeline(timeline, segments):
+    """
+    Cut a timeline into consecutive timelines of about equal duration.
+    Segments end on the nearest cut between items when there is one within
+    a quarter of a segment. They never end inside a transition, including
+    the frames it takes from its neighbours, or inside a nested
+    composition, so those always stay whole in a single segment. Items on
+    either side of a segment's ends are trimmed, only copying the items
+    each segment holds.
+
+    :param timeline: timeline to split
+    :param segments: number of segments, fewer are returned if the timeline
+        can't be cut that many times
+    :return: list of (range, timeline) per segment, ranges are in the
+        frame rate of the timeline
+    :rtype: `list`
+    """
+
+    if not isinstance(timeline, otio.schema.Timeline):
+        raise ValueError(
+            "Only a Timeline can be split into segments. "
+            "Not {}".format(type(timeline))
+        )
+
+    tracks = timeline.tracks
+    ranges = [TrackRanges(track) for track in tracks]
+    durations = [track_ranges.duration for track_ranges in ranges]
+    longest = max(durations, key=_seconds) if durations else (0., 24.)
+
+    rate = longest[1]
+    if timeline.global_start_time is not None:
+        rate = timeline.global_start_time.rate
+
+    total = int(round(_rescaled(longest, rate)[0]))
+    layouts = [_track_layout(track_ranges, rate) for track_ranges in ranges]
+
+    boundaries = _segment_boundaries(layouts, total, max(int(segments), 1))
+    starts = [0] + boundaries
+    ends = boundaries + [total]
+
+    result = []
+    for start, end in zip(starts, ends):
+        segment = otio.schema.Timeline(name=timeline.name)
+        if timeline.global_start_time is not None:
+            segment.global_start_time = (
+                timeline.global_start_time +
+                otio.opentime.RationalTime(start, rate)
+            )
+
+        for track, layout in zip(tracks, layouts):
+            segment.tracks.append(
+                _trimmed_track(track, layout, start, end, rate)
+            )
+
+        result.append(
+            (
+                otio.opentime.TimeRange(
+                    otio.opentime.RationalTime(start, rate),
+                    otio.opentime.RationalTime(end - start, rate)
+                ),
+                segment
+            )
+        )
+
+    return result
+
+
+def _track_layout(track_ranges, rate):
+    # Position of every item in frames of `rate` as (item, start, end)
+    # where transitions span the frames they mix
+    layout = []
+    position = 0.
+    for index, item in enumerate(track_ranges.items):
+        if isinstance(item, otio.schema.Transition):
+            in_offset = _rescaled(track_ranges.start(index), rate)[0]
+            out_offset = _rescaled(track_ranges.duration_at(index), rate)[0]
+
+            # A transition at the start of a track extends it
+            if not index:
+                position += in_offset
+
+            layout.append((item, position - in_offset, position + out_offset))
+            continue
+
+        duration = _rescaled(track_ranges.duration_at(index), rate)[0]
+        layout.append((item, position, position + duration))
+        position += duration
+
+    return layout
+
+
+def _segment_boundaries(layouts, total, segments):
+    cuts = set()
+    blocked = []
+    for layout in layouts:
+        for item, start, end in layout:
+            if isinstance(item, otio.schema.Transition):
+                # Cutting on either end would leave an empty neighbour
+                blocked.append((int(math.ceil(start)), int(end)))
+                continue
+
+            cuts.update((int(round(start)), int(round(end))))
+            if isinstance(item, (otio.schema.Track, otio.schema.Stack)):
+                blocked.append(
+                    (int(start) + 1, int(math.ceil(end)) - 1)
+                )
+
+    # Merge blocked frame ranges so each frame is looked up once
+    merged = []
+    for low, high in sorted(blocked):
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], high)
+
+        elif low <= high:
+            merged.append([low, high])
+
+    lows = [low for low, _ in merged]
+
+    def allowed(frame):
+        index = bisect_right(lows, frame) - 1
+        return index < 0 or merged[index][1] < frame
+
+    def next_allowed(frame):
+        index = bisect_right(lows, frame) - 1
+        if index < 0 or merged[index][1] < frame:
+            return frame
+
+        return merged[index][1] + 1
+
+    cuts = sorted(cut for cut in cuts if 0 < cut < total and allowed(cut))
+    length = float(total) / segments
+
+    boundaries = []
+    for index in range(1, segments):
+        ideal = int(round(index * length))
+        previous = boundaries[-1] if boundaries else 0
+
+        # Prefer the closest cut between items
+        position = bisect_right(cuts, ideal)
+        nearby = [
+            cut for cut in cuts[max(position - 1, 0):position + 1]
+            if abs(cut - ideal) <= length / 4 and cut > previous
+        ]
+        if nearby:
+            boundary = min(nearby, key=lambda cut: abs(cut - ideal))
+
+        else:
+            boundary = next_allowed(max(ideal, previous + 1))
+
+        if boundary < total:
+            boundaries.append(boundary)
+
+    return boundaries
+
+
+def _trimmed_track(track, layout, start, end, rate):
+    segment_track = otio.schema.Track(
+        name=track.name,
+        kind=track.kind,
+        metadata=deepcopy(track.metadata)
+    )
+    segment_track.effects.extend(effect.clone() for effect in track.effects)
+
+    for item, item_start, item_end in layout:
+        if isinstance(item, otio.schema.Transition):
+            # Transitions are never cut, so they belong where they are
+            if start <= item_start and item_end <= end:
+                segment_track.append(item.clone())
+
+            continue
+
+        if item_end <= start or end <= item_start:
+            continue
+
+        head = max(start - item_start, 0)
+        tail = max(item_end - end, 0)
+
+        item = item.clone()
+        if head or tail:
+            trimmed_range = item.trimmed_range()
+            item_rate = trimmed_range.duration.rate
+            scale = item_rate / rate
+            item.source_range = otio.opentime.TimeRange(
+                trimmed_range.start_time +
+                otio.opentime.RationalTime(head * scale, item_rate),
+                otio.opentime.RationalTime(
+                    trimmed_range.duration.value - (head + tail) * scale,
+                    item_rate
+                )
+            )
+
+        segment_track.append(item)
+
+    return segment_track
+
+
+def write_segments(
+        input_otio,
+        out_dir,
+        segments,
+        workers=1,
+        **profile_data):
+    """
+    Split a timeline with `split_timeline` and write a self-contained .mlt
+    file per segment, each with its own producers and background, along
+    with a JSON manifest listing the segments in order. Segments may then be
+    rendered in parallel and the renders joined.
+
+    :param input_otio: timeline to split
+    :param out_dir: directory to write files to
+    :param segments: number of segments
+    :param workers: number of processes writing segments, see
+        `mlt_batch.write_many`
+    :param profile_data: See `write_to_string`
+    :return: path of manifest, named after the timeline like the segments
+    :rtype: `str`
+    """
+
+    name = input_otio.name or 'timeline'
+    parts = split_timeline(input_otio, segments)
+    for index, (_, segment) in enumerate(parts):
+        segment.name = '{}_{:03d}'.format(name, index)
+
+    filepaths = write_many(
+        [segment for _, segment in parts],
+        out_dir,
+        workers=workers,
+        **profile_data
+    )
+
+    manifest = OrderedDict()
+    manifest['timeline'] = name
+    manifest['rate'] = parts[0][0].duration.rate if parts else None
+    manifest['segments'] = [
+        OrderedDict(
+            [
+                ('file', os.path.basename(filepath)),
+                ('start', segment_range.start_time.value),
+                ('duration', segment_range.duration.value)
+            ]
+        )
+        for filepath, (segment_range, _) in zip(filepaths, parts)
+    ]
+
+    manifest_path = os.path.join(out_dir, name + '.json')
+    with _open_utf8(manifest_path) as fileobj:
+        fileobj.write(json.dumps(manifest, indent=2) + '\n')
+
+    return manifest_path
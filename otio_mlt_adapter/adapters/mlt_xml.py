@@ -1,11 +1,54 @@
 
 """OpenTimelineIO MLT XML adapter for use with melt."""
 
+import hashlib
+import importlib
+import io
+import math
+import sys
 import opentimelineio as otio
-from copy import deepcopy
-from fractions import Fraction
-from xml.dom import minidom
-from xml.etree import ElementTree as et
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# OTIO imports every adapter on plugin discovery. Modules only needed once
+# converting are imported where they are used, see `_LazyModule`.
+
+try:
+    from time import perf_counter as default_timer
+
+except ImportError:
+    # Python 2
+    from timeit import default_timer
+
+try:
+    from urllib.parse import unquote, urlparse
+
+except ImportError:
+    # Python 2
+    from urllib import unquote
+    from urlparse import urlparse
+
+
+class _LazyModule(object):
+    """
+    Stand-in for a module used all over this module, imported on first
+    attribute access. The global holding the stand-in is then replaced by
+    the module itself so later lookups cost nothing extra.
+    """
+
+    def __init__(self, name, alias):
+        self._name = name
+        self._alias = alias
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+
+        return getattr(module, attr)
+
+
+et = _LazyModule('xml.etree.ElementTree', 'et')
 
 SUPPORTED_TIME_EFFECTS = (
     otio.schema.TimeEffect,
@@ -13,47 +56,1760 @@ SUPPORTED_TIME_EFFECTS = (
     otio.schema.FreezeFrame
 )
 
+XML_DECLARATION = '<?xml version="1.0" ?>'
+
+# Process pools with an initializer, used when passing "workers"
+PROCESS_POOLS = sys.version_info >= (3, 7)
+
+# minidom writes attributes sorted by name before Python 3.8 and in the
+# order they were set from then on
+SORT_ATTRIBUTES = sys.version_info < (3, 8)
+
+
+def _check_workers(workers):
+    # Fail before any work is done rather than once a pool is needed
+    workers = int(workers)
+    if workers > 1 and not PROCESS_POOLS:
+        raise ValueError(
+            'Passing "workers" larger than 1 requires Python 3.7 or newer'
+        )
+
+    return workers
+
+
+def _escape(data):
+    # Same escaping minidom applies to both text and attribute values
+    return (
+        data.replace('&', '&amp;')
+        .replace('<', '&lt;')
+        .replace('"', '&quot;')
+        .replace('>', '&gt;')
+    )
+
+
+class _Utf8Writer(object):
+    # Native strings are bytes on Python 2, which a file opened in text mode
+    # refuses. Write UTF-8 to a binary file instead on both.
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+
+    def write(self, data):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+
+        self._fileobj.write(data)
+
+
+@contextmanager
+def _open_utf8(filepath):
+    with open(filepath, 'wb') as fileobj:
+        yield _Utf8Writer(fileobj)
+
+
+class ProducerInfo(object):
+    """
+    Side-table of resolved properties for a producer element so lookups of
+    frequently used properties become attribute reads instead of repeated
+    `find()` calls.
+    """
+
+    __slots__ = ('element', 'resource', 'mlt_service')
+
+    def __init__(self, element):
+        self.element = element
+        self.resource = None
+        self.mlt_service = None
+
+        for child in element:
+            if child.tag != 'property':
+                continue
+
+            name = child.attrib.get('name')
+            if name == 'resource' and self.resource is None:
+                self.resource = child
+
+            elif name == 'mlt_service' and self.mlt_service is None:
+                self.mlt_service = child
+
+
+class ProducerRegistry(object):
+    """
+    Keeps track of producer elements for deduplication and the order in
+    which they should appear in the MLT XML. Producers are stored per
+    `id_key` in separate audio and video namespaces, while the emission order
+    is kept in a list with a set of element ids for constant time lookups.
+    """
+
+    def __init__(self):
+        self.video = {}
+        self.audio = {}
+
+        # Number of lookups answered by an already stored producer
+        self.hits = 0
+
+        self._order = []
+        self._registered = set()
+
+        # Resolved properties per producer element
+        self._info = {}
+
+    def setdefault(self, id_key, producer_e, audio=False):
+        """
+        Get producer stored under `id_key` or store `producer_e` if missing
+
+        :param id_key: unique key for producer
+        :param producer_e: producer element to store
+        :param audio: store in audio namespace
+        :type audio: `bool`
+        :return: stored producer element
+        """
+
+        namespace = self.audio if audio else self.video
+        stored = namespace.setdefault(id_key, producer_e)
+        if stored is not producer_e:
+            self.hits += 1
+
+        return stored
+
+    def get(self, id_key, audio=False):
+        """
+        :param id_key: unique key for producer
+        :param audio: look in audio namespace
+        :type audio: `bool`
+        :return: stored producer element or `None`
+        """
+
+        namespace = self.audio if audio else self.video
+        producer_e = namespace.get(id_key)
+        if producer_e is not None:
+            self.hits += 1
+
+        return producer_e
+
+    def register(self, producer_e, info=None):
+        """
+        Add producer element to emission order unless already present
+
+        :param producer_e: producer element
+        :param info: already resolved `ProducerInfo` for `producer_e`
+        :return: `True` if producer was added
+        :rtype: `bool`
+        """
+
+        if info is not None:
+            self._info[producer_e] = info
+
+        if id(producer_e) in self._registered:
+            return False
+
+        self._registered.add(id(producer_e))
+        self._order.append(producer_e)
+
+        return True
+
+    def info(self, producer_e):
+        """
+        Get resolved properties for a producer element. Properties are
+        resolved once on first access.
+
+        :param producer_e: producer element
+        :return: resolved properties
+        :rtype: `ProducerInfo`
+        """
+
+        info = self._info.get(producer_e)
+        if info is None:
+            info = self._info[producer_e] = ProducerInfo(producer_e)
+
+        return info
+
+    def ordered(self, start=0):
+        """
+        :param start: index of first producer to return
+        :return: list of registered producers in order of registration
+        """
+
+        return self._order[start:]
+
+    def __contains__(self, producer_e):
+        return id(producer_e) in self._registered
+
+    def __iter__(self):
+        return iter(self._order)
+
+    def __len__(self):
+        return len(self._order)
+
+
+class TrimmedItem(object):
+    """
+    Reference to an item in a track along with the in, out and duration
+    values it occupies once neighbouring transitions are taken into account.
+    Stands in for the trimmed copies
+    `otio.algorithms.track_with_expanded_transitions` makes.
+    """
+
+    __slots__ = ('item', 'name', 'in_', 'out_', 'duration')
+
+    def __init__(self, item, name, start, duration):
+        self.item = item
+        self.name = name
+        self.in_ = start[0]
+        self.out_ = _end_time_inclusive(start, duration)[0]
+        self.duration = duration[0]
+
+
+class TrackRanges(object):
+    """
+    Trimmed ranges of every item in a track (or stack) resolved in a single
+    pass. Values and rates are stored in compact arrays so the rest of the
+    adapter works on plain floats instead of crossing into OTIO for every
+    range computation. For transitions `start` holds the `in_offset` and
+    `duration` holds the `out_offset`.
+    """
+
+    __slots__ = (
+        'items',
+        'start_values',
+        'start_rates',
+        'duration_values',
+        'duration_rates',
+        'duration'
+    )
+
+    def __init__(self, composition):
+        self.items = list(composition)
+        self.start_values = array('d')
+        self.start_rates = array('d')
+        self.duration_values = array('d')
+        self.duration_rates = array('d')
+
+        is_stack = isinstance(composition, otio.schema.Stack)
+        total = (0., 1.)
+
+        for item in self.items:
+            if isinstance(item, otio.schema.Transition):
+                start = item.in_offset
+                duration = item.out_offset
+
+            else:
+                trimmed_range = item.trimmed_range()
+                start = trimmed_range.start_time
+                duration = trimmed_range.duration
+
+            self.start_values.append(start.value)
+            self.start_rates.append(start.rate)
+            self.duration_values.append(duration.value)
+            self.duration_rates.append(duration.rate)
+
+            if isinstance(item, otio.schema.Transition):
+                continue
+
+            duration = (duration.value, duration.rate)
+            if not is_stack:
+                total = _add(total, duration)
+
+            elif _seconds(total) < _seconds(duration):
+                total = duration
+
+        # Transitions on either end extend a track
+        if self.items and not is_stack:
+            if isinstance(self.items[0], otio.schema.Transition):
+                total = _add(total, self.start(0))
+
+            if isinstance(self.items[-1], otio.schema.Transition):
+                total = _add(total, self.duration_at(len(self.items) - 1))
+
+        if composition.source_range is not None:
+            duration = composition.source_range.duration
+            total = (duration.value, duration.rate)
+
+        self.duration = total
+
+    def start(self, index):
+        return self.start_values[index], self.start_rates[index]
+
+    def duration_at(self, index):
+        return self.duration_values[index], self.duration_rates[index]
+
+    def __len__(self):
+        return len(self.items)
+
+
+def stack_duration(stack, ranges):
+    """
+    Duration of a stack based on already resolved `TrackRanges` of its
+    children, saving a walk over the whole stack in OTIO.
+
+    :param stack: `otio.schema.Stack`
+    :param ranges: list of `TrackRanges`, or anything else with a duration
+        as value and rate, one per child in stack
+    :return: duration value
+    :rtype: `float`
+    """
+
+    if stack.source_range is not None:
+        return stack.source_range.duration.value
+
+    total = (0., 1.)
+    for track_ranges in ranges:
+        if _seconds(total) < _seconds(track_ranges.duration):
+            total = track_ranges.duration
+
+    return total[0]
+
+
+def expand_transitions(track, ranges=None):
+    """
+    Zero-copy version of `otio.algorithms.track_with_expanded_transitions`.
+    Lazily walks the track yielding a `TrimmedItem` per item and a tuple of
+    `TrimmedItem`s (ClipA_t, Transition, ClipB_t) per transition without
+    cloning any of the items in the track.
+
+    :param track: track to walk
+    :param ranges: precomputed `TrackRanges` of `track`
+    :return: generator of `TrimmedItem` and transition tuples
+    """
+
+    if ranges is None:
+        ranges = TrackRanges(track)
+
+    items = ranges.items
+    last = len(items) - 1
+
+    for index, thing in enumerate(items):
+        prev_thing = items[index - 1] if index else None
+        next_thing = items[index + 1] if index < last else None
+
+        if isinstance(thing, otio.schema.Transition):
+            yield _expand_transition(ranges, index, prev_thing, next_thing)
+            continue
+
+        start = ranges.start(index)
+        duration = ranges.duration_at(index)
+
+        if isinstance(prev_thing, otio.schema.Transition):
+            # out_offset of previous transition
+            out_offset = ranges.duration_at(index - 1)
+            start = _add(start, out_offset)
+            duration = _sub(duration, out_offset)
+
+        if isinstance(next_thing, otio.schema.Transition):
+            # in_offset of next transition
+            duration = _sub(duration, ranges.start(index + 1))
+
+        yield TrimmedItem(thing, thing.name, start, duration)
+
+
+def _expand_transition(ranges, index, pre, post):
+    transition = ranges.items[index]
+    in_offset = ranges.start(index)
+    out_offset = ranges.duration_at(index)
+
+    if isinstance(pre, otio.schema.Transition) or \
+            isinstance(post, otio.schema.Transition):
+        raise otio.exceptions.TransitionFollowingATransitionError(
+            "cannot put two transitions next to each other in a  track: "
+            "{}".format(transition)
+        )
+
+    duration = _add(in_offset, out_offset)
+
+    # Transitions at either end of a track mix with a gap
+    if pre is None:
+        pre = _transition_gap(transition.in_offset)
+        pre_start, pre_duration = (0., in_offset[1]), in_offset
+
+    else:
+        pre_start = ranges.start(index - 1)
+        pre_duration = ranges.duration_at(index - 1)
+
+    if post is None:
+        post = _transition_gap(transition.out_offset)
+        post_start = (0., out_offset[1])
+
+    else:
+        post_start = ranges.start(index + 1)
+
+    end_time = _add(pre_duration, _rescaled(pre_start, pre_duration[1]))
+    pre_item = TrimmedItem(
+        pre,
+        (pre.name or '') + '_transition_pre',
+        _sub(end_time, in_offset),
+        _rescaled(duration, pre_start[1])
+    )
+
+    post_item = TrimmedItem(
+        post,
+        (post.name or '') + '_transition_post',
+        _rescaled(_sub(post_start, in_offset), post_start[1]),
+        _rescaled(duration, post_start[1])
+    )
+
+    return (
+        pre_item,
+        TrimmedItem(transition, transition.name, (0., duration[1]), duration),
+        post_item
+    )
+
+
+def _transition_gap(offset):
+    return otio.schema.Gap(
+        source_range=otio.opentime.TimeRange(
+            otio.opentime.RationalTime(0, offset.rate),
+            offset
+        )
+    )
+
+
+# Plain float versions of the `otio.opentime` arithmetic used above.
+# Times are (value, rate) tuples and results match OTIO's own.
+def _rescaled(time, rate):
+    if time[1] == rate:
+        return time
+
+    return time[0] * rate / time[1], rate
+
+
+def _add(lhs, rhs):
+    if lhs[1] < rhs[1]:
+        return _rescaled(lhs, rhs[1])[0] + rhs[0], rhs[1]
+
+    return _rescaled(rhs, lhs[1])[0] + lhs[0], lhs[1]
+
+
+def _sub(lhs, rhs):
+    if lhs[1] < rhs[1]:
+        return _rescaled(lhs, rhs[1])[0] - rhs[0], rhs[1]
+
+    return lhs[0] - _rescaled(rhs, lhs[1])[0], lhs[1]
+
+
+def _seconds(time):
+    return time[0] / time[1]
+
+
+def _end_time_inclusive(start, duration):
+    rescaled_start = _rescaled(start, duration[1])
+    end_time = _add(duration, rescaled_start)
+
+    if _sub(end_time, rescaled_start)[0] > 1:
+        if duration[0] != math.floor(duration[0]):
+            return float(math.floor(end_time[0])), end_time[1]
+
+        return _sub(end_time, (1., duration[1]))
+
+    return start
+
+
+def _count_transitions(composition):
+    count = 0
+    for item in composition:
+        if isinstance(item, otio.schema.Transition):
+            count += 1
+
+        elif isinstance(item, (otio.schema.Track, otio.schema.Stack)):
+            count += _count_transitions(item)
+
+    return count
+
+
+def _contains_audio(composition):
+    if getattr(composition, 'kind', None) == otio.schema.TrackKind.Audio:
+        return True
+
+    return any(
+        _contains_audio(item) for item in composition
+        if isinstance(item, (otio.schema.Track, otio.schema.Stack))
+    )
+
+
+def _filter_effects(composition):
+    # Time effects can't be applied to whole tracks, and an effect needs a
+    # service to become a filter
+    return [
+        effect for effect in composition.effects
+        if not isinstance(effect, otio.schema.TimeEffect) and
+        _filter_properties(effect).get('mlt_service')
+    ]
+
+
+def _filter_properties(effect):
+    # Effects of other applications, like "Blur", have no MLT counterpart.
+    # Only those naming an MLT service in their metadata become filters.
+    settings = effect.metadata.get('mlt', {})
+    properties = OrderedDict()
+    if settings.get('mlt_service'):
+        properties['mlt_service'] = settings['mlt_service']
+        for name, value in settings.items():
+            if name != 'mlt_service':
+                properties[name] = value
+
+    return properties
+
+
+def _contains_nested(composition):
+    return any(
+        isinstance(item, (otio.schema.Track, otio.schema.Stack))
+        for item in composition
+    )
+
+
+# State of a worker process, see `MLTAdapter.iter_assembled_tracks`
+_worker_state = {}
+
+
+def _init_track_worker(
+        tracks,
+        background_e,
+        image_producer,
+        coalesce,
+        hashed_ids):
+    _worker_state.update(
+        tracks=otio.adapters.read_from_string(tracks, 'otio_json'),
+        background_e=background_e,
+        image_producer=image_producer,
+        coalesce=coalesce,
+        hashed_ids=hashed_ids
+    )
+
+
+def _assemble_track_job(track_index, transition_offset):
+    return assemble_isolated_track(
+        _worker_state['tracks'][track_index],
+        track_index,
+        transition_offset,
+        _worker_state['background_e'],
+        _worker_state['image_producer'],
+        _worker_state['coalesce'],
+        _worker_state['hashed_ids']
+    )
+
+
+def assemble_isolated_track(
+        track,
+        track_index,
+        transition_offset,
+        background_e,
+        image_producer,
+        coalesce=False,
+        hashed_ids=False,
+        ranges=None):
+    """
+    Assemble a single track without any knowledge of the other tracks in
+    a timeline. The result may be merged into an `MLTAdapter` with
+    `MLTAdapter.merge_track`.
+
+    :param track: track to assemble
+    :param track_index: index of track in timeline
+    :param transition_offset: number of transitions in tracks above
+    :param background_e: solid background producer of the timeline
+    :param image_producer: producer used for image sequences
+    :param coalesce: merge runs of blanks and contiguous entries
+    :param hashed_ids: base ids of producers and transitions on content
+    :param ranges: `TrackRanges` of track if already resolved
+    :return: tuple of track element, playlists, transitions and a list of
+        (audio, id_key, producer) for producers in order of appearance
+    """
+
+    mlt_adapter = MLTAdapter(
+        track,
+        image_producer=image_producer,
+        coalesce=coalesce,
+        hashed_ids=hashed_ids
+    )
+    mlt_adapter.transition_count = transition_offset
+
+    # Start out with the same solid background as the main process
+    if background_e is not None:
+        mlt_adapter.producers.setdefault('solid_black', background_e)
+        mlt_adapter.producers.register(background_e)
+
+    parent = et.Element('multitrack')
+    mlt_adapter.assemble_track(track, track_index, parent, ranges)
+
+    keys = {}
+    for audio, namespace in (
+            (False, mlt_adapter.producers.video),
+            (True, mlt_adapter.producers.audio)):
+        for id_key, producer_e in namespace.items():
+            keys[id(producer_e)] = (audio, id_key)
+
+    # The background is always present in the main process
+    producers = [
+        keys[id(producer_e)] + (producer_e,)
+        for producer_e in mlt_adapter.producers
+        if producer_e is not background_e
+    ]
+
+    return (
+        parent[0],
+        mlt_adapter.playlists,
+        mlt_adapter.transitions,
+        producers
+    )
+
+
+def track_fingerprint(composition, outer=True, names=True):
+    """
+    Fingerprint of everything in a track the adapter bases its output on:
+    items, ranges, media references, effects and nested compositions.
+
+    :param composition: track or stack
+    :param outer: include the name and trim of `composition` itself
+    :param names: include names of compositions nested in `composition`
+    :return: hex digest
+    :rtype: `str`
+    """
+
+    # Text goes in a list and numbers in an array, which is far cheaper
+    # than a tuple per item
+    strings = []
+    numbers = array('d')
+    _fingerprint_values(
+        composition,
+        strings.append,
+        numbers.extend,
+        outer,
+        names
+    )
+
+    digest = hashlib.sha1(_array_bytes(numbers))
+    digest.update(repr(strings).encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+# Media reference attributes the adapter reads
+_SEQUENCE_FIELDS = (
+    'target_url_base',
+    'name_prefix',
+    'name_suffix',
+    'start_frame',
+    'frame_zero_padding'
+)
+_REFERENCE_FIELDS = {
+    'ExternalReference': ('target_url',),
+    'ImageSequenceReference': _SEQUENCE_FIELDS,
+    'MissingReference': (),
+    'GeneratorReference': ()
+}
+
+try:
+    _array_bytes = array.tobytes
+
+except AttributeError:
+    # Python 2
+    _array_bytes = array.tostring
+
+
+def _fingerprint_values(composition, add, extend, outer=True, names=True):
+    add(type(composition).__name__)
+    add(getattr(composition, 'kind', None))
+    if outer:
+        add(composition.name if names else None)
+        _fingerprint_range(composition.source_range, add, extend)
+
+    # Effects of tracks and stacks are written as filters
+    for effect in _filter_effects(composition):
+        add(repr(tuple(_filter_properties(effect).items())))
+
+    for item in composition:
+        if isinstance(item, (otio.schema.Track, otio.schema.Stack)):
+            _fingerprint_values(item, add, extend, True, names)
+            add('end')
+            continue
+
+        if isinstance(item, otio.schema.Transition):
+            add('Transition')
+            in_offset = item.in_offset
+            out_offset = item.out_offset
+            extend(
+                (
+                    in_offset.value,
+                    in_offset.rate,
+                    out_offset.value,
+                    out_offset.rate
+                )
+            )
+            continue
+
+        add(type(item).__name__)
+        add(item.name)
+        _fingerprint_range(item.source_range, add, extend)
+
+        media_reference = getattr(item, 'media_reference', None)
+        if media_reference is not None:
+            reference_type = type(media_reference).__name__
+            add(reference_type)
+            add(media_reference.name)
+            _fingerprint_range(media_reference.available_range, add, extend)
+            for field in _REFERENCE_FIELDS.get(
+                    reference_type,
+                    ('target_url',) + _SEQUENCE_FIELDS):
+                add(repr(getattr(media_reference, field, None)))
+
+        # Looping over an empty list of effects costs more than checking
+        effects = item.effects
+        if effects:
+            for effect in effects:
+                add(
+                    repr(
+                        (
+                            type(effect).__name__,
+                            effect.effect_name,
+                            getattr(effect, 'time_scalar', None)
+                        )
+                    )
+                )
+
+
+def _fingerprint_range(time_range, add, extend):
+    # The text tells items with and without a range apart
+    if time_range is None:
+        add(None)
+        return
+
+    start = time_range.start_time
+    duration = time_range.duration
+    extend((start.value, start.rate, duration.value, duration.rate))
+
+
+def _content_id(prefix, *parts):
+    # Short, stable digest of the values an element is built from
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+    return '{}_{}'.format(prefix, digest[:16])
+
+
+class CachedTrack(object):
+    """
+    A track kept by `TrackCache`: the result of `assemble_isolated_track`
+    with playlists and transitions as rendered XML, the rendered XML of its
+    producers by element and the duration of the track as value and rate.
+    """
+
+    __slots__ = ('result', 'rendered', 'duration')
+
+    def __init__(self, result, rendered, duration):
+        self.result = result
+        self.rendered = rendered
+        self.duration = duration
+
+
+class TrackCache(object):
+    """
+    Keeps results of assembled tracks between exports. Pass the same
+    instance as the "cache" argument to consecutive exports and unchanged
+    tracks are merged from the cache, with their playlists, transitions and
+    producers written from previously rendered XML instead of being
+    assembled and serialized again. Tracks containing audio depend on the
+    tracks above them and are always assembled.
+    Elements are kept as assembled and shared by the exports using them,
+    like those of a `ProducerCache`.
+
+    :param max_tracks: number of tracks to keep, least recently used first
+        out
+    """
+
+    def __init__(self, max_tracks=512):
+        self.max_tracks = max_tracks
+        self.hits = 0
+        self.misses = 0
+        self._tracks = OrderedDict()
+
+    def get(self, key):
+        """
+        :param key: key of track
+        :return: `CachedTrack` or `None`
+        """
+
+        cached = self._tracks.get(key)
+        if cached is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._tracks[key] = self._tracks.pop(key)
+
+        return cached
+
+    def store(self, key, result, duration, render):
+        """
+        :param key: key of track
+        :param result: result of `assemble_isolated_track`
+        :param duration: duration of track as value and rate
+        :param render: callable rendering an element to XML
+        :return: `CachedTrack`
+        """
+
+        track_e, playlists, transitions, producers = result
+        cached = CachedTrack(
+            (
+                track_e,
+                [render(playlist_e) for playlist_e in playlists],
+                [render(transition_e) for transition_e in transitions],
+                producers
+            ),
+            dict(
+                (producer_e, render(producer_e))
+                for _, _, producer_e in producers
+            ),
+            duration
+        )
+        self._tracks[key] = cached
+
+        while len(self._tracks) > self.max_tracks:
+            self._tracks.popitem(last=False)
+
+        return cached
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def __deepcopy__(self, memo):
+        # OTIO deep copies adapter arguments, but the cache is shared state
+        return self
+
+
+class TrackPlan(object):
+    """
+    How the tracks of a timeline are assembled, see `MLTAdapter.plan_tracks`.
+
+    `offsets` holds the number of transitions in the tracks above each
+    track, `isolated` the indices of tracks that may be assembled without
+    the others and `keys` their `TrackCache` keys by index when caching.
+    `cached` holds the `CachedTrack` by index of tracks found in the cache.
+    `ranges` holds the `TrackRanges` of each track, or its `CachedTrack` if
+    found in the cache. Both know the duration of a track.
+    """
+
+    __slots__ = ('offsets', 'isolated', 'keys', 'cached', 'ranges')
+
+    def __init__(self, offsets, isolated, keys, cached, ranges):
+        self.offsets = offsets
+        self.isolated = isolated
+        self.keys = keys
+        self.cached = cached
+        self.ranges = ranges
+
+
+class ProducerCache(object):
+    """
+    Producers shared between exports of timelines using the same media.
+    Pass the same instance as the "producer_cache" argument to each export,
+    or use `mlt_batch.write_many`, and producers for media already seen are
+    reused along with their rendered XML instead of being created again.
+    Shared producers are complete once stored and never altered.
+
+    :param max_producers: number of producers to keep, least recently used
+        first out
+    """
+
+    def __init__(self, max_producers=4096):
+        self.max_producers = max_producers
+        self.hits = 0
+        self.misses = 0
+        self._producers = OrderedDict()
+        self._rendered = {}
+
+    def get(self, key):
+        """
+        :param key: everything the producer is based on
+        :return: producer element and its `ProducerInfo` or `None`
+        """
+
+        entry = self._producers.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._producers[key] = self._producers.pop(key)
+
+        return entry
+
+    def store(self, key, producer_e, info):
+        """
+        :param key: everything the producer is based on
+        :param producer_e: complete producer element
+        :param info: `ProducerInfo` of `producer_e`
+        """
+
+        self._producers[key] = (producer_e, info)
+        self._rendered[producer_e] = {}
+
+        while len(self._producers) > self.max_producers:
+            evicted_e, _ = self._producers.popitem(last=False)[1]
+            del self._rendered[evicted_e]
+
+    def render(self, producer_e, pretty, render):
+        """
+        :param producer_e: producer element
+        :param pretty: indented or compact XML
+        :param render: callable rendering `producer_e` when not yet rendered
+        :return: XML of a shared producer or `None` for other producers
+        """
+
+        rendered = self._rendered.get(producer_e)
+        if rendered is None:
+            return None
+
+        if pretty not in rendered:
+            rendered[pretty] = render(producer_e)
+
+        return rendered[pretty]
+
+    def __len__(self):
+        return len(self._producers)
+
+    def __deepcopy__(self, memo):
+        # OTIO deep copies adapter arguments, but the cache is shared state
+        return self
+
+
+def _local_path(resource):
+    # Only local files are probed, urls other than file:// are skipped
+    if resource.startswith('file://'):
+        return unquote(urlparse(resource).path)
+
+    if '://' in resource:
+        return None
+
+    return resource
+
+
+class ExportStats(object):
+    """
+    Statistics of an export, recorded when passing "profile" to the adapter.
+
+    Durations are in seconds. `phases` holds the time spent preparing tracks,
+    assembling the timeline and serializing the XML. `timings` and `calls`
+    hold the accumulated time spent in, and number of calls to, the main
+    methods of each phase. Counts only cover work done in this process, so
+    tracks assembled by workers or merged from a `TrackCache` add their
+    producers and transitions but not their calls.
+    `peak_memory` is the peak of Python allocations in bytes as traced by
+    `tracemalloc` or `None` where unavailable.
+    """
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self.timings = OrderedDict()
+        self.calls = OrderedDict()
+        self.producers = 0
+        self.dedup_hits = 0
+        self.transitions = 0
+        self.effects = 0
+        self.elements = 0
+        self.peak_memory = None
+
+    def as_dict(self):
+        """
+        :return: statistics as plain types, ready for `json.dumps`
+        :rtype: `dict`
+        """
+
+        return {
+            'phases': dict(self.phases),
+            'timings': dict(self.timings),
+            'calls': dict(self.calls),
+            'producers': self.producers,
+            'dedup_hits': self.dedup_hits,
+            'transitions': self.transitions,
+            'effects': self.effects,
+            'elements': self.elements,
+            'peak_memory': self.peak_memory
+        }
+
+    def report(self):
+        """
+        :return: human readable summary
+        :rtype: `str`
+        """
+
+        lines = [
+            '{:<20} {:>10.4f}s'.format(phase, seconds)
+            for phase, seconds in self.phases.items()
+        ]
+        lines.extend(
+            '  {:<18} {:>10.4f}s {:>8} calls'.format(
+                name,
+                seconds,
+                self.calls[name]
+            )
+            for name, seconds in self.timings.items()
+        )
+        lines.append(
+            'producers: {} (dedup hits: {}), transitions: {}, effects: {}, '
+            'elements: {}'.format(
+                self.producers,
+                self.dedup_hits,
+                self.transitions,
+                self.effects,
+                self.elements
+            )
+        )
+        if self.peak_memory is not None:
+            lines.append(
+                'peak memory: {:.1f} MiB'.format(
+                    self.peak_memory / 1024. / 1024.
+                )
+            )
+
+        return '\n'.join(lines)
+
+
+class Entry(object):
+    """
+    Entry of a playlist referencing a producer, a transition tractor or,
+    without in and out, a nested playlist. Values are kept as is and only
+    turned into text when emitted.
+    """
+
+    __slots__ = ('producer', 'in_', 'out_')
+
+    tag = 'entry'
+
+    def __init__(self, producer, in_=None, out_=None):
+        self.producer = producer
+        self.in_ = in_
+        self.out_ = out_
+
+
+class Blank(object):
+    """
+    Empty space of `length` frames in a playlist
+    """
+
+    __slots__ = ('length',)
+
+    tag = 'blank'
+
+    def __init__(self, length):
+        self.length = length
+
+
+class Playlist(object):
+    """
+    Compact stand-in for a playlist element. Holds `Entry` and `Blank`
+    records which take a fraction of the memory of an element with an
+    attribute dictionary each. Written by `XMLEmitter`.
+    """
+
+    __slots__ = ('id', 'entries')
+
+    tag = 'playlist'
+
+    def __init__(self, id_):
+        self.id = id_
+        self.entries = []
+
+    def append(self, entry):
+        self.entries.append(entry)
+
+    def insert(self, index, entry):
+        self.entries.insert(index, entry)
+
+    def coalesce(self):
+        """
+        Merge runs of blanks, and runs of entries where each entry plays on
+        from where the previous one left off in the same producer. Every
+        frame stays in place.
+        """
+
+        entries = []
+        for entry in self.entries:
+            last = entries[-1] if entries else None
+            if last is None or last.tag != entry.tag:
+                entries.append(entry)
+
+            elif entry.tag == 'blank':
+                last.length += entry.length
+
+            # Transition tractors are only referenced once so never merge
+            elif (
+                    entry.in_ is not None and
+                    last.in_ is not None and
+                    entry.producer == last.producer and
+                    last.out_ + 1 == entry.in_):
+                last.out_ = entry.out_
+
+            else:
+                entries.append(entry)
+
+        self.entries = entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class XMLEmitter(object):
+    """
+    Write MLT XML from elements and `Playlist` records in a single pass.
+    Output matches what `minidom`'s `toprettyxml` produces, without the
+    cost of re-parsing the document.
+
+    Records are dispatched on their `tag` to an `emit_<tag>` method, so
+    other back ends may subclass the emitter and replace those.
+    """
+
+    def __init__(self, pretty=True):
+        self.indent = '    ' if pretty else ''
+        self.newline = '\n' if pretty else ''
+
+        # Placeholder elements of already rendered XML
+        self.rendered = {}
+
+        # Number of elements emitted
+        self.elements = 0
+
+    def emit_document(self, nodes, write):
+        """
+        Write the XML declaration and an mlt root element holding `nodes`
+
+        :param nodes: elements and records placed directly under the root
+        :param write: callable receiving chunks of text
+        """
+
+        self.elements += 1
+        write(XML_DECLARATION + self.newline)
+        write('<mlt>' + self.newline)
+        for node in nodes:
+            self.emit(node, write, self.indent)
+
+        write('</mlt>' + self.newline)
+
+    def emit(self, node, write, indent=''):
+        """
+        Write an element or record and its children
+
+        :param node: element or record to write
+        :param write: callable receiving chunks of text
+        :param indent: current indentation
+        """
+
+        if isinstance(node, et.Element):
+            self.emit_element(node, write, indent)
+
+        else:
+            getattr(self, 'emit_' + node.tag)(node, write, indent)
+
+    def emit_element(self, element, write, indent=''):
+        self.elements += 1
+
+        rendered = self.rendered.get(element)
+        if rendered is not None:
+            write(rendered)
+            return
+
+        write(indent + '<' + element.tag)
+        attributes = element.attrib.items()
+        if SORT_ATTRIBUTES:
+            attributes = sorted(attributes)
+
+        for name, value in attributes:
+            write(' {}="{}"'.format(name, _escape(value)))
+
+        children = len(element)
+        if not children and not element.text:
+            write('/>' + self.newline)
+            return
+
+        write('>')
+        if not children:
+            write(_escape(element.text))
+
+        else:
+            write(self.newline)
+            child_indent = indent + self.indent
+            if element.text:
+                write(_escape(child_indent + element.text + self.newline))
+
+            for child in element:
+                self.emit(child, write, child_indent)
+                if child.tail:
+                    write(
+                        _escape(child_indent + child.tail + self.newline)
+                    )
+
+            write(indent)
+
+        write('</{}>'.format(element.tag) + self.newline)
+
+    def emit_playlist(self, playlist, write, indent=''):
+        self.elements += 1 + len(playlist.entries)
+
+        newline = self.newline
+        id_ = _escape(playlist.id)
+        if not playlist.entries:
+            write('{}<playlist id="{}"/>{}'.format(indent, id_, newline))
+            return
+
+        write('{}<playlist id="{}">{}'.format(indent, id_, newline))
+
+        # Attributes are laid out in order of name, which is what minidom
+        # writes on every Python version
+        child_indent = indent + self.indent
+        for entry in playlist.entries:
+            if entry.tag == 'blank':
+                write(
+                    '{}<blank length="{}"/>{}'.format(
+                        child_indent,
+                        entry.length,
+                        newline
+                    )
+                )
+
+            elif entry.in_ is None:
+                write(
+                    '{}<entry producer="{}"/>{}'.format(
+                        child_indent,
+                        _escape(entry.producer),
+                        newline
+                    )
+                )
+
+            else:
+                write(
+                    '{}<entry in="{}" out="{}" producer="{}"/>{}'.format(
+                        child_indent,
+                        entry.in_,
+                        entry.out_,
+                        _escape(entry.producer),
+                        newline
+                    )
+                )
+
+        write(indent + '</playlist>' + newline)
+
+
+# Rates without a whole number of frames that are meant as NTSC style
+# fractions, as numerator and denominator
+KNOWN_RATES = (
+    (24000, 1001),
+    (30000, 1001),
+    (48000, 1001),
+    (60000, 1001),
+    (120000, 1001)
+)
+
+# Shared by all exports, see `rate_fraction` and `profile_attributes`
+_rate_fractions = {}
+_profile_attributes = {}
+
+
+def rate_fraction(rate):
+    """
+    Given a frame rate float, get a frame rate fraction conforming to known
+    good rates where possible. This will do fuzzy matching of 23.98 to
+    24000/1001, for instance. Results are memoized.
+
+    :param rate: frame rate
+    :return: frame rate fraction
+    :rtype: `Fraction`
+    """
+
+    fraction = _rate_fractions.get(rate)
+    if fraction is not None:
+        return fraction
+
+    from fractions import Fraction
+
+    fraction = Fraction(rate)
+
+    # Whole numbers are easy
+    if not (isinstance(rate, int) or rate.is_integer()):
+        for numerator, denominator in KNOWN_RATES:
+            # The tolerance of 0.004 comes from 24000/1001 - 23.98
+            if abs(rate - float(numerator) / denominator) < 0.004:
+                fraction = Fraction(numerator, denominator)
+                break
+
+    _rate_fractions[rate] = fraction
+
+    return fraction
+
+
+def profile_attributes(profile_data, rate=None):
+    """
+    Attributes of a profile element for the profile related adapter
+    arguments and the rate of a timeline's global start time. Values are
+    converted to strings once per combination and shared between exports.
+
+    :param profile_data: dict of profile attributes
+    :param rate: rate of global start time or `None`
+    :return: (name, value) pairs
+    :rtype: `tuple`
+    """
+
+    try:
+        key = (tuple(profile_data.items()), rate)
+        attributes = _profile_attributes.get(key)
+
+    except TypeError:
+        # Unhashable values are converted every time
+        key = attributes = None
+
+    if attributes is not None:
+        return attributes
+
+    resolved = OrderedDict(_stringified(profile_data))
+    if rate is not None:
+        fraction = rate_fraction(rate)
+        resolved['frame_rate_den'] = str(fraction.denominator)
+        resolved['frame_rate_num'] = str(fraction.numerator)
+
+    attributes = tuple(resolved.items())
+    if key is not None:
+        _profile_attributes[key] = attributes
+
+    return attributes
+
+
+def _stringified(source_dict):
+    return [
+        (key, value if isinstance(value, str) else str(value))
+        for key, value in source_dict.items()
+    ]
+
+
+def _tracemalloc():
+    # Only needed when profiling
+    try:
+        import tracemalloc
+
+    except ImportError:
+        # Python 2
+        return None
+
+    return tracemalloc
+
+
+def _as_bool(value):
+    # Adapter arguments passed from the command line arrive as strings
+    if isinstance(value, str):
+        return value.lower() not in ('false', 'no', 'off', '0', '')
+
+    return bool(value)
+
+
+class MLTAdapter(object):
+    def __init__(self, input_otio, **profile_data):
+        self.input_otio = input_otio
+
+        # Check for image producer in adapter args
+        self.image_producer = 'image2'
+        if 'image_producer' in profile_data:
+            self.image_producer = profile_data.pop('image_producer')
+
+        if self.image_producer not in ['image2', 'pixbuf']:
+            raise ValueError(
+                'Image producer must be "image2" or "pixbuf"'
+            )
+
+        # Pretty printing may be skipped for files only read by melt
+        self.pretty = _as_bool(profile_data.pop('pretty', True))
+
+        # Base ids of producers and transitions on their content
+        self.hashed_ids = _as_bool(profile_data.pop('hashed_ids', False))
+        self._hashed_transitions = {}
+
+        # Merge runs of blanks and of entries playing on in the same producer
+        self.coalesce = _as_bool(profile_data.pop('coalesce', False))
+
+        # Build nested tracks and stacks once as tractors shared by all uses
+        self.nested_tractors = _as_bool(
+            profile_data.pop('nested_tractors', False)
+        )
+
+        # Number of processes used to assemble tracks
+        self.workers = _check_workers(profile_data.pop('workers', 1))
+
+        # Results of previous exports
+        self.cache = profile_data.pop('cache', None)
+
+        # Producers shared with other exports
+        self.producer_cache = profile_data.pop('producer_cache', None)
+
+        # Fill in media properties melt would otherwise probe for on load
+        self.prober = profile_data.pop('prober', None)
+        self.probe_cache = profile_data.pop('probe_cache', None)
+        if self.prober is not None or self.probe_cache is not None:
+            from otio_mlt_adapter.adapters.mlt_probe import (
+                ProbeCache,
+                probe_media
+            )
+
+            if self.prober is not None and not callable(self.prober):
+                self.prober = probe_media if _as_bool(self.prober) else None
+
+            if isinstance(self.probe_cache, str):
+                self.probe_cache = ProbeCache(self.probe_cache)
+
+            elif self.probe_cache is None and self.prober is not None:
+                self.probe_cache = ProbeCache()
+
+        # Statistics of the export. A callable receives them when done
+        profile = profile_data.pop('profile', False)
+        self.stats = None
+        self.stats_callback = profile if callable(profile) else None
+        self._phases = []
+        self._tracing = False
+        if profile:
+            self.stats = ExportStats()
+            self._instrument()
+
+        self.profile_data = profile_data
+
+        # Writes the XML
+        self.emitter = XMLEmitter(self.pretty)
+
+        # XML of producers as assembled, to compare them when merging
+        self.assembled_xml = {}
+
+        # Store media references or clips as producers
+        self.producers = ProducerRegistry()
+
+        # Store playlists so they appear in order
+        self.playlists = []
+
+        # Store transitions for indexing
+        self.transitions = []
+        self.transition_count = 0
+
+        # Ids of shared tractors by content of nested compositions, and
+        # their playlists and tractors in the order they are declared
+        self.nested = {}
+        self.nested_elements = []
+
+        # Ids of tractors wrapping tracks with effects in the current track
+        self.wrapper_ids = set()
+
+    def create_mlt(self):
+        self._start_profile()
+
+        with self.phase('prepare'):
+            profile_e = self.create_profile_element()
+            tracks = self.prepare_tracks(profile_e)
+
+        # Main method
+        with self.phase('assemble'):
+            tractor_e = self.assemble_timeline(tracks)
+
+        # Below we add elements in an orderly fashion
+        nodes = [profile_e]
+        self._probe_producers(self.producers)
+        self._use_rendered_producers(self.producers)
+        nodes.extend(self.producers)
+        nodes.extend(self.transitions)
+        nodes.extend(self.nested_elements)
+        nodes.extend(self.playlists)
+        nodes.append(tractor_e)
+
+        # Render the XML
+        with self.phase('serialize'):
+            chunks = []
+            self.emitter.emit_document(nodes, chunks.append)
+
+        self._save_probes()
+        self._finish_profile()
+
+        return ''.join(chunks)
+
+    def write(self, fileobj):
+        """
+        Stream MLT XML to a file object one track at a time.
+
+        Producers, transition tractors and playlists are written as soon as
+        the track they stem from is assembled and then released, so memory
+        use follows the largest track rather than the whole timeline.
+        Producers are therefore interleaved with playlists instead of all
+        being placed at the top like in `create_mlt`.
+
+        :param fileobj: text file object to write to
+        """
+
+        for _ in self.iter_write(fileobj):
+            pass
+
+    def iter_write(self, fileobj):
+        """
+        Same as `write` but as a generator yielding after each step.
+
+        A step is the document header, the background track and then each
+        track of the timeline, so the caller gets control back between
+        tracks. Used by the asyncio API in `mlt_async`.
+
+        :param fileobj: text file object, or anything with a `write` method
+        """
+
+        self._start_profile()
+
+        with self.phase('prepare'):
+            profile_e = self.create_profile_element()
+            tracks = self.prepare_tracks(profile_e)
+
+        fileobj.write(XML_DECLARATION + self.newline)
+        fileobj.write('<mlt>' + self.newline)
+        self._write_element(fileobj, profile_e)
+        yield
+
+        with self.phase('assemble'):
+            tractor_e, multitrack_e = self.create_main_tractor(tracks)
+
+            # Keep track of what has been written so far
+            written = {'producers': 0, 'transitions': 0}
+
+            plan = self.plan_tracks(tracks)
+            self.create_background_track(tracks, multitrack_e, plan.ranges)
+            self._flush(fileobj, written)
+
+        yield
+
+        assembled = self.iter_assembled_tracks(tracks, multitrack_e, plan)
+        while True:
+            # Keep the phase timer from running while suspended
+            with self.phase('assemble'):
+                if next(assembled, StopIteration) is StopIteration:
+                    break
+
+                self._flush(fileobj, written)
+
+            yield
+
+        with self.phase('serialize'):
+            self._write_element(fileobj, tractor_e)
+            fileobj.write('</mlt>' + self.newline)
+
+        self._save_probes()
+        self._finish_profile()
+
+    def _flush(self, fileobj, written):
+        with self.phase('serialize'):
+            self._flush_elements(fileobj, written)
+
+    def _flush_elements(self, fileobj, written):
+        # Producers must be declared before they are referenced
+        producers = self.producers.ordered(written['producers'])
+        self._probe_producers(producers)
+        self._use_rendered_producers(producers)
+        for producer in producers:
+            self._write_element(fileobj, producer)
+
+        written['producers'] = len(self.producers)
+
+        # Transitions are only counted after this point, release them
+        for transition in self.transitions[written['transitions']:]:
+            self._write_element(fileobj, transition)
+            transition.clear()
+
+        written['transitions'] = len(self.transitions)
+
+        # Shared tractors are only built once, release them as well
+        for element in self.nested_elements:
+            self._write_element(fileobj, element)
+
+        del self.nested_elements[:]
+
+        for playlist in self.playlists:
+            self._write_element(fileobj, playlist)
+
+        del self.playlists[:]
+
+    def _write_element(self, fileobj, element):
+        self.serialize_element(element, fileobj.write, self.indent)
+
+    def _probe_producers(self, producers):
+        # Probed properties are only added to the rendered XML. Elements
+        # stay as assembled so they still compare equal when merging tracks
+        # and may be shared with other exports.
+        if self.prober is None:
+            return
+
+        for producer_e in producers:
+            info = self.producers.info(producer_e)
+            if info.mlt_service is not None or info.resource is None:
+                continue
+
+            filepath = _local_path(info.resource.text)
+            if not filepath:
+                continue
+
+            properties = self.probe_cache.probe(filepath, self.prober)
+            if not properties:
+                continue
+
+            probed_e = self.derive_producer(
+                producer_e,
+                producer_e.attrib['id']
+            )
+            for name, value in properties:
+                probed_e.append(self.create_property_element(name, value))
+
+            self.emitter.rendered[producer_e] = self.render_element(probed_e)
+
+    def _save_probes(self):
+        if self.probe_cache is not None:
+            self.probe_cache.save()
+
+    def _use_rendered_producers(self, producers):
+        # Producers shared between exports are only rendered once
+        if self.producer_cache is None:
+            return
+
+        for producer_e in producers:
+            if producer_e in self.emitter.rendered:
+                continue
+
+            rendered = self.producer_cache.render(
+                producer_e,
+                self.pretty,
+                self.render_element
+            )
+            if rendered is not None:
+                self.emitter.rendered[producer_e] = rendered
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Record time spent in a phase of the export when profiling. Time
+        spent in a nested phase is only recorded for the nested phase.
+
+        :param name: name of phase
+        """
+
+        if self.stats is None:
+            yield
+            return
+
+        phases = self.stats.phases
+        now = default_timer()
+        if self._phases:
+            outer, started = self._phases[-1]
+            phases[outer] = phases.get(outer, 0.) + now - started
+
+        self._phases.append((name, now))
+        try:
+            yield
+
+        finally:
+            now = default_timer()
+            _, started = self._phases.pop()
+            phases[name] = phases.get(name, 0.) + now - started
+
+            if self._phases:
+                self._phases[-1] = (self._phases[-1][0], now)
+
+    def _instrument(self):
+        # Time main methods by shadowing them on the instance
+        for name in (
+                'get_producer',
+                'create_transition',
+                'apply_timewarp',
+                'assemble_track',
+                'merge_track'):
+            setattr(self, name, self._timed(name, getattr(self, name)))
+
+    def _timed(self, name, method):
+        timings = self.stats.timings
+        calls = self.stats.calls
+        timings[name] = 0.
+        calls[name] = 0
+
+        def timed(*args, **kwargs):
+            start = default_timer()
+            try:
+                return method(*args, **kwargs)
+
+            finally:
+                timings[name] += default_timer() - start
+                calls[name] += 1
+
+        return timed
+
+    def _start_profile(self):
+        tracemalloc = _tracemalloc()
+        if self.stats is None or tracemalloc is None:
+            return
+
+        self._tracing = not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+
+    def _finish_profile(self):
+        if self.stats is None:
+            return
 
-class MLTAdapter(object):
-    def __init__(self, input_otio, **profile_data):
-        self.input_otio = input_otio
+        stats = self.stats
+        stats.producers = len(self.producers)
+        stats.dedup_hits = self.producers.hits
+        stats.transitions = self.transition_count
+        stats.effects = stats.calls['apply_timewarp']
+        stats.elements = self.emitter.elements
 
-        # Check for image producer in adapter args
-        self.image_producer = 'image2'
-        if 'image_producer' in profile_data:
-            self.image_producer = profile_data.pop('image_producer')
+        tracemalloc = _tracemalloc()
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            stats.peak_memory = tracemalloc.get_traced_memory()[1]
+            if self._tracing:
+                tracemalloc.stop()
 
-        if self.image_producer not in ['image2', 'pixbuf']:
-            raise ValueError(
-                'Image producer must be "image2" or "pixbuf"'
-            )
+        if self.stats_callback is not None:
+            self.stats_callback(stats)
 
-        self.profile_data = profile_data
+    def render_element(self, element):
+        """
+        Render an element placed directly under the root to XML
 
-        # MLT root tag
-        self.root = et.Element('mlt')
+        :param element: element to render
+        :return: XML
+        :rtype: `str`
+        """
 
-        # Store media references or clips as producers
-        self.producers = {'audio': {}, 'video': {}}
+        chunks = []
+        self.serialize_element(element, chunks.append, self.indent)
 
-        # Store playlists so they appear in order
-        self.playlists = []
+        return ''.join(chunks)
 
-        # Store transitions for indexing
-        self.transitions = []
+    @property
+    def indent(self):
+        return '    ' if self.pretty else ''
 
-    def create_mlt(self):
-        profile_e = self.create_profile_element()
-        if self.profile_data:
-            self.update_profile_element(profile_e, self.profile_data)
+    @property
+    def newline(self):
+        return '\n' if self.pretty else ''
+
+    def serialize_element(self, element, write, indent=''):
+        """
+        Serialize an element or `Playlist` and its children with
+        `self.emitter`
+
+        :param element: element to serialize
+        :param write: callable receiving chunks of text
+        :param indent: current indentation
+        """
+
+        self.emitter.emit(element, write, indent)
+
+    def prepare_tracks(self, profile_e):
+        """
+        Update the profile element and return a stack of tracks to assemble
+        based on the type of input OTIO object
 
+        :param profile_e: profile element
+        :return: tracks to assemble
+        :rtype: `otio.schema.Stack`
+        """
+
+        rate = None
         if isinstance(self.input_otio, otio.schema.Timeline):
             tracks = self.input_otio.tracks
             if self.input_otio.global_start_time:
-                self.update_profile_element(
-                    profile_e,
-                    self.input_otio.global_start_time
-                )
+                rate = self.input_otio.global_start_time.rate
 
         elif isinstance(self.input_otio, otio.schema.Track):
             tracks = otio.schema.Stack()
@@ -71,30 +1827,10 @@ class MLTAdapter(object):
                 "Not {}".format(type(self.input_otio))
             )
 
-        # Main method
-        self.assemble_timeline(tracks)
-
-        # Below we add elements in an orderly fashion
-
-        # Add producers to root
-        for producer in self.producers['producer_order_']:
-            self.root.insert(0, producer)
-
-        # Add transition tractors
-        for transition in self.transitions:
-            self.root.insert(-1, transition)
-
-        # Add playlists to root
-        for playlist in self.playlists:
-            self.root.insert(-1, playlist)
-
-        # Add profile to the root of tree
-        self.root.insert(0, profile_e)
-
-        # Render the XML
-        tree = minidom.parseString(et.tostring(self.root, 'utf-8'))
+        # Resolved once per combination of arguments and rate
+        profile_e.attrib.update(profile_attributes(self.profile_data, rate))
 
-        return tree.toprettyxml(indent="    ")
+        return tracks
 
     def create_property_element(self, name, text=None, attrib=None):
         property_e = et.Element('property', name=name)
@@ -121,117 +1857,168 @@ class MLTAdapter(object):
 
         return color_e
 
-    def get_producer(self, otio_item, audio_track=False):
+    def get_producer(self, otio_item, audio_track=False, name=None):
         """
         Get or create a producer element. Will prevent duplicates.
 
         :param otio_item: OTIO object to base producer on
         :param audio_track: If item stems from an audio track or not
         :type audio_track: `bool`
+        :param name: use instead of `otio_item.name`
         :return: producer element
         """
 
+        if isinstance(otio_item, (otio.schema.Gap, otio.schema.Transition)):
+            # Gaps and transitions all share the solid background
+            return self.get_solid('black')
+
         target_url = None
-        producer_e = None
         is_sequence = False
         extra_attribs = {}
 
-        if isinstance(otio_item, (otio.schema.Gap, otio.schema.Transition)):
-            # Create a solid producer
-            producer_e = self.create_solid(
-                'black',
-                otio_item.duration().value
-            )
-
-            id_ = producer_e.attrib['id']
-
-        else:
-            id_ = otio_item.name
-
+        id_ = otio_item.name if name is None else name
         id_key = id_
 
-        if hasattr(otio_item, 'media_reference') and otio_item.media_reference:
-            id_ = otio_item.media_reference.name or otio_item.name
+        media_reference = getattr(otio_item, 'media_reference', None)
+        if media_reference:
+            id_ = media_reference.name or id_
 
-            if hasattr(otio_item.media_reference, 'target_url'):
-                target_url = otio_item.media_reference.target_url
+            if hasattr(media_reference, 'target_url'):
+                target_url = media_reference.target_url
 
-                available_range = otio_item.media_reference.available_range
+                available_range = media_reference.available_range
                 if available_range:
                     in_ = available_range.start_time.value
                     out_ = available_range.end_time_inclusive().value
 
                     extra_attribs.update({'in': str(in_), 'out': str(out_)})
 
-            elif hasattr(otio_item.media_reference, 'abstract_target_url'):
+            elif hasattr(media_reference, 'abstract_target_url'):
                 is_sequence = True
                 start_number_prop = 'start_number'
                 if self.image_producer == 'pixbuf':
                     start_number_prop = 'begin'
 
-                target_url = otio_item.media_reference.abstract_target_url(
-                    '%0{}d'.format(
-                        otio_item.media_reference.frame_zero_padding
-                    )
+                target_url = media_reference.abstract_target_url(
+                    '%0{}d'.format(media_reference.frame_zero_padding)
                 )
                 target_url += '?{propname}={startnum}'.format(
                     propname=start_number_prop,
-                    startnum=otio_item.media_reference.start_frame
+                    startnum=media_reference.start_frame
                 )
 
             if target_url:
                 id_key += target_url
 
-        if producer_e is None:
-            producer_e = et.Element(
+        if self.hashed_ids:
+            # Producers of the same media share an id based on its content
+            id_ = id_key = _content_id(
                 'producer',
-                id=id_,
-                attrib=extra_attribs
+                target_url or id_,
+                extra_attribs.get('in'),
+                extra_attribs.get('out'),
+                self.image_producer if is_sequence else None
             )
 
-        sub_key = 'video'
-        if audio_track:
-            if id_key not in self.producers['video']:
-                sub_key = 'audio'
-
         # We keep track of audio and video producers to avoid duplicates
-        producer = self.producers[sub_key].setdefault(
-            id_key,
-            producer_e
-        )
+        audio = audio_track and id_key not in self.producers.video
+
+        producer = self.producers.get(id_key, audio)
+        if producer is None and self.hashed_ids:
+            # Content ids are the same whichever kind of track uses the
+            # media, so is the producer
+            producer = self.producers.get(id_key, not audio)
+
+        if producer is None:
+            producer, info = self.create_producer(
+                id_,
+                target_url or id_,
+                extra_attribs,
+                is_sequence
+            )
+            self.producers.setdefault(id_key, producer, audio)
 
-        if not target_url:
-            target_url = id_
+            # store producer in order for insertion later
+            self.producers.register(producer, info)
 
-        property_e = producer.find('./property/[@name="resource"]')
-        if property_e is None or property_e.text == 'black':
-            if property_e is None:
-                resource = self.create_property_element(
-                    name='resource',
-                    text=target_url
-                )
-                producer.append(resource)
+        return producer
 
-            if is_sequence:
-                producer.append(
-                    self.create_property_element(
-                        name='mlt_service',
-                        text=self.image_producer
-                    )
-                )
+    def get_solid(self, color, length=None):
+        """
+        Get the solid producer of a colour shared by the background and all
+        gaps and transitions. It is created once, spanning the timeline.
 
-            # store producer in order list for insertion later
-            order = self.producers.setdefault('producer_order_', [])
-            if producer not in order:
-                order.append(producer)
+        :param color: colour of solid
+        :param length: length in frames if the solid is created, defaults to
+            the duration of the input
+        :return: producer element
+        """
 
-        return producer
+        id_ = 'solid_{}'.format(color)
+        producer_e = self.producers.get(id_)
+        if producer_e is None:
+            if length is None:
+                length = self.input_otio.duration().value
+
+            producer_e = self.create_solid(color, length)
+            self.producers.setdefault(id_, producer_e)
+
+            # store producer in order for insertion later
+            self.producers.register(producer_e)
+
+        return producer_e
+
+    def create_producer(self, id_, resource, attrib, is_sequence):
+        """
+        Create a producer for media, or reuse one from `self.producer_cache`
+
+        :param id_: id of producer
+        :param resource: path or url of media
+        :param attrib: extra attributes of producer
+        :param is_sequence: media is an image sequence
+        :return: producer element and its `ProducerInfo`
+        """
+
+        key = (
+            id_,
+            resource,
+            attrib.get('in'),
+            attrib.get('out'),
+            self.image_producer if is_sequence else None
+        )
+        # Different keys of a timeline may still share a producer
+        cached = None
+        if self.producer_cache is not None:
+            cached = self.producer_cache.get(key)
+            if cached is not None and cached[0] not in self.producers:
+                return cached
+
+        producer_e = et.Element('producer', id=id_, attrib=attrib)
+        info = ProducerInfo(producer_e)
+
+        info.resource = self.create_property_element(
+            name='resource',
+            text=resource
+        )
+        producer_e.append(info.resource)
+
+        if is_sequence:
+            info.mlt_service = self.create_property_element(
+                name='mlt_service',
+                text=self.image_producer
+            )
+            producer_e.append(info.mlt_service)
+
+        if self.producer_cache is not None and cached is None:
+            self.producer_cache.store(key, producer_e, info)
+
+        return producer_e, info
 
     def create_transition(self, trans_tuple, name, audio_track=False):
-        # Expand parts of transition
+        # Expand parts of transition. All parts are `TrimmedItem`s
         item_a, transition, item_b = trans_tuple
 
-        dur = transition.duration().value - 1
+        dur = transition.duration - 1
 
         tractor_e = et.Element(
             'tractor',
@@ -242,14 +2029,14 @@ class MLTAdapter(object):
             }
         )
 
-        producer_a = self.get_producer(item_a)
-        if isinstance(item_a, otio.schema.Gap):
+        producer_a = self.get_producer(item_a.item, name=item_a.name)
+        if isinstance(item_a.item, otio.schema.Gap):
             a_in = 0
-            a_out = item_b.duration().value - 1
+            a_out = item_b.duration - 1
 
         else:
-            a_in = item_a.trimmed_range().start_time.value
-            a_out = item_a.trimmed_range().end_time_inclusive().value
+            a_in = item_a.in_
+            a_out = item_a.out_
 
         track_a = et.Element(
             'track',
@@ -260,14 +2047,14 @@ class MLTAdapter(object):
             }
         )
 
-        producer_b = self.get_producer(item_b)
-        if isinstance(item_b, otio.schema.Gap):
+        producer_b = self.get_producer(item_b.item, name=item_b.name)
+        if isinstance(item_b.item, otio.schema.Gap):
             b_in = 0
-            b_out = item_b.duration().value - 1
+            b_out = item_b.duration - 1
 
         else:
-            b_in = item_b.trimmed_range().start_time.value
-            b_out = item_b.trimmed_range().end_time_inclusive().value
+            b_in = item_b.in_
+            b_out = item_b.out_
 
         track_b = et.Element(
             'track',
@@ -301,40 +2088,60 @@ class MLTAdapter(object):
 
         return tractor_e
 
-    def create_entry_element(self, producer, in_, out_):
-        clip_e = et.Element(
-            'entry',
-            producer=producer.attrib['id'],
-            attrib={
-                'in': str(in_),
-                'out': str(out_)
-            }
-        )
+    def hash_transition_id(self, tractor_e, playlist_id):
+        """
+        Replace the numbered id of a transition tractor with one based on
+        the track it is in and what it mixes, so it stays the same when
+        transitions elsewhere in the timeline change. Repeats of the same
+        transition within a track are numbered.
 
-        return clip_e
+        :param tractor_e: transition tractor from `create_transition`
+        :param playlist_id: id of playlist the transition is placed in
+        """
 
-    def create_clip(self, item, producer):
-        in_ = item.trimmed_range().start_time.value
-        out_ = item.trimmed_range().end_time_inclusive().value
+        tokens = [playlist_id, tractor_e.attrib['out']]
+        for child_e in tractor_e:
+            tokens.append(
+                (
+                    child_e.tag,
+                    child_e.attrib.get('producer'),
+                    child_e.attrib.get('in'),
+                    child_e.attrib.get('out'),
+                    [
+                        (property_e.attrib['name'], property_e.text)
+                        for property_e in child_e
+                    ]
+                )
+            )
 
-        clip_e = self.create_entry_element(producer, in_, out_)
+        id_ = _content_id('transition', *tokens)
+        repeats = self._hashed_transitions.get(id_, 0)
+        self._hashed_transitions[id_] = repeats + 1
+        if repeats:
+            id_ = '{}_{}'.format(id_, repeats)
+
+        tractor_e.attrib['id'] = id_
+        tractor_e.find('transition').attrib['id'] = 'transition_' + id_
+
+    def create_entry_element(self, producer, in_, out_):
+        return Entry(producer.attrib['id'], in_, out_)
+
+    def create_clip(self, item, producer):
+        # item is a `TrimmedItem`
+        clip_e = self.create_entry_element(producer, item.in_, item.out_)
 
         return clip_e
 
     def create_blank_element(self, item):
-        blank_e = et.Element(
-            'blank',
-            length=str(item.source_range.duration.value)
-        )
-
-        return blank_e
+        # item is a `TrimmedItem`
+        return Blank(item.duration)
 
     def apply_timewarp(self, item, item_e, effect):
         """
-        Apply a time warp effect on a copy of a producer
+        Apply a time warp effect on a derived copy of a producer
 
-        :param item: source OTIO item in track
-        :param item_e: element tag to apply effect to
+        :param item: `TrimmedItem` of source OTIO item in track
+        :param item_e: `Entry` to apply effect to
         :param effect: OTIO effect object
         :return:
         """
@@ -346,10 +2153,7 @@ class MLTAdapter(object):
         if item_e is None:
             return
 
-        # Create a copy of the producer
-        orig_producer_e = self.get_producer(item)
-        producer_e = deepcopy(orig_producer_e)
-        id_ = None
+        orig_producer_e = self.get_producer(item.item)
 
         if effect.effect_name == 'FreezeFrame':
             # Freeze frame will always use the first frame of the
@@ -357,78 +2161,113 @@ class MLTAdapter(object):
             # indicating which frame was chosen to freeze
 
             id_ = '{}_freeze{}'.format(
-                producer_e.attrib['id'],
-                item.source_range.start_time.value
-            )
-
-            producer_e.attrib['id'] = id_
-            producer_e.append(
-                self.create_property_element('mlt_service', 'hold')
-            )
-            producer_e.append(self.create_property_element(
-                'frame',
-                str(item.source_range.start_time.value))
+                orig_producer_e.attrib['id'],
+                item.in_
             )
 
         elif effect.effect_name == 'LinearTimeWarp':
             id_ = ':'.join(
-                [str(effect.time_scalar), item_e.attrib.get('producer')]
-            )
-            producer_e.attrib['id'] = id_
-            producer_e.append(
-                self.create_property_element('mlt_service', 'timewarp')
-            )
-            resource_e = producer_e.find('./property/[@name="resource"]')
-            resource_e.text = ':'.join(
-                [str(effect.time_scalar), resource_e.text]
+                [str(effect.time_scalar), item_e.producer]
             )
 
-        # Add the new copy to the producers list
-        if id_ not in self.producers['video']:
-            self.producers['video'][id_] = producer_e
-            self.producers['producer_order_'].append(producer_e)
+        else:
+            # Unknown time effect
+            return
+
+        # Only create the new producer once
+        if id_ not in self.producers.video:
+            producer_e = self.derive_producer(orig_producer_e, id_)
+            info = ProducerInfo(producer_e)
+
+            if effect.effect_name == 'FreezeFrame':
+                info.mlt_service = self.create_property_element(
+                    'mlt_service',
+                    'hold'
+                )
+                producer_e.append(info.mlt_service)
+                producer_e.append(self.create_property_element(
+                    'frame',
+                    str(item.in_))
+                )
+
+            else:
+                info.mlt_service = self.create_property_element(
+                    'mlt_service',
+                    'timewarp'
+                )
+                producer_e.append(info.mlt_service)
+                info.resource.text = ':'.join(
+                    [str(effect.time_scalar), info.resource.text]
+                )
+
+            # Add the new producer to the producers list
+            self.producers.video[id_] = producer_e
+            self.producers.register(producer_e, info)
 
         # Swap the old producer with the new containing the effect
-        item_e.attrib['producer'] = id_
+        item_e.producer = id_
+
+    def derive_producer(self, producer_e, id_):
+        """
+        Create a new producer based on the attributes and properties of
+        another. Properties are leaf elements so a shallow copy of each is
+        enough and cheaper than a `deepcopy` of the producer.
 
-    def create_background_track(self, tracks, parent):
-        length = tracks.duration().value
-        bg_e = self.create_solid('black', length)
+        :param producer_e: producer element to base new producer on
+        :param id_: id of new producer
+        :return: producer element
+        """
 
-        # Add producer to list
-        producer_e = self.producers['video'].setdefault(
-            bg_e.attrib['id'],
-            bg_e
+        derived_e = et.Element(
+            producer_e.tag,
+            attrib=dict(producer_e.attrib, id=id_)
         )
 
-        # store producer in order list for insertion later
-        self.producers.setdefault('producer_order_', []).append(producer_e)
+        for child_e in producer_e:
+            copy_e = et.SubElement(derived_e, child_e.tag, child_e.attrib)
+            copy_e.text = child_e.text
 
-        playlist_e = et.Element(
-            'playlist',
-            id='background'
-        )
-        self.playlists.append(playlist_e)
+        return derived_e
 
-        playlist_e.append(self.create_entry_element(bg_e, 0, length - 1))
+    def create_background_track(self, tracks, parent, ranges=None):
+        if ranges is None:
+            ranges = [TrackRanges(track) for track in tracks]
 
-        parent.append(
-            et.Element('track', producer=playlist_e.attrib['id'])
-        )
+        length = stack_duration(tracks, ranges)
+        bg_e = self.get_solid('black', length)
 
-    def assemble_track(self, track, track_index, parent):
-        playlist_e = et.Element(
-            'playlist',
-            id=track.name or 'playlist{}'.format(track_index)
+        playlist = Playlist('background')
+        self.playlists.append(playlist)
+
+        playlist.append(self.create_entry_element(bg_e, 0, length - 1))
+
+        parent.append(et.Element('track', producer=playlist.id))
+
+    def assemble_track(
+            self,
+            track,
+            track_index,
+            parent,
+            ranges=None,
+            playlist_id=None):
+        playlist = Playlist(
+            playlist_id or track.name or 'playlist{}'.format(track_index)
         )
-        self.playlists.append(playlist_e)
+        self.playlists.append(playlist)
 
-        # Transitions use track elements as children
-        element_type = 'track'
+        # Effects of the track become filters of a tractor wrapping it
+        effects = _filter_effects(track)
+        producer_id = playlist.id
+        if effects:
+            producer_id = self._wrapper_id(playlist.id)
 
         # Playlists use entry
         if parent.tag == 'playlist':
-            element_type = 'entry'
+            element = Entry(producer_id)
+
+        # Transitions use track elements as children
+        else:
+            element = et.Element('track', producer=producer_id)
 
         # Used to check if we need to add audio elements or not
         is_audio_track = False
@@ -436,7 +2275,6 @@ class MLTAdapter(object):
             is_audio_track = track.kind == 'Audio'
 
         # Insert audio before video
-        element = et.Element(element_type, producer=playlist_e.attrib['id'])
         if is_audio_track:
             parent.insert(1, element)
 
@@ -444,66 +2282,220 @@ class MLTAdapter(object):
             parent.append(element)
 
         # Iterate over items in track, expanding transitions
-        expanded_track = otio.algorithms.track_with_expanded_transitions(track)
-        for item in expanded_track:
-            item_e = None
-
-            if isinstance(item, otio.schema.Clip):
-                producer_e = self.get_producer(item, is_audio_track)
-
-                if is_audio_track:
-                    # Skip "duplicate" audio elmnt for matching video producer
-                    key_id = producer_e.attrib['id'] + producer_e[0].text
-                    if key_id in self.producers['video']:
-                        continue
-
-                item_e = self.create_clip(item, producer_e)
-                playlist_e.append(item_e)
-
-            elif isinstance(item, otio.schema.Gap):
-                item_e = self.create_blank_element(item)
-                playlist_e.append(item_e)
-
-            elif isinstance(item, tuple):
+        for entry in expand_transitions(track, ranges):
+            if isinstance(entry, tuple):
                 # Since we expanded transitions in the track the come as tuples
                 # containing (ClipA_t, Transition, ClipB_t)
 
                 transition_e = self.create_transition(
-                    item,
-                    'transition_tractor{}'.format(len(self.transitions)),
+                    entry,
+                    'transition_tractor{}'.format(self.transition_count),
                     is_audio_track
                 )
+                if self.hashed_ids:
+                    self.hash_transition_id(transition_e, playlist.id)
+
                 self.transitions.append(transition_e)
+                self.transition_count += 1
 
-                playlist_e.append(
-                    et.Element(
-                        'entry',
-                        producer=transition_e.attrib['id'],
-                        attrib={
-                            'in': transition_e.attrib['in'],
-                            'out': transition_e.attrib['out']
-                        }
+                playlist.append(
+                    Entry(
+                        transition_e.attrib['id'],
+                        transition_e.attrib['in'],
+                        transition_e.attrib['out']
                     )
                 )
 
-                # Continue as transitions have no effects, see test below
+                # Continue as transitions have no effects, see assemble_item
                 continue
 
-            elif isinstance(item, (otio.schema.Track, otio.schema.Stack)):
-                # NOTE! This doesn't apply effects to the nested track
-                # TODO create new playlist and wrap it in a new tractor
-                #  then add filter to that tractor and place tractor in
-                #  place of producer/playlist. See melt docs..
-                self.assemble_track(item, track_index, playlist_e)
+            self.assemble_item(entry, playlist, track_index, is_audio_track)
 
-            # Check for effects on item
-            if hasattr(item, 'effects'):
-                for effect in item.effects:
-                    # We only support certain time effects for now
-                    if isinstance(effect, SUPPORTED_TIME_EFFECTS):
-                        self.apply_timewarp(item, item_e, effect)
+        # Effects may swap producers, so only merge once they are applied
+        if self.coalesce:
+            playlist.coalesce()
 
-    def assemble_timeline(self, tracks):
+        if effects:
+            tractor_e = et.Element('tractor', id=producer_id)
+            multitrack_e = et.SubElement(tractor_e, 'multitrack')
+            et.SubElement(multitrack_e, 'track', producer=playlist.id)
+            tractor_e.extend(self.create_filters(effects, producer_id))
+
+            # Declared after the playlists it plays
+            self.playlists.append(tractor_e)
+
+    def create_filters(self, effects, owner_id):
+        """
+        Create a filter per effect applied to a track or stack. The service
+        is the "mlt_service" held in the "mlt" namespace of the effect's
+        metadata. Other values in that namespace become properties of the
+        filter.
+
+        :param effects: effects from `_filter_effects`
+        :param owner_id: id of tractor the filters are attached to
+        :return: filter elements
+        :rtype: `list`
+        """
+
+        filters = []
+        for index, effect in enumerate(effects):
+            properties = _filter_properties(effect)
+            filter_e = et.Element(
+                'filter',
+                id='{}_filter{}'.format(owner_id, index)
+            )
+            filter_e.append(
+                self.create_property_element(
+                    'mlt_service',
+                    properties.pop('mlt_service')
+                )
+            )
+            for name, value in properties.items():
+                filter_e.append(self.create_property_element(name, value))
+
+            filters.append(filter_e)
+
+        return filters
+
+    def assemble_item(self, entry, playlist, track_index, is_audio_track):
+        """
+        Append an item of a track to its playlist
+
+        :param entry: `TrimmedItem` of item
+        :param playlist: `Playlist` of track
+        :param track_index: index of track in timeline
+        :param is_audio_track: item is in an audio track
+        """
+
+        item = entry.item
+        item_e = None
+
+        if isinstance(item, otio.schema.Clip):
+            producer_e = self.get_producer(item, is_audio_track)
+
+            if is_audio_track:
+                # Skip "duplicate" audio elmnt for matching video producer
+                key_id = producer_e.attrib['id']
+                if not self.hashed_ids:
+                    key_id += self.producers.info(producer_e).resource.text
+
+                if key_id in self.producers.video:
+                    return
+
+            item_e = self.create_clip(entry, producer_e)
+            playlist.append(item_e)
+
+        elif isinstance(item, otio.schema.Gap):
+            item_e = self.create_blank_element(entry)
+            playlist.append(item_e)
+
+        elif isinstance(item, (otio.schema.Track, otio.schema.Stack)):
+            if self.nested_tractors:
+                playlist.append(
+                    Entry(
+                        self.get_nested_tractor(item),
+                        entry.in_,
+                        entry.out_
+                    )
+                )
+                return
+
+            self.assemble_track(item, track_index, playlist)
+
+        # Check for effects on item
+        if hasattr(item, 'effects'):
+            for effect in item.effects:
+                # We only support certain time effects for now
+                if isinstance(effect, SUPPORTED_TIME_EFFECTS):
+                    self.apply_timewarp(entry, item_e, effect)
+
+    def get_nested_tractor(self, composition):
+        """
+        Get the tractor playing a nested track or stack. Compositions with
+        the same content share a single tractor built on first use, so
+        repeated nests are only assembled and serialized once. A stack gets
+        a track per child and a track a single one. Entries referencing the
+        tractor apply the trim of each use.
+
+        :param composition: `otio.schema.Track` or `otio.schema.Stack`
+        :return: id of tractor
+        :rtype: `str`
+        """
+
+        # Names of compositions only make up ids and the trim is applied by
+        # the entries, neither changes what the tractor plays
+        digest = track_fingerprint(composition, outer=False, names=False)
+
+        tractor_id = self.nested.get(digest)
+        if tractor_id is not None:
+            return tractor_id
+
+        # Compositions read back are named after their tractor already
+        suffix = '_' + digest[:8]
+        tractor_id = composition.name or 'nested'
+        if not tractor_id.endswith(suffix):
+            tractor_id += suffix
+
+        self.nested[digest] = tractor_id
+
+        tractor_e = et.Element('tractor', id=tractor_id)
+        multitrack_e = et.SubElement(tractor_e, 'multitrack')
+
+        # Tractors nested further in are declared before the playlists
+        # referencing them
+        playlists = self.playlists
+        self.playlists = []
+        try:
+            if isinstance(composition, otio.schema.Stack):
+                self._assemble_layers(composition, tractor_id, multitrack_e)
+                tractor_e.extend(
+                    self.create_filters(
+                        _filter_effects(composition),
+                        tractor_id
+                    )
+                )
+
+            else:
+                self.assemble_track(
+                    composition,
+                    0,
+                    multitrack_e,
+                    playlist_id='{}_track0'.format(tractor_id)
+                )
+
+        finally:
+            playlists, self.playlists = self.playlists, playlists
+
+        self.nested_elements.extend(playlists)
+        self.nested_elements.append(tractor_e)
+
+        return tractor_id
+
+    def _assemble_layers(self, stack, tractor_id, parent):
+        for index, entry in enumerate(expand_transitions(stack)):
+            if isinstance(entry, tuple):
+                # Transitions have no meaning between layers of a stack
+                continue
+
+            playlist_id = '{}_track{}'.format(tractor_id, index)
+            item = entry.item
+            if isinstance(item, otio.schema.Track) and \
+                    item.source_range is None:
+                self.assemble_track(
+                    item,
+                    index,
+                    parent,
+                    playlist_id=playlist_id
+                )
+                continue
+
+            # Anything else plays on a track of its own
+            playlist = Playlist(playlist_id)
+            self.playlists.append(playlist)
+            parent.append(et.Element('track', producer=playlist_id))
+            self.assemble_item(entry, playlist, index, False)
+
+    def create_main_tractor(self, tracks=None):
         # We gather tracks in tractors. This is the "main one"
         tractor_e = et.Element('tractor', id='tractor0')
         multitrack_e = et.SubElement(
@@ -512,55 +2504,292 @@ class MLTAdapter(object):
             attrib={'id': 'multitrack0'}
         )
 
-        self.root.append(tractor_e)
+        # Effects on the stack of tracks apply to the whole timeline
+        if tracks is not None:
+            tractor_e.extend(
+                self.create_filters(_filter_effects(tracks), 'tractor0')
+            )
+
+        return tractor_e, multitrack_e
+
+    def assemble_timeline(self, tracks):
+        tractor_e, multitrack_e = self.create_main_tractor(tracks)
+
+        # Resolve ranges of all tracks once
+        plan = self.plan_tracks(tracks)
 
         # Make sure there is a solid background if tracks contain gaps
-        self.create_background_track(tracks, multitrack_e)
+        self.create_background_track(tracks, multitrack_e, plan.ranges)
 
-        for track_index, track in enumerate(tracks):
-            self.assemble_track(track, track_index, multitrack_e)
+        for _ in self.iter_assembled_tracks(tracks, multitrack_e, plan):
+            pass
 
-    def rate_fraction_from_float(self, rate):
+        return tractor_e
+
+    def plan_tracks(self, tracks):
         """
-        Given a frame rate float, creates a frame rate fraction conforming to
-        known good rates where possible. This will do fuzzy matching of
-        23.98 to 24000/1001, for instance.
+        Work out how to assemble the tracks of a timeline. Tracks found in
+        `self.cache` are merged as they are, so their ranges are only
+        resolved for tracks that need assembling.
 
-        Thanks! @reinecke
+        :param tracks: stack of tracks
+        :return: `TrackPlan`
+        """
+
+        # Transition tractors are numbered in order of appearance
+        offsets = []
+        count = self.transition_count
+        for track in tracks:
+            offsets.append(count)
+            count += _count_transitions(track)
+
+        # Audio tracks depend on producers of the tracks above and shared
+        # tractors on the tracks that used them first
+        isolated = [
+            track_index for track_index, track in enumerate(tracks)
+            if not _contains_audio(track) and not (
+                self.nested_tractors and _contains_nested(track)
+            )
+        ]
+
+        keys = {}
+        cached = {}
+        if self.cache is not None:
+            for track_index in isolated:
+                keys[track_index] = (
+                    track_fingerprint(tracks[track_index]),
+                    track_index,
+                    offsets[track_index],
+                    self.image_producer,
+                    self.pretty,
+                    self.coalesce,
+                    self.hashed_ids
+                )
+                cached_track = self.cache.get(keys[track_index])
+                if cached_track is not None:
+                    cached[track_index] = cached_track
+
+        ranges = [
+            cached.get(track_index) or TrackRanges(track)
+            for track_index, track in enumerate(tracks)
+        ]
+
+        return TrackPlan(offsets, isolated, keys, cached, ranges)
+
+    def iter_assembled_tracks(self, tracks, parent, plan):
         """
+        Assemble tracks one by one, yielding the index of each track once
+        its elements are in place. When `self.workers` is more than one,
+        tracks are assembled in a process pool and merged in order so the
+        result is identical to assembling them one after the other.
+        Tracks found in `self.cache` are merged without being assembled.
+
+        :param tracks: stack of tracks
+        :param parent: multitrack element
+        :param plan: `TrackPlan` of tracks
+        :return: generator of track indices
+        """
+
+        jobs = {}
+        executor = None
+        if self.workers > 1:
+            # OTIO may load this module from file under another name.
+            # Workers need to import their functions by package path.
+            from otio_mlt_adapter.adapters import mlt_xml
+
+            executor = self._create_executor(tracks)
+            for track_index in plan.isolated:
+                if track_index in plan.cached:
+                    continue
+
+                jobs[track_index] = executor.submit(
+                    mlt_xml._assemble_track_job,
+                    track_index,
+                    plan.offsets[track_index]
+                )
 
-        # Whole numbers are easy
-        if isinstance(rate, int) or rate.is_integer():
-            return Fraction(rate)
+        try:
+            for track_index, track in enumerate(tracks):
+                cached = plan.cached.get(track_index)
+                ranges = None if cached else plan.ranges[track_index]
+
+                result = None
+                if cached is not None:
+                    result = cached.result
+
+                elif track_index in jobs:
+                    result = jobs[track_index].result()
+
+                elif track_index in plan.keys:
+                    result = assemble_isolated_track(
+                        track,
+                        track_index,
+                        plan.offsets[track_index],
+                        self.producers.video.get('solid_black'),
+                        self.image_producer,
+                        self.coalesce,
+                        self.hashed_ids,
+                        ranges
+                    )
 
-        NTSC_RATES = (
-            Fraction(24000, 1001),
-            Fraction(30000, 1001),
-            Fraction(60000, 1001),
+                if cached is None and result is not None and \
+                        track_index in plan.keys:
+                    cached = self.cache.store(
+                        plan.keys[track_index],
+                        result,
+                        ranges.duration,
+                        self.render_element
+                    )
+                    result = cached.result
+
+                rendered = cached.rendered if cached is not None else None
+                if result is None or \
+                        not self.merge_track(parent, result, rendered):
+                    self.transition_count = plan.offsets[track_index]
+                    self.wrapper_ids = set()
+                    self.assemble_track(track, track_index, parent, ranges)
+
+                yield track_index
+
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def _wrapper_id(self, playlist_id):
+        # Nested tracks may share playlist ids with the tracks holding them,
+        # so repeats are numbered in order within each top level track just
+        # like a worker assembling that track alone would
+        wrapper_id = '{}_tractor'.format(playlist_id)
+        count = 1
+        while wrapper_id in self.wrapper_ids:
+            wrapper_id = '{}_tractor{}'.format(playlist_id, count)
+            count += 1
+
+        self.wrapper_ids.add(wrapper_id)
+        return wrapper_id
+
+    def _placeholder(self, fragment):
+        # Rendered XML is written as is when serializing
+        if not isinstance(fragment, str):
+            return fragment
+
+        placeholder_e = et.Element('rendered')
+        self.emitter.rendered[placeholder_e] = fragment
+
+        return placeholder_e
+
+    def _create_executor(self, tracks):
+        from concurrent.futures import ProcessPoolExecutor
+
+        from otio_mlt_adapter.adapters import mlt_xml
+
+        # Workers get a copy of the tracks, whatever the start method
+        return ProcessPoolExecutor(
+            self.workers,
+            initializer=mlt_xml._init_track_worker,
+            initargs=(
+                otio.adapters.write_to_string(tracks, 'otio_json'),
+                self.producers.video.get('solid_black'),
+                self.image_producer,
+                self.coalesce,
+                self.hashed_ids
+            )
         )
 
-        for ntsc_rate in NTSC_RATES:
-            # The tolerance of 0.004 comes from 24000/1001 - 23.98
-            if abs(rate - ntsc_rate) < 0.004:
-                return ntsc_rate
+    def merge_track(self, parent, result, rendered=None):
+        """
+        Merge a track assembled by `assemble_isolated_track`
+
+        :param parent: multitrack element
+        :param result: result of `assemble_isolated_track`
+        :param rendered: XML of the producers in `result` by element, as
+            kept by a `CachedTrack`
+        :return: `False` if the track conflicts with tracks already merged
+            and needs to be assembled again
+        :rtype: `bool`
+        """
+
+        track_e, playlists, transitions, producers = result
+        if rendered:
+            self.assembled_xml.update(rendered)
+
+        # A producer shared with tracks above must match what this track
+        # used, otherwise ids or derived producers may differ from serial
+        # assembly. Let the caller assemble the track again in that case.
+        for audio, id_key, producer_e in producers:
+            existing_e = self._stored_producer(id_key, audio)
+            if existing_e is None or existing_e is producer_e:
+                continue
+
+            if self._assembled_xml(existing_e) != \
+                    self._assembled_xml(producer_e):
+                return False
+
+        # Cached producers are written from their rendered XML
+        if rendered:
+            self.emitter.rendered.update(rendered)
+
+        for audio, id_key, producer_e in producers:
+            namespace = self.producers.audio if audio else self.producers.video
+            if id_key not in namespace and \
+                    self._stored_producer(id_key, audio) is not None:
+                # Shared with the other kind of track, see `get_producer`
+                continue
+
+            stored_e = self.producers.setdefault(id_key, producer_e, audio)
+            if stored_e is producer_e:
+                self.producers.register(producer_e)
+
+        parent.append(track_e)
+        self.playlists.extend(map(self._placeholder, playlists))
+        self.transitions.extend(map(self._placeholder, transitions))
+        self.transition_count += len(transitions)
+
+        return True
+
+    def _assembled_xml(self, producer_e):
+        # Producers are compared as assembled, before probing
+        xml = self.assembled_xml.get(producer_e)
+        if xml is None:
+            xml = self.assembled_xml[producer_e] = \
+                self.render_element(producer_e)
+
+        return xml
+
+    def _stored_producer(self, id_key, audio):
+        # Producer stored under `id_key` where `get_producer` looks for it
+        namespace = self.producers.audio if audio else self.producers.video
+        producer_e = namespace.get(id_key)
+        if producer_e is None and self.hashed_ids:
+            other = self.producers.video if audio else self.producers.audio
+            producer_e = other.get(id_key)
+
+        return producer_e
+
+    def rate_fraction_from_float(self, rate):
+        """
+        Given a frame rate float, creates a frame rate fraction conforming to
+        known good rates where possible, see `rate_fraction`.
+
+        Thanks! @reinecke
+        """
 
-        return Fraction(rate)
+        return rate_fraction(rate)
 
     def update_profile_element(self, profile_element, profile_data):
         if isinstance(profile_data, otio.opentime.RationalTime):
-            fractional = self.rate_fraction_from_float(profile_data.rate)
-            profile_data = dict(
-                frame_rate_den=str(fractional.denominator),
-                frame_rate_num=str(fractional.numerator)
-            )
+            attributes = profile_attributes({}, profile_data.rate)
+
+        elif isinstance(profile_data, dict):
+            attributes = profile_attributes(profile_data)
 
-        elif not isinstance(profile_data, dict):
+        else:
             raise ValueError(
                 'Only pass global_start_time as RationalTime or'
                 'a dict containing profile related key/value pairs.'
             )
 
-        profile_element.attrib.update(self._stringify_values(profile_data))
+        profile_element.attrib.update(attributes)
 
     def create_profile_element(self):
         profile_e = et.Element(
@@ -571,13 +2800,7 @@ class MLTAdapter(object):
         return profile_e
 
     def _stringify_values(self, source_dict):
-        data = deepcopy(source_dict)
-
-        for k, v in data.items():
-            if not isinstance(v, str):
-                data[k] = str(v)
-
-        return data
+        return dict(_stringified(source_dict))
 
 
 def write_to_string(input_otio, **profile_data):
@@ -591,6 +2814,34 @@ def write_to_string(input_otio, **profile_data):
     Please check MLT website for more info on profiles.
     You may pass an "image_producer" argument with "pixbuf" to change
     image sequence producer. The default image sequence producer is "image2"
+    Pass "pretty=False" to skip indentation of the XML. Handy for files
+    that will only be read by melt.
+    Pass "coalesce=True" to merge neighbouring gaps into a single blank and
+    neighbouring clips playing on from one another in the same producer into
+    a single entry. Timing is unchanged, but clips read back are merged too.
+    Pass "hashed_ids=True" to base ids of producers and transitions on the
+    media and ranges they use rather than on clip names and the order of
+    transitions. Unchanged parts of a timeline then give the same XML from
+    one export to the next. Clips sharing media share a producer, so clip
+    names are not kept.
+    Pass "nested_tractors=True" to write nested tracks and stacks as tractors
+    shared by every use of the same content, instead of a playlist per use.
+    Pass "workers" with a number larger than 1 to assemble tracks in that
+    many processes. Output is identical to the default serial assembly.
+    Requires Python 3.7 or newer.
+    Pass the same `TrackCache` as "cache" to consecutive exports to only
+    assemble tracks that changed since the previous export.
+    Pass "profile" with a callable to receive an `ExportStats` with timings
+    and counts of the export once done.
+    Pass "prober" with a callable returning producer properties for a
+    media file, or "prober=True" to use `mlt_probe.probe_media` and ffprobe,
+    to store stream properties and lengths in producers so melt does not
+    have to probe the files when loading. Pass a `mlt_probe.ProbeCache` or
+    the path of a JSON file as "probe_cache" to keep probed properties
+    between exports.
+    Pass the same `ProducerCache` as "producer_cache" to exports of
+    timelines sharing media to reuse producers between them, or see
+    `mlt_batch.write_many`.
 
     :return: MLT formatted XML
     :rtype: `str`
@@ -598,3 +2849,51 @@ def write_to_string(input_otio, **profile_data):
 
     mlt_adapter = MLTAdapter(input_otio, **profile_data)
     return mlt_adapter.create_mlt()
+
+
+def write_to_file(input_otio, filepath, **profile_data):
+    """
+    Same as `write_to_string`, but streams the MLT XML to `filepath` track
+    by track instead of building the whole document in memory first.
+
+    :param input_otio: Timeline, Track or Clip
+    :param filepath: path to destination .mlt file
+    :param profile_data: See `write_to_string`
+    """
+
+    mlt_adapter = MLTAdapter(input_otio, **profile_data)
+    with _open_utf8(filepath) as fileobj:
+        mlt_adapter.write(fileobj)
+
+
+def read_from_string(input_str):
+    """
+    Read MLT XML produced by this adapter or by applications like Shotcut.
+
+    :param input_str: MLT XML
+    :return: timeline of the last tractor in the document
+    :rtype: `otio.schema.Timeline`
+    """
+
+    if not isinstance(input_str, bytes):
+        input_str = input_str.encode('utf-8')
+
+    from otio_mlt_adapter.adapters.mlt_reader import MLTReader
+
+    return MLTReader().read(io.BytesIO(input_str))
+
+
+def read_from_file(filepath):
+    """
+    Same as `read_from_string`, but streams the MLT XML from `filepath`
+    releasing elements as they are parsed.
+
+    :param filepath: path to .mlt file
+    :return: timeline of the last tractor in the document
+    :rtype: `otio.schema.Timeline`
+    """
+
+    from otio_mlt_adapter.adapters.mlt_reader import MLTReader
+
+    with io.open(filepath, 'rb') as fileobj:
+        return MLTReader().read(fileobj)
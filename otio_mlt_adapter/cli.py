@@ -0,0 +1,188 @@
+"""
+Convert many OTIO files to MLT XML in a single process pool.
+
+Usage: otio-mlt [options] INPUT [INPUT ...]
+       otio-mlt --help
+
+Inputs are files OTIO can read, directories holding .otio files or glob
+patterns. Every file is written to the output directory as a .mlt file named
+after it. Unlike calling otioconvert once per file, interpreter and OTIO
+start up is only paid once per worker and producers of media shared between
+files are reused within each worker.
+Prints the time spent on each file as it is done and exits with an error if
+any file failed to convert.
+"""
+
+from __future__ import print_function
+
+import argparse
+import ast
+import glob
+import multiprocessing
+import os
+import sys
+from timeit import default_timer
+
+from otio_mlt_adapter.adapters.mlt_batch import iter_write_many
+from otio_mlt_adapter.adapters.mlt_xml import PROCESS_POOLS
+
+# Arguments of `iter_write_many` that are options of their own
+OPTIONS = {
+    'timelines': 'INPUT',
+    'out_dir': '--out-dir',
+    'workers': '--workers'
+}
+
+
+def adapter_arg(value):
+    """
+    Parse an adapter argument in the form of key=value like otioconvert
+    does. Values are Python literals where possible and strings otherwise.
+
+    :param value: argument from the command line
+    :return: key and value
+    :rtype: `tuple`
+    """
+
+    key, separator, text = value.partition('=')
+    if not key or not separator:
+        raise argparse.ArgumentTypeError(
+            'Expected key=value, got "{}"'.format(value)
+        )
+
+    try:
+        return key, ast.literal_eval(text)
+
+    except (ValueError, SyntaxError):
+        return key, text
+
+
+def expand_inputs(inputs, extension='.otio'):
+    """
+    :param inputs: files, directories or glob patterns
+    :param extension: extension of files picked from directories
+    :return: paths of files in the order given, without duplicates
+    :rtype: `list`
+    """
+
+    paths = []
+    seen = set()
+    for name in inputs:
+        if os.path.isdir(name):
+            matches = sorted(
+                os.path.join(name, filename)
+                for filename in os.listdir(name)
+                if filename.endswith(extension)
+            )
+
+        elif any(character in name for character in '*?['):
+            matches = sorted(glob.glob(name))
+
+        else:
+            # Missing files are reported when converting
+            matches = [name]
+
+        for path in matches:
+            if path not in seen:
+                seen.add(path)
+                paths.append(path)
+
+    return paths
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='otio-mlt',
+        description=__doc__.split('\n')[1]
+    )
+    parser.add_argument(
+        'inputs',
+        nargs='+',
+        metavar='INPUT',
+        help='file, directory of .otio files or glob pattern'
+    )
+    parser.add_argument(
+        '-o',
+        '--out-dir',
+        default='.',
+        help='directory to write .mlt files to, created if missing'
+    )
+    parser.add_argument(
+        '-w',
+        '--workers',
+        type=int,
+        default=multiprocessing.cpu_count() if PROCESS_POOLS else 1,
+        help='number of processes converting files, more than one requires '
+             'Python 3.7 or newer'
+    )
+    parser.add_argument(
+        '-A',
+        '--adapter-arg',
+        dest='adapter_args',
+        metavar='KEY=VALUE',
+        type=adapter_arg,
+        action='append',
+        default=[],
+        help='argument passed to the adapter in the form of key=value, '
+             'like -A image_producer=pixbuf -A colorspace=709'
+    )
+
+    args = parser.parse_args(argv)
+    for key, _ in args.adapter_args:
+        if key in OPTIONS:
+            parser.error(
+                'use {} instead of -A {}=...'.format(OPTIONS[key], key)
+            )
+
+    if args.workers > 1 and not PROCESS_POOLS:
+        parser.error('--workers larger than 1 requires Python 3.7 or newer')
+
+    args.inputs = expand_inputs(args.inputs)
+    if not args.inputs:
+        parser.error('no input files found')
+
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if not os.path.isdir(args.out_dir):
+        os.makedirs(args.out_dir)
+
+    start = default_timer()
+    failed = 0
+    for result in iter_write_many(
+            args.inputs,
+            args.out_dir,
+            workers=args.workers,
+            **dict(args.adapter_args)):
+        if result.error is None:
+            print(
+                '{:8.3f}s  {} -> {}'.format(
+                    result.seconds,
+                    result.source,
+                    result.filepath
+                )
+            )
+
+        else:
+            failed += 1
+            print(
+                '  FAILED  {}: {}'.format(result.source, result.error),
+                file=sys.stderr
+            )
+
+    print(
+        'Converted {} of {} files in {:.3f}s'.format(
+            len(args.inputs) - failed,
+            len(args.inputs),
+            default_timer() - start
+        )
+    )
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -15,7 +15,8 @@ setuptools.setup(
     url="https://github.com/apetrynet/otio-mlt-adapter",
     packages=setuptools.find_packages(),
     entry_points={
-        "opentimelineio.plugins": "otio_mlt_adapter = otio_mlt_adapter"
+        "opentimelineio.plugins": "otio_mlt_adapter = otio_mlt_adapter",
+        "console_scripts": "otio-mlt = otio_mlt_adapter.cli:main"
     },
     package_data={
         "otio_mlt_adapter": [
@@ -1,10 +1,38 @@
+import json
+import os
 import pytest
+import subprocess
+import sys
+from collections import OrderedDict
+from copy import deepcopy
+from fractions import Fraction
+from xml.dom import minidom
 from xml.etree import ElementTree as et
 
 import opentimelineio as otio
-from opentimelineio.exceptions import AdapterDoesntSupportFunctionError
 
-from otio_mlt_adapter.adapters.mlt_xml import MLTAdapter
+from otio_mlt_adapter.adapters.mlt_batch import iter_write_many, write_many
+from otio_mlt_adapter.adapters.mlt_probe import ProbeCache, probe_media
+from otio_mlt_adapter.adapters.mlt_segments import (
+    split_timeline,
+    write_segments
+)
+from otio_mlt_adapter.adapters.mlt_xml import (
+    Blank,
+    Entry,
+    MLTAdapter,
+    PROCESS_POOLS,
+    Playlist,
+    ProducerCache,
+    ProducerRegistry,
+    TrackCache,
+    TrackRanges,
+    XMLEmitter,
+    expand_transitions,
+    profile_attributes,
+    rate_fraction,
+    stack_duration
+)
 
 OTIO_VERSION = tuple(map(int, otio.__version__.split('.')))
 
@@ -1003,11 +1031,1764 @@ def test_value_to_string_conversion():
     assert isinstance(converted['str_key'], str)
 
 
-def test_raise_error_mlt_on_read():
-    with pytest.raises(AdapterDoesntSupportFunctionError) as err:
-        otio.adapters.read_from_file('bogus.mlt')
+def test_profile_attributes():
+    assert rate_fraction(23.976) == Fraction(24000, 1001)
+    assert rate_fraction(47.952) == Fraction(48000, 1001)
+    assert rate_fraction(119.88) == Fraction(120000, 1001)
+    assert rate_fraction(25.0) == 25
+    assert rate_fraction(12.5) == Fraction(25, 2)
+
+    # Resolved once and shared by exports with the same arguments and rate
+    attributes = profile_attributes({'width': 1920, 'height': '1080'}, 29.97)
+    assert attributes == (
+        ('width', '1920'),
+        ('height', '1080'),
+        ('frame_rate_den', '1001'),
+        ('frame_rate_num', '30000')
+    )
+    assert profile_attributes(
+        {'width': 1920, 'height': '1080'},
+        29.97
+    ) is attributes
+
+    # Unhashable values are converted without being kept
+    assert profile_attributes({'colorspace': [709]}) == (
+        ('colorspace', '[709]'),
+    )
+
+    timeline = otio.schema.Timeline('profile')
+    timeline.global_start_time = otio.opentime.RationalTime(0, 29.97)
+    tree = et.fromstring(
+        otio.adapters.write_to_string(timeline, 'mlt_xml', width=1920)
+    )
+    assert tree.find('profile').attrib == {
+        'decsription': 'automatic',
+        'width': '1920',
+        'frame_rate_den': '1001',
+        'frame_rate_num': '30000'
+    }
+
+
+def test_read_round_trip(tmpdir):
+    def clip(name, start, duration, url):
+        return otio.schema.Clip(
+            name=name,
+            source_range=otio.opentime.TimeRange(
+                otio.opentime.RationalTime(start, 25),
+                otio.opentime.RationalTime(duration, 25)
+            ),
+            media_reference=otio.schema.ExternalReference(
+                target_url=url,
+                available_range=otio.opentime.TimeRange(
+                    otio.opentime.RationalTime(0, 25),
+                    otio.opentime.RationalTime(500, 25)
+                )
+            )
+        )
+
+    track1 = otio.schema.Track('video1')
+    track1.append(clip('clip1', 10, 50, '/media/clip1.mov'))
+    track1.append(
+        otio.schema.Transition(
+            in_offset=otio.opentime.RationalTime(4, 25),
+            out_offset=otio.opentime.RationalTime(6, 25)
+        )
+    )
+    track1.append(clip('clip2', 20, 40, '/media/clip2.mov'))
+    track1.append(
+        otio.schema.Gap(
+            source_range=otio.opentime.TimeRange(
+                duration=otio.opentime.RationalTime(15, 25)
+            )
+        )
+    )
+    warped = clip('clip3', 0, 30, '/media/clip3.mov')
+    warped.effects.append(otio.schema.LinearTimeWarp(time_scalar=2.))
+    track1.append(warped)
+
+    track2 = otio.schema.Track('video2')
+    frozen = clip('clip4', 5, 20, '/media/clip4.mov')
+    frozen.effects.append(otio.schema.FreezeFrame())
+    track2.append(frozen)
+
+    timeline = otio.schema.Timeline()
+    timeline.global_start_time = otio.opentime.RationalTime(0, 25)
+    timeline.tracks.append(track1)
+    timeline.tracks.append(track2)
+
+    mlt_string = otio.adapters.write_to_string(timeline, 'mlt_xml')
+    read_timeline = otio.adapters.read_from_string(mlt_string, 'mlt_xml')
+
+    # The background track is left out
+    assert [track.name for track in read_timeline.tracks] == [
+        'video1',
+        'video2'
+    ]
+
+    read_track = read_timeline.tracks[0]
+    assert [type(item).__name__ for item in read_track] == [
+        'Clip',
+        'Transition',
+        'Clip',
+        'Gap',
+        'Clip'
+    ]
+
+    # MLT only keeps the duration of a transition, not how it is split
+    read_transition = read_track[1]
+    assert read_transition.in_offset + read_transition.out_offset == \
+        otio.opentime.RationalTime(10, 25)
+    assert read_track.duration() == track1.duration()
+    assert read_track[3].source_range == track1[3].source_range
+    assert read_track[4].source_range == track1[4].source_range
+
+    read_clip1 = read_track[0]
+    assert read_clip1.name == 'clip1'
+    assert read_clip1.media_reference.target_url == '/media/clip1.mov'
+    assert read_clip1.media_reference.available_range == \
+        track1[0].media_reference.available_range
+
+    read_warped = read_track[4]
+    assert read_warped.name == 'clip3'
+    assert read_warped.media_reference.target_url == '/media/clip3.mov'
+    assert read_warped.effects[0].time_scalar == 2.
+
+    read_frozen = read_timeline.tracks[1][0]
+    assert read_frozen.name == 'clip4'
+    assert isinstance(read_frozen.effects[0], otio.schema.FreezeFrame)
+
+    assert otio.adapters.write_to_string(
+        read_timeline,
+        'mlt_xml'
+    ) == mlt_string
+
+    filepath = tmpdir.join('round_trip.mlt').strpath
+    otio.adapters.write_to_file(timeline, filepath, 'mlt_xml')
+    assert otio.adapters.read_from_file(
+        filepath,
+        'mlt_xml'
+    ).tracks[0].duration() == track1.duration()
+
+
+def test_read_mlt_with_time_strings():
+    # Laid out like Shotcut projects, with a transparent background
+    mlt_string = """<?xml version="1.0" encoding="utf-8"?>
+<mlt>
+  <profile frame_rate_num="30000" frame_rate_den="1001"/>
+  <producer id="black" in="00:00:00.000" out="00:00:09.976">
+    <property name="length">00:00:10.010</property>
+    <property name="eof">pause</property>
+    <property name="resource">0</property>
+    <property name="aspect_ratio">1</property>
+    <property name="mlt_service">color</property>
+    <property name="mlt_image_format">rgba</property>
+    <property name="set.test_audio">0</property>
+  </producer>
+  <playlist id="background">
+    <entry producer="black" in="00:00:00.000" out="00:00:09.976"/>
+  </playlist>
+  <chain id="chain0" in="00:00:00.000" out="00:00:09.976">
+    <property name="resource">/media/shot1.mp4</property>
+    <property name="shotcut:caption">shot1</property>
+  </chain>
+  <producer id="producer0">
+    <property name="resource">/media/frames/img.%05d.png?begin=7</property>
+    <property name="mlt_service">pixbuf</property>
+  </producer>
+  <playlist id="playlist0">
+    <entry producer="chain0" in="00:00:01.001" out="00:00:02.002"/>
+    <blank length="10"/>
+    <entry producer="producer0" in="0" out="29"/>
+  </playlist>
+  <playlist id="playlist1">
+    <entry producer="chain0" in="0" out="9"/>
+  </playlist>
+  <tractor id="tractor0">
+    <track producer="background"/>
+    <track producer="playlist0"/>
+    <track producer="playlist1" hide="video"/>
+  </tractor>
+</mlt>
+"""
+    timeline = otio.adapters.read_from_string(mlt_string, 'mlt_xml')
+    rate = 30000 / 1001.
+
+    assert timeline.global_start_time.rate == rate
+    assert len(timeline.tracks) == 2
+    assert timeline.tracks[1].kind == otio.schema.TrackKind.Audio
+
+    clip1, gap, clip2 = timeline.tracks[0]
+    assert clip1.name == 'shot1'
+    assert clip1.source_range == otio.opentime.TimeRange(
+        otio.opentime.RationalTime(30, rate),
+        otio.opentime.RationalTime(31, rate)
+    )
+    assert clip1.media_reference.available_range.duration.value == 300
+    assert gap.source_range.duration.value == 10
+
+    if OTIO_VERSION >= (0, 13, 0):
+        reference = clip2.media_reference
+        assert reference.target_url_base == '/media/frames/'
+        assert reference.name_prefix == 'img.'
+        assert reference.name_suffix == '.png'
+        assert reference.frame_zero_padding == 5
+        assert reference.start_frame == 7
+
+
+def test_read_shotcut_crossfade():
+    # Shotcut crossfades video and audio with a luma and a mix transition
+    mlt_string = """<?xml version="1.0" encoding="utf-8"?>
+<mlt>
+  <profile frame_rate_num="25" frame_rate_den="1"/>
+  <producer id="black" in="00:00:00.000" out="00:00:06.960">
+    <property name="length">00:00:07.000</property>
+    <property name="eof">pause</property>
+    <property name="resource">0</property>
+    <property name="mlt_service">color</property>
+  </producer>
+  <playlist id="background">
+    <entry producer="black" in="00:00:00.000" out="00:00:06.960"/>
+  </playlist>
+  <chain id="chain0" out="00:00:09.960">
+    <property name="resource">/media/shot1.mp4</property>
+    <property name="shotcut:caption">shot1</property>
+  </chain>
+  <chain id="chain1" out="00:00:09.960">
+    <property name="resource">/media/shot2.mp4</property>
+    <property name="shotcut:caption">shot2</property>
+  </chain>
+  <tractor id="tractor0" in="00:00:00.000" out="00:00:00.960">
+    <property name="shotcut:transition">lumaMix</property>
+    <track producer="chain0" in="00:00:02.000" out="00:00:02.960"/>
+    <track producer="chain1" in="00:00:00.000" out="00:00:00.960"/>
+    <transition id="transition0">
+      <property name="a_track">0</property>
+      <property name="b_track">1</property>
+      <property name="factory">loader</property>
+      <property name="mlt_service">luma</property>
+    </transition>
+    <transition id="transition1">
+      <property name="a_track">0</property>
+      <property name="b_track">1</property>
+      <property name="start">-1</property>
+      <property name="accepts_blanks">1</property>
+      <property name="mlt_service">mix</property>
+    </transition>
+  </tractor>
+  <playlist id="playlist0">
+    <property name="shotcut:video">1</property>
+    <entry producer="chain0" in="00:00:00.000" out="00:00:01.960"/>
+    <entry producer="tractor0" in="00:00:00.000" out="00:00:00.960"/>
+    <entry producer="chain1" in="00:00:01.000" out="00:00:03.960"/>
+  </playlist>
+  <tractor id="tractor1">
+    <track producer="background"/>
+    <track producer="playlist0"/>
+  </tractor>
+</mlt>
+"""
+    timeline = otio.adapters.read_from_string(mlt_string, 'mlt_xml')
+
+    assert len(timeline.tracks) == 1
+    track = timeline.tracks[0]
+    assert track.kind == otio.schema.TrackKind.Video
+
+    clip1, transition, clip2 = track
+    assert isinstance(transition, otio.schema.Transition)
+    assert transition.transition_type == \
+        otio.schema.TransitionTypes.SMPTE_Dissolve
+    assert transition.in_offset.value + transition.out_offset.value == 25
+
+    # The clip after the crossfade gets back the frames mixed into it
+    assert clip1.source_range.duration.value == 50
+    assert clip2.source_range == otio.opentime.TimeRange(
+        otio.opentime.RationalTime(0, 25),
+        otio.opentime.RationalTime(100, 25)
+    )
+
+
+def test_write_to_file(tmpdir):
+    clip1 = otio.schema.Clip(
+        name='clip1',
+        source_range=otio.opentime.TimeRange(
+            otio.opentime.RationalTime(0, 30),
+            otio.opentime.RationalTime(50, 30)
+        )
+    )
+
+    clip2 = otio.schema.Clip(
+        name='clip2',
+        source_range=otio.opentime.TimeRange(
+            otio.opentime.RationalTime(0, 30),
+            otio.opentime.RationalTime(500, 30)
+        )
+    )
+
+    dissolve = otio.schema.Transition(
+        name='dissolve',
+        in_offset=otio.opentime.RationalTime(30, 30),
+        out_offset=otio.opentime.RationalTime(0, 30)
+    )
+
+    timeline = otio.schema.Timeline()
+    track1 = otio.schema.Track('video1')
+    track1.append(clip1)
+    track1.append(dissolve)
+    track1.append(clip2)
+
+    track2 = otio.schema.Track('audio1', kind=otio.schema.TrackKind.Audio)
+    track2.append(clip1.clone())
+
+    timeline.tracks.append(track1)
+    timeline.tracks.append(track2)
+
+    path = str(tmpdir.join('timeline.mlt'))
+    otio.adapters.write_to_file(timeline, path)
+
+    tree = et.parse(path).getroot()
+    reference = et.fromstring(
+        otio.adapters.write_to_string(timeline, 'mlt_xml')
+    )
+
+    # Same elements, but producers are written as soon as they're used
+    for tag in ('producer', 'playlist', 'tractor'):
+        assert (
+            sorted(e.attrib['id'] for e in tree.findall(tag)) ==
+            sorted(e.attrib['id'] for e in reference.findall(tag))
+        )
+
+    # Producers are declared before the playlists referencing them
+    ids = [e.attrib.get('id') for e in tree]
+    assert ids.index('clip1') < ids.index('video1')
+    assert ids.index('transition_tractor0') < ids.index('video1')
+
+    # Main tractor is last
+    assert tree[-1].attrib['id'] == 'tractor0'
+
+    tracks = tree.findall('./tractor/[@id="tractor0"]/multitrack/track')
+    assert [t.attrib['producer'] for t in tracks] == [
+        'background', 'audio1', 'video1'
+    ]
+
+    transition_e = tree.find('./tractor/[@id="transition_tractor0"]')
+    assert len(transition_e) == 3
+
+
+def test_pretty_argument():
+    clip1 = otio.schema.Clip(
+        name='clip1',
+        source_range=otio.opentime.TimeRange(
+            otio.opentime.RationalTime(0, 30),
+            otio.opentime.RationalTime(50, 30)
+        )
+    )
+    track = otio.schema.Track('video1')
+    track.append(clip1)
+
+    pretty = otio.adapters.write_to_string(track, 'mlt_xml')
+    compact = otio.adapters.write_to_string(track, 'mlt_xml', pretty=False)
+
+    # Indented output matches minidom's pretty printer
+    assert '\n' not in compact
+    reference = minidom.parseString(compact).toprettyxml(indent='    ')
+    assert pretty == reference
 
+    # Command line arguments come in as strings
     assert (
-        "Sorry, mlt_xml doesn't support read_from_file." ==
-        str(err.value)
+        otio.adapters.write_to_string(track, 'mlt_xml', pretty='False') ==
+        compact
     )
+
+
+def test_producer_order():
+    track = otio.schema.Track('video1')
+    for index in range(5):
+        clip = otio.schema.Clip(
+            name='clip{}'.format(index),
+            source_range=otio.opentime.TimeRange(
+                otio.opentime.RationalTime(0, 30),
+                otio.opentime.RationalTime(10, 30)
+            )
+        )
+        track.append(clip)
+        track.append(clip.clone())
+
+    tree = et.fromstring(otio.adapters.write_to_string(track, 'mlt_xml'))
+
+    # Producers appear once and in the order they were first used
+    producers = [e.attrib['id'] for e in tree.findall('./producer')]
+    assert producers == ['solid_black'] + [
+        'clip{}'.format(index) for index in range(5)
+    ]
+
+    # Profile first, main tractor last
+    assert tree[0].tag == 'profile'
+    assert tree[-1].attrib['id'] == 'tractor0'
+
+
+def test_producer_registry():
+    registry = ProducerRegistry()
+    producer_e = et.Element('producer', id='clip1')
+
+    assert registry.setdefault('clip1', producer_e) is producer_e
+    assert (
+        registry.setdefault('clip1', et.Element('producer', id='clip1')) is
+        producer_e
+    )
+    assert registry.setdefault('clip1', producer_e, audio=True) is producer_e
+    assert 'clip1' in registry.audio
+
+    assert registry.register(producer_e)
+    assert not registry.register(producer_e)
+    assert len(registry) == 1
+
+    other_e = et.Element('producer', id='clip2')
+    registry.register(other_e)
+    assert list(registry) == [producer_e, other_e]
+    assert registry.ordered(1) == [other_e]
+
+
+def test_producer_info():
+    registry = ProducerRegistry()
+    producer_e = et.Element('producer', id='clip1')
+    for name in ('length', 'eof', 'resource', 'mlt_service'):
+        et.SubElement(producer_e, 'property', name=name).text = name
+
+    info = registry.info(producer_e)
+    assert info.resource.text == 'resource'
+    assert info.mlt_service.text == 'mlt_service'
+    assert registry.info(producer_e) is info
+
+
+def test_expand_transitions():
+    track = otio.schema.Track('dissolves')
+    track.append(
+        otio.schema.Transition(
+            name='fadeIn',
+            in_offset=otio.opentime.RationalTime(0, 30),
+            out_offset=otio.opentime.RationalTime(10, 30)
+        )
+    )
+    for index in range(4):
+        track.append(
+            otio.schema.Clip(
+                name='clip{}'.format(index),
+                source_range=otio.opentime.TimeRange(
+                    otio.opentime.RationalTime(10 * index, 30),
+                    otio.opentime.RationalTime(100, 30)
+                )
+            )
+        )
+        track.append(
+            otio.schema.Transition(
+                name='dissolve',
+                in_offset=otio.opentime.RationalTime(5, 30),
+                out_offset=otio.opentime.RationalTime(10, 30)
+            )
+        )
+
+    expected = otio.algorithms.track_with_expanded_transitions(track)
+    result = list(expand_transitions(track))
+    assert len(result) == len(expected)
+
+    for entry, reference in zip(result, expected):
+        if isinstance(reference, tuple):
+            assert isinstance(entry, tuple)
+            assert entry[1].item is reference[1]
+            assert entry[1].duration == reference[1].duration().value
+            pairs = [(entry[0], reference[0]), (entry[2], reference[2])]
+
+        else:
+            pairs = [(entry, reference)]
+
+        for trimmed, copy in pairs:
+            trimmed_range = copy.trimmed_range()
+            assert trimmed.name == copy.name
+            assert trimmed.in_ == trimmed_range.start_time.value
+            assert trimmed.out_ == trimmed_range.end_time_inclusive().value
+            assert trimmed.duration == trimmed_range.duration.value
+
+            # Items in the track are referenced, not copied
+            if not isinstance(copy, otio.schema.Gap):
+                assert trimmed.item.parent() is track
+
+
+def test_time_warp_producer_reuse():
+    path = '/some/path/to/media_file.mov'
+    track = otio.schema.Track('speedup')
+    for index in range(3):
+        clip = otio.schema.Clip(
+            name='clip',
+            source_range=otio.opentime.TimeRange(
+                otio.opentime.RationalTime(index * 10, 30),
+                otio.opentime.RationalTime(10, 30)
+            ),
+            media_reference=otio.schema.ExternalReference(target_url=path)
+        )
+        clip.effects.append(otio.schema.LinearTimeWarp(time_scalar=2.))
+        track.append(clip)
+
+    mlt = MLTAdapter(track)
+    tree = et.fromstring(mlt.create_mlt())
+
+    # One derived producer shared by all retimed clips
+    producers = tree.findall('./producer/[@id="2.0:clip"]')
+    assert len(producers) == 1
+    assert (
+        producers[0].find('./property/[@name="resource"]').text ==
+        '2.0:{}'.format(path)
+    )
+
+    # The original producer is left untouched
+    producer_e = tree.find('./producer/[@id="clip"]')
+    assert producer_e.find('./property/[@name="resource"]').text == path
+    assert producer_e.find('./property/[@name="mlt_service"]') is None
+
+    playlist_e = tree.find('./playlist/[@id="speedup"]')
+    assert [e.attrib['producer'] for e in playlist_e] == ['2.0:clip'] * 3
+
+
+def test_track_ranges():
+    track = otio.schema.Track('mixed_rates')
+    track.append(
+        otio.schema.Transition(
+            in_offset=otio.opentime.RationalTime(5, 24),
+            out_offset=otio.opentime.RationalTime(10, 30)
+        )
+    )
+    track.append(
+        otio.schema.Clip(
+            name='clip1',
+            source_range=otio.opentime.TimeRange(
+                otio.opentime.RationalTime(10, 24),
+                otio.opentime.RationalTime(100.5, 25)
+            )
+        )
+    )
+    track.append(
+        otio.schema.Gap(
+            source_range=otio.opentime.TimeRange(
+                otio.opentime.RationalTime(0, 30),
+                otio.opentime.RationalTime(48, 30)
+            )
+        )
+    )
+    track.append(
+        otio.schema.Transition(
+            in_offset=otio.opentime.RationalTime(12, 30),
+            out_offset=otio.opentime.RationalTime(8, 24)
+        )
+    )
+
+    stack = otio.schema.Stack()
+    stack.append(track)
+    other = otio.schema.Track()
+    other.append(otio.schema.Gap(
+        source_range=otio.opentime.TimeRange(
+            otio.opentime.RationalTime(0, 24),
+            otio.opentime.RationalTime(100, 24)
+        )
+    ))
+    stack.append(other)
+
+    ranges = [TrackRanges(child) for child in stack]
+
+    # Plain float arithmetic matches OTIO's
+    assert ranges[0].duration == (
+        track.duration().value,
+        track.duration().rate
+    )
+    assert stack_duration(stack, ranges) == stack.duration().value
+
+    assert len(ranges[0]) == 4
+    assert ranges[0].start(1) == (10, 24)
+    assert ranges[0].duration_at(3) == (8, 24)
+
+
+def test_parallel_assembly():
+    path = '/some/path/to/media_file.mov'
+    timeline = otio.schema.Timeline()
+
+    for track_index in range(4):
+        kind = otio.schema.TrackKind.Video
+        if track_index == 2:
+            kind = otio.schema.TrackKind.Audio
+
+        track = otio.schema.Track('track{}'.format(track_index), kind=kind)
+        for clip_index in range(3):
+            clip = otio.schema.Clip(
+                name='clip{}'.format(clip_index),
+                source_range=otio.opentime.TimeRange(
+                    otio.opentime.RationalTime(clip_index * 10, 30),
+                    otio.opentime.RationalTime(50, 30)
+                ),
+                media_reference=otio.schema.ExternalReference(
+                    target_url=path
+                )
+            )
+            if clip_index == track_index:
+                clip.effects.append(
+                    otio.schema.LinearTimeWarp(time_scalar=2.)
+                )
+
+            track.append(clip)
+            track.append(
+                otio.schema.Transition(
+                    in_offset=otio.opentime.RationalTime(5, 30),
+                    out_offset=otio.opentime.RationalTime(5, 30)
+                )
+            )
+
+        track.append(
+            otio.schema.Gap(
+                source_range=otio.opentime.TimeRange(
+                    otio.opentime.RationalTime(0, 30),
+                    otio.opentime.RationalTime(track_index * 10, 30)
+                )
+            )
+        )
+        timeline.tracks.append(track)
+
+    serial = otio.adapters.write_to_string(timeline, 'mlt_xml')
+    if not PROCESS_POOLS:
+        with pytest.raises(ValueError):
+            otio.adapters.write_to_string(timeline, 'mlt_xml', workers=2)
+
+        return
+
+    parallel = otio.adapters.write_to_string(timeline, 'mlt_xml', workers=2)
+
+    assert parallel == serial
+
+    tree = et.fromstring(parallel)
+    transitions = tree.findall('./tractor/transition/..')
+    assert [e.attrib['id'] for e in transitions] == [
+        'transition_tractor{}'.format(index) for index in range(12)
+    ]
+
+
+def test_incremental_export():
+    timeline = otio.schema.Timeline()
+    for track_index in range(3):
+        track = otio.schema.Track('track{}'.format(track_index))
+        for clip_index in range(3):
+            track.append(
+                otio.schema.Clip(
+                    name='clip{}_{}'.format(track_index, clip_index),
+                    source_range=otio.opentime.TimeRange(
+                        otio.opentime.RationalTime(0, 30),
+                        otio.opentime.RationalTime(50, 30)
+                    ),
+                    media_reference=otio.schema.ExternalReference(
+                        target_url='/media/{}_{}.mov'.format(
+                            track_index,
+                            clip_index
+                        )
+                    )
+                )
+            )
+            track.append(
+                otio.schema.Transition(
+                    in_offset=otio.opentime.RationalTime(5, 30),
+                    out_offset=otio.opentime.RationalTime(5, 30)
+                )
+            )
+
+        track.pop()
+        timeline.tracks.append(track)
+
+    cache = TrackCache()
+    for pretty in (True, False):
+        assert otio.adapters.write_to_string(
+            timeline,
+            'mlt_xml',
+            pretty=pretty,
+            cache=cache
+        ) == otio.adapters.write_to_string(
+            timeline,
+            'mlt_xml',
+            pretty=pretty
+        )
+
+    assert cache.hits == 0
+    assert cache.misses == 6
+
+    clip = timeline.tracks[1][2]
+    clip.source_range = otio.opentime.TimeRange(
+        otio.opentime.RationalTime(10, 30),
+        otio.opentime.RationalTime(30, 30)
+    )
+
+    mlt_string = otio.adapters.write_to_string(
+        timeline,
+        'mlt_xml',
+        cache=cache
+    )
+    assert mlt_string == otio.adapters.write_to_string(timeline, 'mlt_xml')
+
+    # Only the trimmed track is assembled again
+    assert cache.hits == 2
+    assert cache.misses == 7
+
+
+def test_export_stats(tmpdir):
+    track = otio.schema.Track('video')
+    for index in range(3):
+        clip = otio.schema.Clip(
+            name='clip{}'.format(index),
+            source_range=otio.opentime.TimeRange(
+                otio.opentime.RationalTime(0, 30),
+                otio.opentime.RationalTime(50, 30)
+            ),
+            media_reference=otio.schema.ExternalReference(
+                target_url='/media/clip.mov'
+            )
+        )
+        if index == 1:
+            clip.effects.append(otio.schema.LinearTimeWarp(time_scalar=2.))
+
+        track.append(clip)
+
+    track.insert(
+        1,
+        otio.schema.Transition(
+            in_offset=otio.opentime.RationalTime(5, 30),
+            out_offset=otio.opentime.RationalTime(5, 30)
+        )
+    )
+
+    collected = []
+    mlt_string = otio.adapters.write_to_string(
+        track,
+        'mlt_xml',
+        profile=collected.append
+    )
+    assert mlt_string == otio.adapters.write_to_string(track, 'mlt_xml')
+
+    stats = collected[0]
+    assert list(stats.phases) == ['prepare', 'assemble', 'serialize']
+    assert stats.transitions == 1
+    assert stats.effects == 1
+    assert stats.calls['get_producer'] == 6
+
+    tree = et.fromstring(mlt_string)
+    assert stats.producers == len(tree.findall('producer'))
+    assert stats.elements == len(list(tree.iter()))
+    assert 'transitions: 1' in stats.report()
+
+    # Streaming reports the same counts
+    filepath = tmpdir.join('profiled.mlt').strpath
+    otio.adapters.write_to_file(
+        track,
+        filepath,
+        'mlt_xml',
+        profile=collected.append
+    )
+    assert collected[1].transitions == stats.transitions
+    assert collected[1].producers == stats.producers
+
+    mlt_adapter = MLTAdapter(track, profile=True)
+    mlt_adapter.create_mlt()
+    assert mlt_adapter.stats.calls == stats.calls
+
+    assert MLTAdapter(track).stats is None
+
+
+def test_write_many(tmpdir):
+    timelines = []
+    for index in range(3):
+        timeline = otio.schema.Timeline('cut')
+        track = otio.schema.Track('video')
+        for clip_index in range(3):
+            track.append(
+                otio.schema.Clip(
+                    name='clip{}'.format(clip_index),
+                    source_range=otio.opentime.TimeRange(
+                        otio.opentime.RationalTime(index * 10, 30),
+                        otio.opentime.RationalTime(50, 30)
+                    ),
+                    media_reference=otio.schema.ExternalReference(
+                        target_url='/media/clip{}.mov'.format(clip_index)
+                    )
+                )
+            )
+
+        timeline.tracks.append(track)
+        timelines.append(timeline)
+
+    otio_path = tmpdir.join('edit.otio').strpath
+    otio.adapters.write_to_file(timelines[0], otio_path)
+
+    # Producers of media shared between timelines are reused
+    producer_cache = ProducerCache()
+    for timeline in timelines:
+        assert otio.adapters.write_to_string(
+            timeline,
+            'mlt_xml',
+            producer_cache=producer_cache
+        ) == otio.adapters.write_to_string(timeline, 'mlt_xml')
+
+    assert producer_cache.misses == 3
+    assert producer_cache.hits == 6
+
+    # Streamed files are compared with files written one by one
+    expected = []
+    for index, timeline in enumerate(timelines + timelines[:1]):
+        filepath = tmpdir.join('single{}.mlt'.format(index)).strpath
+        otio.adapters.write_to_file(timeline, filepath, 'mlt_xml')
+        with open(filepath) as fileobj:
+            expected.append(fileobj.read())
+
+    for workers in (1, 2) if PROCESS_POOLS else (1,):
+        out_dir = tmpdir.mkdir('workers{}'.format(workers))
+        filepaths = write_many(
+            timelines + [otio_path],
+            out_dir.strpath,
+            workers=workers
+        )
+        assert [os.path.basename(filepath) for filepath in filepaths] == [
+            'cut.mlt',
+            'cut_1.mlt',
+            'cut_2.mlt',
+            'edit.mlt'
+        ]
+        for filepath, mlt_string in zip(filepaths, expected):
+            with open(filepath) as fileobj:
+                assert fileobj.read() == mlt_string
+
+    # Names made up for files of the same name don't overwrite others
+    sources = []
+    for name in ('a_2', 'x/a', 'y/a'):
+        source = tmpdir.join('sources', name + '.otio')
+        source.dirpath().ensure(dir=True)
+        otio.adapters.write_to_file(timelines[0], source.strpath)
+        sources.append(source.strpath)
+
+    out_dir = tmpdir.mkdir('same_names')
+    filepaths = write_many(sources, out_dir.strpath)
+    assert [os.path.basename(filepath) for filepath in filepaths] == [
+        'a_2.mlt',
+        'a.mlt',
+        'a_3.mlt'
+    ]
+
+
+@pytest.mark.skipif(
+    sys.version_info < (3, 7),
+    reason='asyncio API requires Python 3.7'
+)
+def test_write_async(tmpdir):
+    import asyncio
+    from otio_mlt_adapter.adapters.mlt_async import (
+        write_to_stream,
+        write_to_string_async
+    )
+
+    timeline = otio.schema.Timeline('async')
+    for track_index in range(4):
+        track = otio.schema.Track('track{}'.format(track_index))
+        for clip_index in range(5):
+            track.append(
+                otio.schema.Clip(
+                    name='clip{}'.format(clip_index),
+                    source_range=otio.opentime.TimeRange(
+                        otio.opentime.RationalTime(0, 30),
+                        otio.opentime.RationalTime(50, 30)
+                    ),
+                    media_reference=otio.schema.ExternalReference(
+                        target_url='/media/clip{}.mov'.format(clip_index)
+                    )
+                )
+            )
+
+        timeline.tracks.append(track)
+
+    filepath = tmpdir.join('sync.mlt').strpath
+    otio.adapters.write_to_file(timeline, filepath, 'mlt_xml')
+    with open(filepath) as fileobj:
+        expected = fileobj.read()
+
+    class Stream(object):
+        def __init__(self):
+            self.writes = []
+            self.drained = 0
+
+        def write(self, data):
+            self.writes.append(data)
+
+        def drain(self):
+            self.drained += 1
+            return asyncio.sleep(0)
+
+    ticks = []
+
+    def export(coroutine):
+        loop = asyncio.new_event_loop()
+        del ticks[:]
+
+        # Counts how often the event loop gets to run other callbacks
+        def tick():
+            ticks.append(None)
+            loop.call_soon(tick)
+
+        try:
+            loop.call_soon(tick)
+            return loop.run_until_complete(coroutine)
+
+        finally:
+            loop.close()
+
+    for offload in (False, True):
+        stream = Stream()
+        export(write_to_stream(timeline, stream, offload=offload))
+        assert ''.join(stream.writes) == expected
+        # Header, background track, one write per track and the main tractor
+        assert len(stream.writes) == stream.drained == 7
+        assert len(ticks) >= 5
+
+        assert export(
+            write_to_string_async(timeline, offload=offload)
+        ) == expected
+
+
+def test_command_line(tmpdir, capsys):
+    from otio_mlt_adapter import cli
+
+    edits = tmpdir.mkdir('edits')
+    for index in range(2):
+        timeline = otio.schema.Timeline('cut{}'.format(index))
+        track = otio.schema.Track('video')
+        track.append(
+            otio.schema.Clip(
+                name='clip',
+                source_range=otio.opentime.TimeRange(
+                    otio.opentime.RationalTime(index, 25),
+                    otio.opentime.RationalTime(50, 25)
+                ),
+                media_reference=otio.schema.ExternalReference(
+                    target_url='/media/clip.mov'
+                )
+            )
+        )
+        timeline.tracks.append(track)
+        otio.adapters.write_to_file(
+            timeline,
+            edits.join('cut{}.otio'.format(index)).strpath
+        )
+
+    edits.join('broken.otio').write('not a timeline')
+    edits.join('notes.txt').write('skipped')
+
+    assert cli.adapter_arg('pretty=False') == ('pretty', False)
+    assert cli.adapter_arg('colorspace=709') == ('colorspace', 709)
+    assert cli.adapter_arg('image_producer=pixbuf') == (
+        'image_producer',
+        'pixbuf'
+    )
+    assert cli.expand_inputs(
+        [edits.strpath, edits.join('cut*.otio').strpath]
+    ) == [
+        edits.join(filename).strpath
+        for filename in ('broken.otio', 'cut0.otio', 'cut1.otio')
+    ]
+
+    # Arguments of the batch itself are options of their own
+    with pytest.raises(SystemExit):
+        cli.parse_args([edits.strpath, '-A', 'workers=2'])
+
+    assert '--workers' in capsys.readouterr()[1]
+
+    # Without process pools files are converted one by one
+    if not PROCESS_POOLS:
+        assert cli.parse_args([edits.strpath]).workers == 1
+        with pytest.raises(SystemExit):
+            cli.parse_args([edits.strpath, '-w', '2'])
+
+        assert 'Python 3.7' in capsys.readouterr()[1]
+
+    # Failures are reported without stopping the other conversions
+    out_dir = tmpdir.join('render')
+    for workers in (1, 2) if PROCESS_POOLS else (1,):
+        assert cli.main(
+            [
+                edits.strpath,
+                '-o', out_dir.strpath,
+                '-w', str(workers),
+                '-A', 'pretty=False'
+            ]
+        ) == 1
+
+        out, err = capsys.readouterr()
+        assert 'Converted 2 of 3 files' in out
+        assert out.count(out_dir.strpath) == 2
+        assert 'FAILED  {}'.format(edits.join('broken.otio').strpath) in err
+
+        for index in range(2):
+            name = 'cut{}'.format(index)
+            expected = tmpdir.join(name + '.mlt')
+            otio.adapters.write_to_file(
+                otio.adapters.read_from_file(
+                    edits.join(name + '.otio').strpath
+                ),
+                expected.strpath,
+                'mlt_xml',
+                pretty=False
+            )
+            assert out_dir.join(name + '.mlt').read() == expected.read()
+
+        out_dir.remove()
+
+    results = list(
+        iter_write_many(
+            [edits.join('cut0.otio').strpath, 'missing.otio'],
+            tmpdir.strpath
+        )
+    )
+    assert [result.index for result in results] == [0, 1]
+    assert results[0].error is None
+    assert results[0].seconds > 0
+    assert results[1].filepath is None
+    assert results[1].error
+
+
+def test_playlist_records():
+    playlist = Playlist('video')
+    playlist.append(Entry('clip&1', 0, 49.0))
+    playlist.append(Blank(10))
+    playlist.insert(0, Entry('nested'))
+
+    # Records are written the same way as the elements they stand in for
+    playlist_e = et.Element('playlist', id='video')
+    et.SubElement(playlist_e, 'entry', producer='nested')
+    et.SubElement(
+        playlist_e,
+        'entry',
+        attrib={'in': '0', 'out': '49.0', 'producer': 'clip&1'}
+    )
+    et.SubElement(playlist_e, 'blank', length='10')
+
+    for pretty in (True, False):
+        for records, elements in (
+                (playlist, playlist_e),
+                (Playlist('empty'), et.Element('playlist', id='empty'))):
+            emitter = XMLEmitter(pretty)
+            chunks = []
+            emitter.emit(records, chunks.append, emitter.indent)
+            expected = []
+            emitter.emit(elements, expected.append, emitter.indent)
+
+            assert ''.join(chunks) == ''.join(expected)
+            assert emitter.elements == 2 * (len(elements) + 1)
+
+    clip = otio.schema.Clip(
+        name='clip1',
+        source_range=otio.opentime.TimeRange(
+            otio.opentime.RationalTime(0, 30),
+            otio.opentime.RationalTime(50, 30)
+        )
+    )
+    clip.effects.append(otio.schema.LinearTimeWarp(time_scalar=2.))
+    track = otio.schema.Track('video')
+    track.append(clip)
+
+    mlt_adapter = MLTAdapter(track)
+    tree = et.fromstring(mlt_adapter.create_mlt())
+    entry_e = tree.find('./playlist/[@id="video"]/entry')
+
+    background, video = mlt_adapter.playlists
+    assert len(background) == 1
+    assert [entry.producer for entry in video] == ['2.0:clip1']
+    assert entry_e.attrib['producer'] == '2.0:clip1'
+
+
+def _playlist_frames(playlist_e):
+    # Producer and source frame shown at each frame of a playlist
+    frames = []
+    for child_e in playlist_e:
+        if child_e.tag == 'blank':
+            frames.extend([None] * int(float(child_e.attrib['length'])))
+            continue
+
+        frames.extend(
+            (child_e.attrib['producer'], frame)
+            for frame in range(
+                int(float(child_e.attrib['in'])),
+                int(float(child_e.attrib['out'])) + 1
+            )
+        )
+
+    return frames
+
+
+def test_coalesce_playlists():
+    track = otio.schema.Track('video')
+    for start, duration, name in (
+            (0, 50, 'shot'),
+            (50, 30, 'shot'),
+            (80, 10, 'shot'),
+            (None, 10, None),
+            (None, 20, None),
+            (200, 40, 'shot'),
+            (0, 40, 'other'),
+            (40, 40, 'other'),
+            (80, 40, 'other')):
+        source_range = otio.opentime.TimeRange(
+            otio.opentime.RationalTime(start or 0, 30),
+            otio.opentime.RationalTime(duration, 30)
+        )
+        if name is None:
+            track.append(otio.schema.Gap(source_range=source_range))
+            continue
+
+        track.append(
+            otio.schema.Clip(
+                name=name,
+                source_range=source_range,
+                media_reference=otio.schema.ExternalReference(
+                    target_url='/media/{}.mov'.format(name)
+                )
+            )
+        )
+
+    track.insert(
+        8,
+        otio.schema.Transition(
+            in_offset=otio.opentime.RationalTime(5, 30),
+            out_offset=otio.opentime.RationalTime(5, 30)
+        )
+    )
+
+    mlt_string = otio.adapters.write_to_string(track, 'mlt_xml')
+    coalesced = otio.adapters.write_to_string(
+        track,
+        'mlt_xml',
+        coalesce=True
+    )
+
+    playlist_e = et.fromstring(mlt_string).find('./playlist/[@id="video"]')
+    coalesced_e = et.fromstring(coalesced).find('./playlist/[@id="video"]')
+
+    # Runs of the same shot and the gaps are merged, the transition keeps
+    # the clips on either side of it apart
+    assert len(playlist_e) == 10
+    assert [child_e.tag for child_e in coalesced_e] == [
+        'entry', 'blank', 'entry', 'entry', 'entry', 'entry'
+    ]
+    assert coalesced_e[0].attrib['out'] == '89.0'
+    assert coalesced_e[1].attrib['length'] == '30.0'
+    assert coalesced_e[3].attrib['out'] == '74.0'
+    assert coalesced_e[5].attrib['in'] == '85.0'
+
+    # Every frame shows the same source frame
+    assert _playlist_frames(coalesced_e) == _playlist_frames(playlist_e)
+
+    timeline = otio.schema.Timeline()
+    timeline.tracks.append(track)
+    timeline.tracks.append(deepcopy(track))
+    if PROCESS_POOLS:
+        assert otio.adapters.write_to_string(
+            timeline,
+            'mlt_xml',
+            coalesce=True,
+            workers=2
+        ) == otio.adapters.write_to_string(
+            timeline,
+            'mlt_xml',
+            coalesce=True
+        )
+
+
+def test_shared_solid_producer():
+    track = otio.schema.Track('video')
+    for index in range(4):
+        track.append(
+            otio.schema.Gap(
+                source_range=otio.opentime.TimeRange(
+                    otio.opentime.RationalTime(0, 30),
+                    otio.opentime.RationalTime(10 * (index + 1), 30)
+                )
+            )
+        )
+        track.append(
+            otio.schema.Clip(
+                name='clip{}'.format(index),
+                source_range=otio.opentime.TimeRange(
+                    otio.opentime.RationalTime(0, 30),
+                    otio.opentime.RationalTime(50, 30)
+                )
+            )
+        )
+        track.append(
+            otio.schema.Transition(
+                in_offset=otio.opentime.RationalTime(5, 30),
+                out_offset=otio.opentime.RationalTime(5, 30)
+            )
+        )
+
+    track.pop()
+
+    mlt_adapter = MLTAdapter(track)
+    created = []
+    create_solid = mlt_adapter.create_solid
+
+    def counted_create_solid(color, length):
+        created.append((color, length))
+        return create_solid(color, length)
+
+    mlt_adapter.create_solid = counted_create_solid
+    tree = et.fromstring(mlt_adapter.create_mlt())
+
+    # Background, gaps and transitions all use the one timeline long solid
+    duration = track.duration().value
+    assert created == [('black', duration)]
+
+    solids_e = tree.findall('./producer/[@id="solid_black"]')
+    assert len(solids_e) == 1
+    assert float(solids_e[0].attrib['out']) == duration - 1
+
+    # Each transition fades into a gap
+    assert [
+        tractor_e.findall('track')[1].attrib['producer']
+        for tractor_e in tree.findall('./tractor')
+        if tractor_e.attrib['id'].startswith('transition_tractor')
+    ] == ['solid_black'] * 3
+
+    solid_e = MLTAdapter(track).get_solid('black')
+    assert float(solid_e.attrib['out']) == duration - 1
+
+
+def test_probe_media(tmpdir):
+    paths = []
+    for name in ('a', 'b'):
+        media = tmpdir.join('{}.mov'.format(name))
+        media.write('frames')
+        paths.append(media.strpath)
+
+    track = otio.schema.Track('video')
+    for index, target_url in enumerate(
+            [paths[0], 'file://' + paths[1], paths[0], '/missing.mov']):
+        track.append(
+            otio.schema.Clip(
+                name='clip{}'.format(index),
+                source_range=otio.opentime.TimeRange(
+                    otio.opentime.RationalTime(0, 30),
+                    otio.opentime.RationalTime(50, 30)
+                ),
+                media_reference=otio.schema.ExternalReference(
+                    target_url=target_url
+                )
+            )
+        )
+
+    probed = []
+
+    def prober(filepath):
+        probed.append(filepath)
+        return OrderedDict(
+            [('length', '00:00:10.000'), ('meta.media.nb_streams', 1)]
+        )
+
+    cache_path = tmpdir.join('probes.json').strpath
+    mlt_string = otio.adapters.write_to_string(
+        track,
+        'mlt_xml',
+        prober=prober,
+        probe_cache=cache_path
+    )
+    assert probed == paths
+
+    tree = et.fromstring(mlt_string)
+    for producer_e in tree.findall('producer'):
+        properties = dict(
+            (property_e.attrib['name'], property_e.text)
+            for property_e in producer_e
+        )
+        if properties['resource'] in (paths[0], 'file://' + paths[1]):
+            assert properties['length'] == '00:00:10.000'
+            assert properties['meta.media.nb_streams'] == '1'
+
+        elif properties['resource'] == '/missing.mov':
+            assert 'length' not in properties
+
+    # MLT converts the clock time to frames of the profile
+    timeline = otio.adapters.read_from_string(mlt_string, 'mlt_xml')
+    available_range = timeline.tracks[0][0].media_reference.available_range
+    assert available_range.duration.to_seconds() == 10
+
+    # Unchanged files are not probed again
+    filepath = tmpdir.join('probed.mlt').strpath
+    otio.adapters.write_to_file(
+        track,
+        filepath,
+        'mlt_xml',
+        prober=prober,
+        probe_cache=cache_path
+    )
+    assert probed == paths
+    with open(filepath) as fileobj:
+        assert fileobj.read().count('00:00:10.000') == 3
+
+    tmpdir.join('b.mov').write('more frames')
+    probe_cache = ProbeCache(cache_path)
+    otio.adapters.write_to_string(
+        track,
+        'mlt_xml',
+        prober=prober,
+        probe_cache=probe_cache
+    )
+    assert probed == paths + paths[1:]
+    assert probe_cache.hits == 2
+    assert len(probe_cache) == 2
+
+    assert otio.adapters.write_to_string(track, 'mlt_xml') != mlt_string
+
+    # Media ffprobe can't read is left for melt to probe
+    assert probe_media(tmpdir.join('missing.mov').strpath) is None
+
+
+def test_write_segments(tmpdir):
+    timeline = otio.schema.Timeline(
+        'programme',
+        global_start_time=otio.opentime.RationalTime(0, 25)
+    )
+    for track_index, durations in enumerate(([40] * 10, [70, 130, 200])):
+        track = otio.schema.Track('video{}'.format(track_index))
+        for index, duration in enumerate(durations):
+            track.append(
+                otio.schema.Clip(
+                    name='clip{}_{}'.format(track_index, index),
+                    source_range=otio.opentime.TimeRange(
+                        otio.opentime.RationalTime(100, 25),
+                        otio.opentime.RationalTime(duration, 25)
+                    )
+                )
+            )
+
+        timeline.tracks.append(track)
+
+    # Mixes frames 70 to 105 of the second track
+    timeline.tracks[1].insert(
+        1,
+        otio.schema.Transition(
+            in_offset=otio.opentime.RationalTime(30, 25),
+            out_offset=otio.opentime.RationalTime(5, 25)
+        )
+    )
+    timeline.tracks[1][0].source_range = otio.opentime.TimeRange(
+        otio.opentime.RationalTime(100, 25),
+        otio.opentime.RationalTime(100, 25)
+    )
+    timeline.tracks[1][2].source_range = otio.opentime.TimeRange(
+        otio.opentime.RationalTime(100, 25),
+        otio.opentime.RationalTime(100, 25)
+    )
+
+    out_dir = tmpdir.mkdir('segments')
+    manifest_path = write_segments(timeline, out_dir.strpath, 4)
+    assert manifest_path == out_dir.join('programme.json').strpath
+
+    with open(manifest_path) as fileobj:
+        manifest = json.load(fileobj)
+
+    # Segments end on the cuts closest to every 100 frames, but not on
+    # those at 80 and 100 within the transition
+    assert manifest['rate'] == 25
+    assert [
+        (segment['start'], segment['duration'])
+        for segment in manifest['segments']
+    ] == [(0, 120), (120, 80), (200, 80), (280, 120)]
+
+    full_e = et.fromstring(otio.adapters.write_to_string(timeline, 'mlt_xml'))
+    frames = _playlist_frames(full_e.find('./playlist/[@id="video0"]'))
+    segment_frames = []
+    for index, segment in enumerate(manifest['segments']):
+        assert segment['file'] == 'programme_{:03d}.mlt'.format(index)
+
+        segment_e = et.parse(out_dir.join(segment['file']).strpath).getroot()
+        background_e = segment_e.find('./playlist/[@id="background"]/entry')
+        assert float(background_e.attrib['out']) == segment['duration'] - 1
+
+        # Each segment starts from the same frame a full export shows there
+        segment_frames.extend(
+            _playlist_frames(segment_e.find('./playlist/[@id="video0"]'))
+        )
+        assert len(segment_e.findall('./tractor')) == 1 + (index == 0)
+
+    assert segment_frames == frames
+
+    with pytest.raises(ValueError):
+        split_timeline(timeline.tracks[0], 2)
+
+
+def test_hashed_ids():
+    def create_track(intro):
+        track = otio.schema.Track('video')
+        names = ['shot_a', 'shot_b', 'shot_c']
+        if intro:
+            names.insert(0, 'intro')
+
+        for name in names:
+            track.append(
+                otio.schema.Clip(
+                    name=name,
+                    source_range=otio.opentime.TimeRange(
+                        otio.opentime.RationalTime(10, 30),
+                        otio.opentime.RationalTime(50, 30)
+                    ),
+                    media_reference=otio.schema.ExternalReference(
+                        # All but shot b use the same media
+                        target_url='/media/{}.mov'.format(
+                            'b' if name == 'shot_b' else 'a'
+                        ),
+                        available_range=otio.opentime.TimeRange(
+                            otio.opentime.RationalTime(0, 30),
+                            otio.opentime.RationalTime(100, 30)
+                        )
+                    )
+                )
+            )
+            track.append(
+                otio.schema.Transition(
+                    in_offset=otio.opentime.RationalTime(5, 30),
+                    out_offset=otio.opentime.RationalTime(5, 30)
+                )
+            )
+
+        track.pop()
+
+        return track
+
+    def transitions(mlt_string):
+        return set(
+            et.tostring(tractor_e)
+            for tractor_e in et.fromstring(mlt_string).findall('tractor')
+            if tractor_e.find('transition') is not None
+        )
+
+    before = otio.adapters.write_to_string(create_track(False), 'mlt_xml')
+    after = otio.adapters.write_to_string(create_track(True), 'mlt_xml')
+    assert not transitions(before) & transitions(after)
+
+    # Transitions untouched by the edit stay the same
+    before = otio.adapters.write_to_string(
+        create_track(False),
+        'mlt_xml',
+        hashed_ids=True
+    )
+    after = otio.adapters.write_to_string(
+        create_track(True),
+        'mlt_xml',
+        hashed_ids=True
+    )
+    assert len(transitions(before)) == 2
+    assert transitions(before) < transitions(after)
+
+    tree = et.fromstring(before)
+    producer_ids = [
+        producer_e.attrib['id'] for producer_e in tree.findall('producer')
+    ]
+    assert len(producer_ids) == 3
+    assert producer_ids[1].startswith('producer_')
+    assert len(producer_ids[1]) == len('producer_') + 16
+
+    entries_e = tree.findall('./playlist/[@id="video"]/entry')
+    assert entries_e[0].attrib['producer'] == entries_e[-1].attrib['producer']
+    assert entries_e[0].attrib['producer'] in producer_ids
+
+    # Media used in audio and video tracks gets a single producer
+    timeline = otio.schema.Timeline('shared')
+    for kind, name in (
+            (otio.schema.TrackKind.Audio, 'music'),
+            (otio.schema.TrackKind.Video, 'shot')):
+        track = otio.schema.Track(kind, kind=kind)
+        track.append(
+            otio.schema.Clip(
+                name=name,
+                source_range=otio.opentime.TimeRange(
+                    otio.opentime.RationalTime(0, 30),
+                    otio.opentime.RationalTime(50, 30)
+                ),
+                media_reference=otio.schema.ExternalReference(
+                    target_url='/m/shared.mov'
+                )
+            )
+        )
+        timeline.tracks.append(track)
+
+    mlt_string = otio.adapters.write_to_string(
+        timeline,
+        'mlt_xml',
+        hashed_ids=True
+    )
+    producer_ids = [
+        producer_e.attrib['id']
+        for producer_e in et.fromstring(mlt_string).findall('producer')
+    ]
+    assert len(producer_ids) == len(set(producer_ids)) == 2
+    if PROCESS_POOLS:
+        assert otio.adapters.write_to_string(
+            timeline,
+            'mlt_xml',
+            hashed_ids=True,
+            workers=2
+        ) == mlt_string
+
+
+def test_nested_tractors(tmpdir):
+    def create_clip(name, start, duration):
+        return otio.schema.Clip(
+            name=name,
+            source_range=otio.opentime.TimeRange(
+                otio.opentime.RationalTime(start, 25),
+                otio.opentime.RationalTime(duration, 25)
+            ),
+            media_reference=otio.schema.ExternalReference(
+                target_url='/media/{}.mov'.format(name)
+            )
+        )
+
+    lower_third = otio.schema.Stack(name='lower_third')
+    text = otio.schema.Track('text')
+    text.append(create_clip('title', 0, 50))
+    lower_third.append(text)
+    lower_third.append(create_clip('logo', 10, 40))
+
+    timeline = otio.schema.Timeline('templates')
+    track = otio.schema.Track('video')
+    for index in range(3):
+        track.append(create_clip('shot{}'.format(index), 0, 100))
+        nested = deepcopy(lower_third)
+        nested.source_range = otio.opentime.TimeRange(
+            otio.opentime.RationalTime(index * 5, 25),
+            otio.opentime.RationalTime(20, 25)
+        )
+        track.append(nested)
+
+    timeline.tracks.append(track)
+
+    # By default every use becomes a playlist of its own
+    tree = et.fromstring(otio.adapters.write_to_string(timeline, 'mlt_xml'))
+    assert len(tree.findall('./playlist/[@id="lower_third"]')) == 3
+
+    mlt_string = otio.adapters.write_to_string(
+        timeline,
+        'mlt_xml',
+        nested_tractors=True
+    )
+    tree = et.fromstring(mlt_string)
+    assert tree.find('./playlist/[@id="lower_third"]') is None
+
+    # One tractor with a track per layer of the stack, shared by all uses
+    tractors_e = tree.findall('./tractor')
+    assert len(tractors_e) == 2
+    tractor_id = tractors_e[0].attrib['id']
+    assert tractor_id.startswith('lower_third_')
+    tracks_e = tractors_e[0].findall('./multitrack/track')
+    assert [track_e.attrib['producer'] for track_e in tracks_e] == [
+        tractor_id + '_track0',
+        tractor_id + '_track1'
+    ]
+    layer_e = tree.find('./playlist/[@id="{}_track1"]'.format(tractor_id))
+    assert layer_e.find('entry').attrib['producer'] == 'logo'
+
+    # Layers are declared before the tractor and the tractor before its uses
+    ids = [element.attrib.get('id') for element in tree]
+    assert ids.index(tractor_id + '_track0') < ids.index(tractor_id)
+    assert ids.index(tractor_id) < ids.index('video')
+
+    entries_e = tree.findall(
+        './playlist/[@id="video"]/entry/[@producer="{}"]'.format(tractor_id)
+    )
+    assert [
+        (entry_e.attrib['in'], entry_e.attrib['out'])
+        for entry_e in entries_e
+    ] == [('0.0', '19.0'), ('5.0', '24.0'), ('10.0', '29.0')]
+
+    # Streamed output holds the same elements
+    filepath = tmpdir.join('templates.mlt').strpath
+    otio.adapters.write_to_file(
+        timeline,
+        filepath,
+        'mlt_xml',
+        nested_tractors=True
+    )
+    streamed = et.parse(filepath).getroot()
+    assert sorted(et.tostring(element) for element in streamed) == sorted(
+        et.tostring(element) for element in tree
+    )
+
+    # Uses are read back as trimmed stacks
+    read_track = otio.adapters.read_from_string(
+        mlt_string,
+        'mlt_xml'
+    ).tracks[0]
+    stacks = [
+        item for item in read_track
+        if isinstance(item, otio.schema.Stack)
+    ]
+    assert len(stacks) == 3
+    assert [len(stack) for stack in stacks] == [2, 2, 2]
+    assert stacks[1].source_range.start_time.value == 5
+    assert stacks[1].source_range.duration.value == 20
+
+    # Stacks are named after their tractor, which writing them again keeps
+    assert stacks[0].name == tractor_id
+    mlt_strings = []
+    for _ in range(2):
+        mlt_strings.append(
+            otio.adapters.write_to_string(
+                otio.adapters.read_from_string(mlt_string, 'mlt_xml'),
+                'mlt_xml',
+                nested_tractors=True
+            )
+        )
+        mlt_string = mlt_strings[-1]
+
+    assert mlt_strings[0] == mlt_strings[1]
+
+
+def test_lazy_imports():
+    # Plugin discovery imports the adapter, which should leave modules only
+    # needed for converting alone. OTIO may have loaded some of them itself.
+    deferred = [
+        'concurrent.futures',
+        'fractions',
+        'json',
+        'otio_mlt_adapter.adapters.mlt_batch',
+        'otio_mlt_adapter.adapters.mlt_probe',
+        'otio_mlt_adapter.adapters.mlt_reader',
+        'otio_mlt_adapter.adapters.mlt_segments',
+        'subprocess',
+        'xml.dom.minidom',
+        'xml.etree.ElementTree'
+    ]
+    output = subprocess.check_output(
+        [
+            sys.executable,
+            '-c',
+            'import sys, opentimelineio\n'
+            'before = set(sys.modules)\n'
+            'import otio_mlt_adapter.adapters.mlt_xml as mlt_xml\n'
+            'added = set(sys.modules) - before\n'
+            'print(" ".join(sorted(added.intersection({!r}))))\n'
+            'mlt_xml.write_to_string(opentimelineio.schema.Track())\n'
+            'print("xml.etree.ElementTree" in sys.modules)'.format(deferred)
+        ]
+    ).decode('utf-8').splitlines()
+
+    assert output == ['', 'True']
+
+
+def test_track_filters():
+    timeline = otio.schema.Timeline('graded')
+    track = otio.schema.Track('video')
+    for index in range(3):
+        track.append(
+            otio.schema.Clip(
+                name='clip{}'.format(index),
+                source_range=otio.opentime.TimeRange(
+                    otio.opentime.RationalTime(0, 25),
+                    otio.opentime.RationalTime(50, 25)
+                ),
+                media_reference=otio.schema.ExternalReference(
+                    target_url='/media/clip{}.mov'.format(index)
+                )
+            )
+        )
+
+    plain_track = deepcopy(track)
+    track.effects.append(
+        otio.schema.Effect(
+            effect_name='lut',
+            metadata={
+                'mlt': {
+                    'mlt_service': 'avfilter.lut3d',
+                    'av.file': '/luts/show.cube'
+                }
+            }
+        )
+    )
+    # Time effects can't be applied to whole tracks and effects of other
+    # applications have no MLT service
+    track.effects.append(otio.schema.LinearTimeWarp(time_scalar=2.))
+    track.effects.append(otio.schema.Effect(effect_name='Blur'))
+    timeline.tracks.append(track)
+    timeline.tracks.effects.append(
+        otio.schema.Effect(
+            effect_name='greyscale',
+            metadata={'mlt': {'mlt_service': 'greyscale'}}
+        )
+    )
+
+    # Effects without a service leave the output as it was
+    unknown_track = deepcopy(track)
+    del unknown_track.effects[0]
+    assert otio.adapters.write_to_string(unknown_track, 'mlt_xml') == \
+        otio.adapters.write_to_string(plain_track, 'mlt_xml')
+
+    plain = et.fromstring(
+        otio.adapters.write_to_string(plain_track, 'mlt_xml')
+    )
+
+    tree = et.fromstring(otio.adapters.write_to_string(timeline, 'mlt_xml'))
+
+    # No producer copies, only a tractor wrapping the playlist
+    assert len(tree.findall('producer')) == len(plain.findall('producer'))
+    tracks_e = tree.findall('./tractor/multitrack/track')
+    wrapper_id = tracks_e[-1].attrib['producer']
+    assert wrapper_id == 'video_tractor'
+
+    wrapper_e = tree.find('./tractor/[@id="{}"]'.format(wrapper_id))
+    assert wrapper_e.find('./multitrack/track').attrib['producer'] == 'video'
+    filters_e = wrapper_e.findall('filter')
+    assert len(filters_e) == 1
+    assert [
+        (property_e.attrib['name'], property_e.text)
+        for property_e in filters_e[0]
+    ] == [('mlt_service', 'avfilter.lut3d'), ('av.file', '/luts/show.cube')]
+
+    # The wrapper is declared after the playlist and before the main tractor
+    ids = [element.attrib.get('id') for element in tree]
+    assert ids.index('video') < ids.index(wrapper_id) < ids.index('tractor0')
+
+    main_e = tree.find('./tractor/[@id="tractor0"]')
+    assert main_e.find('./filter/property').text == 'greyscale'
+
+    read_timeline = otio.adapters.read_from_string(
+        otio.adapters.write_to_string(timeline, 'mlt_xml'),
+        'mlt_xml'
+    )
+    assert [
+        effect.effect_name for effect in read_timeline.tracks.effects
+    ] == ['greyscale']
+
+    read_track = read_timeline.tracks[0]
+    assert isinstance(read_track, otio.schema.Track)
+    assert read_track.name == 'video'
+    assert len(read_track) == 3
+    assert [effect.effect_name for effect in read_track.effects] == [
+        'avfilter.lut3d'
+    ]
+    assert read_track.effects[0].metadata['mlt']['av.file'] == \
+        '/luts/show.cube'
+
+    # Filters read back are written again
+    assert otio.adapters.write_to_string(read_timeline, 'mlt_xml').count(
+        '<filter '
+    ) == 2
+
+    # Nested tracks sharing the playlist id of the track holding them get
+    # wrappers of their own, also when tracks are assembled in workers
+    nested_track = deepcopy(track)
+    track.append(nested_track)
+    written = otio.adapters.write_to_string(timeline, 'mlt_xml')
+    tree = et.fromstring(written)
+    wrapper_ids = [
+        element.attrib['id'] for element in tree.findall('tractor')
+    ]
+    assert wrapper_ids[:2] == ['video_tractor1', 'video_tractor']
+    assert len(otio.adapters.read_from_string(written, 'mlt_xml').tracks) == 1
+    if PROCESS_POOLS:
+        assert otio.adapters.write_to_string(
+            timeline, 'mlt_xml', workers=2
+        ) == written